@@ -1,7 +1,9 @@
 from flask import Flask
 import os
+from .utils.logging_config import configure_logging
 
 def create_app():
+    configure_logging()
     app = Flask(
         __name__,
         instance_relative_config=True,
@@ -10,14 +12,56 @@ def create_app():
     )
     from .routes.decks import decks_bp
     from .routes.cards import cards_bp
-    from .models.database import init_db
+    from .models.database import init_db, init_app
     from .routes.study import study_bp
     from .routes.ai import ai_bp
+    from .routes.system import system_bp
+    from .routes.stats import stats_bp
+    from .routes.audio import audio_bp
+    from .routes.export import export_bp
+    from .routes.search import search_bp
+    from .services import ai_integration, audio_store, dictionary, duplicates, eleven_ai_voice, importer, jobs, metrics, search, study_queue
     app.register_blueprint(ai_bp)
     app.register_blueprint(decks_bp)
     app.register_blueprint(cards_bp)
     app.register_blueprint(study_bp)
+    app.register_blueprint(system_bp)
+    app.register_blueprint(stats_bp)
+    app.register_blueprint(audio_bp)
+    app.register_blueprint(export_bp)
+    app.register_blueprint(search_bp)
 
     app.config['DATABASE'] = 'chinese_flashcards.db'
+    # SQLite pool settings (per gunicorn worker)
+    app.config['DB_POOL_SIZE'] = int(os.getenv('DB_POOL_SIZE', 8))
+    app.config['DB_POOL_TIMEOUT'] = float(os.getenv('DB_POOL_TIMEOUT', 10))
+    app.config['DB_BUSY_TIMEOUT_MS'] = int(os.getenv('DB_BUSY_TIMEOUT_MS', 5000))
+    # Seconds a worker may serve cached dashboard aggregates
+    app.config['DASHBOARD_CACHE_TTL'] = float(os.getenv('DASHBOARD_CACHE_TTL', 5))
+    # Background AI/TTS job threads (per gunicorn worker)
+    app.config['JOB_WORKERS'] = int(os.getenv('JOB_WORKERS', 4))
+    # Daily limits for the cross-deck study session
+    app.config['STUDY_NEW_PER_DAY'] = int(os.getenv('STUDY_NEW_PER_DAY', 20))
+    app.config['STUDY_REVIEWS_PER_DAY'] = int(os.getenv('STUDY_REVIEWS_PER_DAY', 200))
+    # Content-addressed audio files; defaults to <instance>/audio
+    app.config['AUDIO_STORE_PATH'] = os.getenv('AUDIO_STORE_PATH')
+    # Enhancement cache shared by all workers; defaults to <instance>/ai_cache.db
+    app.config['AI_CACHE_PATH'] = os.getenv('AI_CACHE_PATH')
+    # Synthesized speech cache; defaults to <instance>/tts_cache.db
+    app.config['TTS_CACHE_PATH'] = os.getenv('TTS_CACHE_PATH')
+    # Compiled CC-CEDICT (flask import-dictionary); defaults to <instance>/cedict.db
+    app.config['DICTIONARY_PATH'] = os.getenv('DICTIONARY_PATH')
+    # Request timing, plus the query hook get_pool() hands to the connection pool
+    metrics.init_app(app)
+    init_app(app)
+    audio_store.init_app(app)
+    ai_integration.init_app(app)
+    eleven_ai_voice.init_app(app)
+    study_queue.init_app(app)
+    importer.init_app(app)
+    search.init_app(app)
+    dictionary.init_app(app)
+    duplicates.init_app(app)
+    jobs.init_app(app)
     
     return app
\ No newline at end of file
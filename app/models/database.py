@@ -1,31 +1,582 @@
+import logging
 import sqlite3
 import os
+import queue
+import threading
+import time
 from pathlib import Path
-from flask import current_app
+from flask import current_app, g
+from app.utils.pinyin import register_sql_functions
+
+logger = logging.getLogger(__name__)
+
+# Defaults for the per-worker connection pool; override through app.config
+DEFAULT_POOL_SIZE = 8
+DEFAULT_POOL_TIMEOUT = 10.0
+DEFAULT_BUSY_TIMEOUT_MS = 5000
+DEFAULT_MMAP_SIZE = 64 * 1024 * 1024
+DEFAULT_CACHE_SIZE_KIB = 16 * 1024
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    """Raised when no pooled connection becomes free within the timeout"""
+
+
+class PooledConnection:
+    """
+    Thin proxy around a sqlite3 connection checked out from a ConnectionPool.
+
+    Everything is delegated to the underlying connection except close(),
+    which hands the connection back to the pool instead of closing it, so
+    existing `finally: conn.close()` blocks keep working unchanged.
+    Statements run through execute*() (here or on a cursor() from here)
+    are timed and reported to the pool's query_observer, if it has one.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        conn = self.__dict__.get('_conn')
+        if conn is None:
+            raise sqlite3.ProgrammingError('Cannot operate on a released connection.')
+        return getattr(conn, name)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._conn.__exit__(exc_type, exc, tb)
+
+    @property
+    def raw(self):
+        return self._conn
+
+    def _live(self):
+        conn = self.__dict__.get('_conn')
+        if conn is None:
+            raise sqlite3.ProgrammingError('Cannot operate on a released connection.')
+        return conn
+
+    def execute(self, *args):
+        return _observed(self._pool.query_observer, self._live().execute, args)
+
+    def executemany(self, *args):
+        return _observed(self._pool.query_observer, self._live().executemany, args)
+
+    def executescript(self, *args):
+        return _observed(self._pool.query_observer, self._live().executescript, args)
+
+    def cursor(self, *args):
+        cursor = self._live().cursor(*args)
+        observer = self._pool.query_observer
+        return cursor if observer is None else ObservedCursor(cursor, observer)
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.release(conn)
+
+
+def _observed(observer, method, args):
+    if observer is None:
+        return method(*args)
+    start = time.perf_counter()
+    try:
+        return method(*args)
+    finally:
+        observer(time.perf_counter() - start)
+
+
+class ObservedCursor:
+    """Cursor proxy reporting the time of each execute*() call to observer"""
+
+    def __init__(self, cursor, observer):
+        self._cursor = cursor
+        self._observer = observer
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, *args):
+        _observed(self._observer, self._cursor.execute, args)
+        return self
+
+    def executemany(self, *args):
+        _observed(self._observer, self._cursor.executemany, args)
+        return self
+
+    def executescript(self, *args):
+        _observed(self._observer, self._cursor.executescript, args)
+        return self
+
+
+class ConnectionPool:
+    """
+    Bounded pool of SQLite connections for a single worker process.
+
+    Connections are created lazily up to `maxsize`; when all of them are in
+    use, acquire() blocks for up to `timeout` seconds. Pragmas are applied
+    once per physical connection rather than once per request.
+    query_observer(seconds) is called after every statement run through a
+    checked-out connection (see app/services/metrics.py).
+    """
+
+    def __init__(self, database, maxsize=DEFAULT_POOL_SIZE, timeout=DEFAULT_POOL_TIMEOUT,
+                 busy_timeout_ms=DEFAULT_BUSY_TIMEOUT_MS, mmap_size=DEFAULT_MMAP_SIZE,
+                 cache_size_kib=DEFAULT_CACHE_SIZE_KIB, query_observer=None):
+        self.database = database
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.busy_timeout_ms = busy_timeout_ms
+        self.mmap_size = mmap_size
+        self.cache_size_kib = cache_size_kib
+        self.query_observer = query_observer
+        self.pid = os.getpid()
+
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._open = 0
+        self._in_use = 0
+        self._closed = False
+
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.database,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout_ms)}')
+        conn.execute(f'PRAGMA mmap_size = {int(self.mmap_size)}')
+        # Negative cache_size is expressed in KiB rather than pages
+        conn.execute(f'PRAGMA cache_size = -{int(self.cache_size_kib)}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        # Used to fill the search index (app/services/search.py)
+        register_sql_functions(conn)
+        return conn
+
+    def acquire(self):
+        """Check out a connection, creating one if the pool is not yet full"""
+        if self._closed:
+            raise sqlite3.ProgrammingError('Connection pool is closed')
+
+        conn = None
+        create = False
+        with self._lock:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                if self._open < self.maxsize:
+                    self._open += 1
+                    create = True
+
+        waited = 0.0
+        if create:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._lock:
+                    self._open -= 1
+                raise
+        elif conn is None:
+            start = time.perf_counter()
+            try:
+                conn = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                with self._lock:
+                    self._timeouts += 1
+                raise PoolTimeout(
+                    f'Timed out after {self.timeout}s waiting for a database connection'
+                )
+            waited = time.perf_counter() - start
+
+        with self._lock:
+            self._checkouts += 1
+            self._in_use += 1
+            if waited:
+                self._waits += 1
+                self._wait_time_total += waited
+                self._wait_time_max = max(self._wait_time_max, waited)
+
+        return PooledConnection(self, conn)
+
+    def release(self, conn):
+        """Return a connection to the pool, discarding it if it is unusable"""
+        with self._lock:
+            self._in_use -= 1
+
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+
+        if self._closed:
+            self._discard(conn)
+            return
+        self._idle.put(conn)
+
+    def _discard(self, conn):
+        with self._lock:
+            self._open -= 1
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def close(self):
+        """Close every idle connection; in-use ones are closed on release"""
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def stats(self):
+        """Snapshot of pool counters, used to size DB_POOL_SIZE"""
+        with self._lock:
+            return {
+                'pid': self.pid,
+                'max_size': self.maxsize,
+                'open': self._open,
+                'in_use': self._in_use,
+                'idle': self._idle.qsize(),
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'timeouts': self._timeouts,
+                'wait_time_total_ms': round(self._wait_time_total * 1000, 3),
+                'wait_time_max_ms': round(self._wait_time_max * 1000, 3),
+                'wait_time_avg_ms': round(self._wait_time_total * 1000 / self._waits, 3) if self._waits else 0.0,
+            }
+
+
+# bm25 weights per cards_fts column: hanzi matches rank first, then pinyin
+# and english, then example sentences and notes
+SEARCH_RANK = 'bm25(10.0, 8.0, 6.0, 6.0, 6.0, 5.0, 1.0, 1.0)'
+SEARCH_INDEX_INSERT = '''INSERT INTO cards_fts (
+                rowid, hanzi, traditional, pinyin, pinyin_plain, pinyin_numbered,
+                english, example_sentence, notes)
+            SELECT {rowid}, search_text({prefix}hanzi), search_text({prefix}traditional), {prefix}pinyin,
+                pinyin_plain({prefix}pinyin), pinyin_numbered({prefix}pinyin), {prefix}english,
+                search_text({prefix}example_sentence), search_text({prefix}notes)'''
+
+# Schema migrations for databases created from an older config/init.schema.
+# Entry N is the list of statements upgrading PRAGMA user_version N-1 to N;
+# init.schema sets the latest version directly so fresh databases skip them.
+MIGRATIONS = [
+    # 1: idempotency keys for batched review submissions
+    [
+        '''CREATE TABLE IF NOT EXISTS review_submissions (
+            review_id VARCHAR(64) PRIMARY KEY,
+            card_id INTEGER NOT NULL,
+            submitted_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )''',
+    ],
+    # 2: append-only review history with covering analytics indexes
+    [
+        '''CREATE TABLE IF NOT EXISTS review_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            card_id INTEGER NOT NULL,
+            deck_id INTEGER NOT NULL,
+            rating INTEGER NOT NULL,
+            prev_interval INTEGER,
+            new_interval INTEGER,
+            ease_factor DECIMAL(3,2),
+            reviewed_at DATETIME NOT NULL,
+            response_time_ms INTEGER,
+            FOREIGN KEY (card_id) REFERENCES cards(id) ON DELETE CASCADE,
+            FOREIGN KEY (deck_id) REFERENCES decks(id)
+        )''',
+        'CREATE INDEX IF NOT EXISTS idx_review_log_deck_time ON review_log(deck_id, reviewed_at, rating, response_time_ms)',
+        'CREATE INDEX IF NOT EXISTS idx_review_log_card_time ON review_log(card_id, reviewed_at, rating)',
+        'CREATE INDEX IF NOT EXISTS idx_review_log_time ON review_log(reviewed_at, deck_id, rating, response_time_ms)',
+    ],
+    # 3: trigger-maintained per-deck counters for the dashboard
+    [
+        '''CREATE TABLE IF NOT EXISTS deck_stats (
+            deck_id INTEGER PRIMARY KEY,
+            card_count INTEGER NOT NULL DEFAULT 0,
+            mastered_count INTEGER NOT NULL DEFAULT 0
+        )''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_deck_stats_card_insert
+        AFTER INSERT ON cards WHEN NEW.is_archived = FALSE
+        BEGIN
+            INSERT INTO deck_stats (deck_id, card_count) VALUES (NEW.deck_id, 1)
+            ON CONFLICT(deck_id) DO UPDATE SET card_count = card_count + 1;
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_deck_stats_card_update
+        AFTER UPDATE OF is_archived, deck_id ON cards
+        BEGIN
+            UPDATE deck_stats
+            SET card_count = card_count - 1,
+                mastered_count = mastered_count - EXISTS (
+                    SELECT 1 FROM card_progress WHERE card_id = OLD.id AND srs_level >= 3)
+            WHERE deck_id = OLD.deck_id AND OLD.is_archived = FALSE;
+            INSERT INTO deck_stats (deck_id, card_count, mastered_count)
+            SELECT NEW.deck_id, 1, EXISTS (
+                SELECT 1 FROM card_progress WHERE card_id = NEW.id AND srs_level >= 3)
+            WHERE NEW.is_archived = FALSE
+            ON CONFLICT(deck_id) DO UPDATE SET
+                card_count = card_count + 1,
+                mastered_count = mastered_count + excluded.mastered_count;
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_deck_stats_card_delete
+        BEFORE DELETE ON cards WHEN OLD.is_archived = FALSE
+        BEGIN
+            UPDATE deck_stats
+            SET card_count = card_count - 1,
+                mastered_count = mastered_count - EXISTS (
+                    SELECT 1 FROM card_progress WHERE card_id = OLD.id AND srs_level >= 3)
+            WHERE deck_id = OLD.deck_id;
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_deck_stats_progress_insert
+        AFTER INSERT ON card_progress WHEN NEW.srs_level >= 3
+        BEGIN
+            UPDATE deck_stats SET mastered_count = mastered_count + 1
+            WHERE deck_id = (SELECT deck_id FROM cards WHERE id = NEW.card_id AND is_archived = FALSE);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_deck_stats_progress_update
+        AFTER UPDATE OF srs_level ON card_progress
+        WHEN (OLD.srs_level >= 3) != (NEW.srs_level >= 3)
+        BEGIN
+            UPDATE deck_stats
+            SET mastered_count = mastered_count + CASE WHEN NEW.srs_level >= 3 THEN 1 ELSE -1 END
+            WHERE deck_id = (SELECT deck_id FROM cards WHERE id = NEW.card_id AND is_archived = FALSE);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_deck_stats_progress_delete
+        AFTER DELETE ON card_progress WHEN OLD.srs_level >= 3
+        BEGIN
+            UPDATE deck_stats SET mastered_count = mastered_count - 1
+            WHERE deck_id = (SELECT deck_id FROM cards WHERE id = OLD.card_id AND is_archived = FALSE);
+        END''',
+        '''INSERT OR REPLACE INTO deck_stats (deck_id, card_count, mastered_count)
+        SELECT c.deck_id, COUNT(*), COUNT(CASE WHEN cp.srs_level >= 3 THEN 1 END)
+        FROM cards c
+        LEFT JOIN card_progress cp ON cp.card_id = c.id
+        WHERE c.is_archived = FALSE
+        GROUP BY c.deck_id''',
+    ],
+    # 4: indexes for deck page stats and keyset pagination
+    [
+        'CREATE INDEX IF NOT EXISTS idx_cards_deck_active ON cards(deck_id, is_archived, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_card_progress_deck_level ON card_progress(deck_id, srs_level, card_id)',
+        'CREATE INDEX IF NOT EXISTS idx_card_progress_deck_review ON card_progress(deck_id, next_review, card_id)',
+    ],
+    # 5: cards reference audio in the content-addressed store
+    # (existing base64_audio is moved by `flask migrate-audio`)
+    [
+        'ALTER TABLE cards ADD COLUMN audio_hash VARCHAR(64)',
+    ],
+    # 6: background jobs (bulk AI enhancement) visible to every worker
+    [
+        '''CREATE TABLE IF NOT EXISTS jobs (
+            id VARCHAR(32) PRIMARY KEY,
+            kind VARCHAR(50) NOT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'queued',
+            progress INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL DEFAULT 0,
+            params TEXT,
+            result TEXT,
+            error TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )''',
+    ],
+    # 7: single-flight dedup of identical in-flight jobs across workers
+    [
+        'ALTER TABLE jobs ADD COLUMN dedup_key VARCHAR(64)',
+        '''CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_inflight ON jobs(dedup_key)
+        WHERE status IN ('queued', 'running')''',
+    ],
+    # 8: study queue buckets served from partial indexes on card_progress,
+    # with is_archived copied over from cards so they need no join
+    [
+        'ALTER TABLE card_progress ADD COLUMN is_archived BOOLEAN DEFAULT FALSE',
+        '''UPDATE card_progress SET is_archived = COALESCE(
+            (SELECT is_archived FROM cards WHERE id = card_progress.card_id), TRUE)''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_card_progress_card_update
+        AFTER UPDATE OF is_archived, deck_id ON cards
+        BEGIN
+            UPDATE card_progress SET is_archived = NEW.is_archived, deck_id = NEW.deck_id
+            WHERE card_id = NEW.id;
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_card_progress_insert_archived
+        AFTER INSERT ON card_progress
+        WHEN (SELECT is_archived FROM cards WHERE id = NEW.card_id)
+        BEGIN
+            UPDATE card_progress SET is_archived = TRUE WHERE id = NEW.id;
+        END''',
+        '''CREATE INDEX IF NOT EXISTS idx_card_progress_queue_due
+        ON card_progress(deck_id, is_archived, next_review) WHERE total_reviews > 0''',
+        '''CREATE INDEX IF NOT EXISTS idx_card_progress_queue_learning
+        ON card_progress(deck_id, is_archived, next_review) WHERE total_reviews > 0 AND srs_level < 3''',
+        '''CREATE INDEX IF NOT EXISTS idx_card_progress_queue_new
+        ON card_progress(deck_id, is_archived, card_id) WHERE total_reviews = 0''',
+    ],
+    # 9: full-text search over cards (app/services/search.py), backfilled
+    # through SQL functions from app/utils/pinyin.py. Inserts and edits are
+    # indexed by the app (search.index_cards) rather than by triggers calling
+    # those functions, so the table stays writable from the sqlite3 CLI and
+    # in exported snapshots; only the plain-SQL delete trigger is kept.
+    [
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS cards_fts USING fts5(
+            hanzi, traditional, pinyin, pinyin_plain, pinyin_numbered,
+            english, example_sentence, notes,
+            tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3'
+        )''',
+        f"INSERT INTO cards_fts (cards_fts, rank) VALUES ('rank', '{SEARCH_RANK}')",
+        '''CREATE TRIGGER IF NOT EXISTS trg_cards_fts_delete
+        AFTER DELETE ON cards
+        BEGIN
+            DELETE FROM cards_fts WHERE rowid = OLD.id;
+        END''',
+        'DELETE FROM cards_fts',
+        SEARCH_INDEX_INSERT.format(prefix='', rowid='id') + ' FROM cards',
+    ],
+    # 10: normalized hanzi + pinyin key for duplicate detection across decks,
+    # backfilled through the card_key() SQL function. The app sets it on
+    # every write (app/services/duplicates.py) rather than a trigger, so
+    # cards stay writable without that function.
+    [
+        'ALTER TABLE cards ADD COLUMN dedup_key VARCHAR(100)',
+        'UPDATE cards SET dedup_key = card_key(hanzi, pinyin)',
+        '''CREATE INDEX IF NOT EXISTS idx_cards_dedup_key
+        ON cards(dedup_key, deck_id) WHERE is_archived = FALSE''',
+    ],
+    # 11: the process whose thread pool holds each job, so jobs left queued
+    # by a worker that exited can be failed instead of waiting forever
+    [
+        'ALTER TABLE jobs ADD COLUMN worker VARCHAR(100)',
+    ],
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def migrate_db(conn):
+    """Bring an existing database up to SCHEMA_VERSION"""
+    has_schema = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'cards'"
+    ).fetchone()
+    if not has_schema:
+        return  # Empty database, init_db() will create it from init.schema
+
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+
+    # Backfills call the app's SQL functions, whatever connection this is
+    register_sql_functions(conn)
+
+    # Serialize concurrent workers; re-read the version once we hold the lock
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {number}')
+            logger.info("Applied database migration", extra={'migration': number})
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+_pool_lock = threading.Lock()
+
+
+def get_pool(app=None):
+    """Return this worker's pool for the app, creating it on first use"""
+    app = app or current_app._get_current_object()
+    pool = app.extensions.get('sqlite_pool')
+    # A pool inherited across fork (e.g. gunicorn --preload) must not be reused
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+
+    with _pool_lock:
+        pool = app.extensions.get('sqlite_pool')
+        if pool is None or pool.pid != os.getpid():
+            pool = ConnectionPool(
+                app.config['DATABASE'],
+                maxsize=app.config.get('DB_POOL_SIZE', DEFAULT_POOL_SIZE),
+                timeout=app.config.get('DB_POOL_TIMEOUT', DEFAULT_POOL_TIMEOUT),
+                busy_timeout_ms=app.config.get('DB_BUSY_TIMEOUT_MS', DEFAULT_BUSY_TIMEOUT_MS),
+                mmap_size=app.config.get('DB_MMAP_SIZE', DEFAULT_MMAP_SIZE),
+                cache_size_kib=app.config.get('DB_CACHE_SIZE_KIB', DEFAULT_CACHE_SIZE_KIB),
+                query_observer=app.extensions.get('db_query_observer'),
+            )
+            conn = pool.acquire()
+            try:
+                migrate_db(conn)
+            finally:
+                conn.close()
+            app.extensions['sqlite_pool'] = pool
+    return pool
+
 
 def get_db_connection():
-    conn = sqlite3.connect(current_app.config['DATABASE'], detect_types=sqlite3.PARSE_DECLTYPES)
-    conn.row_factory = sqlite3.Row
+    """
+    Check out a pooled connection for the current app context.
+
+    Callers may close() it as before; anything still checked out when the
+    app context ends is returned to the pool by close_db().
+    """
+    conn = get_pool().acquire()
+    if 'db_conns' not in g:
+        g.db_conns = []
+    g.db_conns.append(conn)
     return conn
 
+
+def close_db(exception=None):
+    """Teardown hook returning any connections the request did not close"""
+    for conn in g.pop('db_conns', []):
+        conn.close()
+
+
+def pool_stats():
+    return get_pool().stats()
+
+
+def init_app(app):
+    app.teardown_appcontext(close_db)
+
+
 def init_db():
     if os.path.exists(current_app.config['DATABASE']):
-        print("Database already exists, skipping initialization")
+        logger.info("Database already exists, skipping initialization")
         return
-    
+
     schema_path = Path('config/init.schema')
     if schema_path.exists():
         with open(schema_path, 'r') as f:
             schema = f.read()
-        
+
         conn = get_db_connection()
         cursor = conn.cursor()
-        
+
         try:
             cursor.executescript(schema)
             conn.commit()
-            print("Database initialized successfully")
+            logger.info("Database initialized", extra={'database': current_app.config['DATABASE']})
         except sqlite3.Error as e:
-            print(f"Error initializing database: {e}")
+            logger.error("Error initializing database", extra={'error': str(e)})
         finally:
-            conn.close()
\ No newline at end of file
+            conn.close()
@@ -1,8 +1,19 @@
-from flask import Blueprint, request, jsonify
-from app.services.ai_integration import enhance_flashcard
-from app.services.eleven_ai_voice import text_to_speech_
+import json
+import logging
+import time
+from urllib.parse import quote
+from flask import Blueprint, Response, request, jsonify, url_for
+from app.models.database import get_db_connection
+from app.services.ai_integration import AI_USE_STUB, GEMINI_API_KEY, enhance_flashcard, enhance_flashcard_stream
+from app.services.audio_store import AUDIO_MIMETYPE, get_audio_store
+from app.services.bulk_enhance import (
+    DEFAULT_BATCH_SIZE, DEFAULT_CONCURRENCY, ENHANCE_FIELDS, MAX_BATCH_SIZE, MAX_CONCURRENCY,
+)
+from app.services.eleven_ai_voice import resolve_hanzi, stream_speech, text_to_speech_
+from app.services.jobs import get_job, submit_job
 
 ai_bp = Blueprint('ai', __name__)
+logger = logging.getLogger(__name__)
 
 @ai_bp.route('/enhance_flashcard', methods=['POST'])
 def enhance_flashcard_route():
@@ -13,26 +24,201 @@ def enhance_flashcard_route():
         return jsonify({"status": "error", "message": "No data provided"}), 400
     
     result = enhance_flashcard(data)
-    print(f"Enhancement result: {result}")
     
     if result["status"] == "success":
-        print(f"Flashcard enhanced successfully: {result['message']}")  
+        logger.info("Flashcard enhanced", extra={
+            "fields": sorted(result["suggestions"]), "cached": result["cached"],
+        })
         return jsonify(result), 200
     else:
-        print(f"Error enhancing flashcard: {result['message']}")
+        logger.warning("Error enhancing flashcard", extra={"status": result["status"], "error": result["message"]})
         return jsonify(result), 500
-    
+
+
+@ai_bp.route('/enhance_flashcard/stream', methods=['POST'])
+def enhance_flashcard_stream_route():
+    """
+    /enhance_flashcard as server-sent events.
+
+    Sends a `field` event ({"field", "value", "source"}) for each suggestion
+    as soon as the model has finished writing it, then one `result` event
+    carrying the same body /enhance_flashcard would have returned. The
+    response holds a worker thread until the model finishes, which is why
+    gunicorn runs gthread workers (see the Dockerfile).
+    """
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"status": "error", "message": "No data provided"}), 400
+
+    def events():
+        for event, payload in enhance_flashcard_stream(data):
+            if event == 'result' and payload['status'] == 'error':
+                logger.warning("Error enhancing flashcard", extra={"status": "error", "error": payload['message']})
+            yield f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    return Response(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-store',
+        'X-Accel-Buffering': 'no',
+    })
+
+
+@ai_bp.route('/api/decks/<int:deck_id>/enhance', methods=['POST'])
+def enhance_deck_route(deck_id):
+    """Start a bulk enhancement job for a deck; poll /api/jobs/<job_id> for progress"""
+    data = request.get_json(silent=True) or {}
+    fields = data.get('fields') or list(ENHANCE_FIELDS)
+    if not isinstance(fields, list) or not set(fields) <= set(ENHANCE_FIELDS):
+        return jsonify({"status": "error", "message": f"fields must be a subset of {list(ENHANCE_FIELDS)}"}), 400
+    try:
+        batch_size = min(max(int(data.get('batch_size', DEFAULT_BATCH_SIZE)), 1), MAX_BATCH_SIZE)
+        concurrency = min(max(int(data.get('concurrency', DEFAULT_CONCURRENCY)), 1), MAX_CONCURRENCY)
+    except (TypeError, ValueError):
+        return jsonify({"status": "error", "message": "batch_size and concurrency must be integers"}), 400
+    if not GEMINI_API_KEY and not AI_USE_STUB:
+        return jsonify({"status": "error", "message": "GEMINI_API_KEY not found in environment variables"}), 500
+
+    conn = get_db_connection()
+    try:
+        deck = conn.execute('SELECT 1 FROM decks WHERE id = ?', (deck_id,)).fetchone()
+    finally:
+        conn.close()
+    if not deck:
+        return jsonify({"status": "error", "message": "Deck not found"}), 404
+
+    # A second click while the job is still running returns the same job
+    return _job_accepted(*submit_job('enhance_deck', {
+        'deck_id': deck_id, 'fields': fields, 'batch_size': batch_size, 'concurrency': concurrency,
+    }))
+
+
+@ai_bp.route('/api/jobs/enhance_flashcard', methods=['POST'])
+def submit_enhance_flashcard_job():
+    """Queue an /enhance_flashcard request as a background job"""
+    data = request.get_json(silent=True)
+    if not data or not data.get('english'):
+        return jsonify({"status": "error", "message": "The 'english' field is required"}), 400
+    return _job_accepted(*submit_job('enhance_flashcard', {'flashcard': data}))
+
+
+@ai_bp.route('/api/jobs/generate_voice', methods=['POST'])
+def submit_generate_voice_job():
+    """Queue voice generation as a background job; the result holds the audio_hash"""
+    data = request.get_json(silent=True)
+    if not data or not (data.get('text') or data.get('hanzi') or data.get('card_id')):
+        return jsonify({"status": "error", "message": "No text provided"}), 400
+
+    source = _voice_source(data, {})
+    if source is None:
+        return jsonify({"status": "error", "message": "Card not found"}), 404
+    text, hanzi = source
+    return _job_accepted(*submit_job('generate_voice', {'text': text, 'hanzi': hanzi}))
+
+
+def _job_accepted(job_id, created):
+    return jsonify({
+        "status": "queued",
+        "job_id": job_id,
+        "deduplicated": not created,
+        "status_url": url_for('ai.job_status_route', job_id=job_id),
+    }), 202
+
+
+@ai_bp.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status_route(job_id):
+    """Status, progress and (once finished) result of a background job"""
+    conn = get_db_connection()
+    try:
+        job = get_job(conn, job_id)
+    finally:
+        conn.close()
+    if job is None:
+        return jsonify({"status": "error", "message": "Job not found"}), 404
+    return jsonify(job)
+
+
+def _voice_source(data, timings):
+    """(text, hanzi) to voice, filling both from the card when card_id is given"""
+    text = data.get('text', '')
+    hanzi = data.get('hanzi')
+    if not hanzi and data.get('card_id'):
+        start = time.perf_counter()
+        conn = get_db_connection()
+        try:
+            card = conn.execute('SELECT hanzi, english FROM cards WHERE id = ?', (data['card_id'],)).fetchone()
+        finally:
+            conn.close()
+        timings['card_lookup'] = round((time.perf_counter() - start) * 1000, 1)
+        if not card:
+            return None
+        hanzi = card['hanzi']
+        text = text or card['english']
+    return text, hanzi
+
+
 @ai_bp.route('/generate_voice', methods=['POST'])
 def generate_voice_route():
+    """Generate pronunciation audio; pass hanzi (or card_id) to skip translation"""
     data = request.get_json()
     
-    if not data or 'text' not in data:
+    if not data or not (data.get('text') or data.get('hanzi') or data.get('card_id')):
         return jsonify({"status": "error", "message": "No text provided"}), 400
     
-    text = data['text']
+    timings = {}
     try:
-        audio_b64 = text_to_speech_(text)
-        return jsonify({"status": "success", "audio_base64": audio_b64}), 200
+        source = _voice_source(data, timings)
+        if source is None:
+            return jsonify({"status": "error", "message": "Card not found"}), 404
+        
+        start = time.perf_counter()
+        audio_hash = text_to_speech_(*source, timings=timings)
+        timings['total'] = round((time.perf_counter() - start) * 1000, 1)
+        logger.info("Voice generated", extra={"audio_hash": audio_hash, "timings_ms": timings})
+        return jsonify({
+            "status": "success",
+            "audio_hash": audio_hash,
+            "audio_url": url_for('audio.get_audio', audio_hash=audio_hash),
+            "timings_ms": timings,
+        }), 200
     except Exception as e:
-        print(f"Error generating voice: {e}")
-        return jsonify({"status": "error", "message": str(e)}), 500
\ No newline at end of file
+        logger.exception("Error generating voice")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+@ai_bp.route('/generate_voice/stream', methods=['GET'])
+def generate_voice_stream_route():
+    """
+    Relay pronunciation audio to the client as ElevenLabs produces it.
+
+    Takes text, hanzi or card_id as query parameters. The body is chunked
+    audio/mpeg, so playback can start on the first chunk; the finished
+    audio lands in the audio store and TTS cache, and X-Voice-Hanzi tells
+    the client what was spoken so a later /generate_voice call is a cache hit.
+    """
+    data = request.args
+    if not (data.get('text') or data.get('hanzi') or data.get('card_id')):
+        return jsonify({"status": "error", "message": "No text provided"}), 400
+
+    timings = {}
+    try:
+        source = _voice_source(data, timings)
+        if source is None:
+            return jsonify({"status": "error", "message": "Card not found"}), 404
+        hanzi = resolve_hanzi(*source, timings=timings)
+        chunks = stream_speech(hanzi, get_audio_store(), timings)
+        # Pull the first chunk here so synthesis errors still get a JSON response
+        first_chunk = next(chunks)
+    except StopIteration:
+        return jsonify({"status": "error", "message": "No audio returned"}), 500
+    except Exception as e:
+        logger.exception("Error streaming voice")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+    def relay():
+        yield first_chunk
+        yield from chunks
+
+    return Response(relay(), mimetype=AUDIO_MIMETYPE, headers={
+        'Cache-Control': 'no-store',
+        'X-Accel-Buffering': 'no',
+        'X-Voice-Hanzi': quote(hanzi),
+    })
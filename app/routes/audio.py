@@ -0,0 +1,21 @@
+from flask import Blueprint, abort, send_file
+from app.services.audio_store import get_audio_store, AUDIO_MIMETYPE
+
+audio_bp = Blueprint('audio', __name__)
+
+@audio_bp.route('/audio/<audio_hash>')
+def get_audio(audio_hash):
+    """Stream stored audio; supports Range, ETag and is cached forever"""
+    store = get_audio_store()
+    try:
+        path = store.path_for(audio_hash)
+    except ValueError:
+        abort(404)
+    if not path.is_file():
+        abort(404)
+
+    # conditional=True lets Werkzeug answer Range (206) and If-None-Match (304)
+    response = send_file(path, mimetype=AUDIO_MIMETYPE, conditional=True, etag=audio_hash)
+    # Content-addressed: the bytes behind a hash never change
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
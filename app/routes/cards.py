@@ -1,29 +1,77 @@
-from flask import Blueprint, request, jsonify
+import binascii
+import csv
+import json
+import logging
+import os
+import tempfile
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from app.models.database import get_db_connection
+from app.services.audio_store import get_audio_store
+from app.services.dashboard_service import invalidate_dashboard_cache
+from app.services.duplicates import DEFAULT_REPORT_LIMIT, duplicate_report, find_duplicates
+from app.services.exporter import iter_rows
+from app.services.importer import IMPORT_FORMATS, DeckNotFound, detect_format, import_cards, iter_file_rows
+from app.services.search import index_cards
+from app.utils.pinyin import card_key
 
 cards_bp = Blueprint('cards', __name__)
+logger = logging.getLogger(__name__)
+
+# Every card column except the legacy inline base64_audio
+CARD_COLUMNS = '''
+    c.id, c.deck_id, c.hanzi, c.pinyin, c.english, c.traditional, c.measure_word,
+    c.part_of_speech, c.example_sentence, c.notes, c.audio_hash, c.is_archived,
+    c.created_at, c.updated_at
+'''
 
 @cards_bp.route('/deck/<int:deck_id>/add_card', methods=['POST'])
 def add_card(deck_id):
-    """Add a card to a deck"""
+    """Add a card to a deck; cards for the same word in any deck come back as duplicates"""
     data = request.get_json()
     
     if not data or not data.get('hanzi') or not data.get('english'):
         return jsonify({'success': False, 'error': 'Hanzi and English are required'})
     
+    # Audio is kept as raw bytes in the audio store; cards only hold its hash
+    store = get_audio_store()
+    audio_hash = data.get('audio_hash') or None
+    audio_data = None
+    if audio_hash and not store.exists(audio_hash):
+        return jsonify({'success': False, 'error': 'Unknown audio'})
+    if not audio_hash and data.get('base64_audio'):
+        try:
+            audio_data = store.decode_base64(data['base64_audio'])
+        except (binascii.Error, ValueError):
+            return jsonify({'success': False, 'error': 'Invalid audio data'})
+    
     conn = get_db_connection()
     try:
         cursor = conn.cursor()
+        # Hold the write lock from the duplicate check to the insert
+        conn.execute('BEGIN IMMEDIATE')
         
         # Check if deck exists
         deck = conn.execute('SELECT * FROM decks WHERE id = ?', (deck_id,)).fetchone()
         if not deck:
             return jsonify({'success': False, 'error': 'Deck not found'})
         
+        # Same word (normalized hanzi + pinyin) anywhere in the collection
+        duplicates = find_duplicates(conn, data['hanzi'], data.get('pinyin', ''))
+        if any(duplicate['deck_id'] == deck_id for duplicate in duplicates):
+            return jsonify({'success': False, 'error': 'This deck already has a card for that word',
+                            'duplicates': duplicates})
+        if duplicates and data.get('skip_duplicates'):
+            return jsonify({'success': False, 'error': 'This word is already in your collection',
+                            'duplicates': duplicates})
+        
+        # Only a card that is actually being added gets its audio stored
+        if audio_data is not None:
+            audio_hash = store.put(audio_data)
+        
         cursor.execute('''
             INSERT INTO cards (deck_id, hanzi, pinyin, english, traditional, 
-                              measure_word, base64_audio, part_of_speech, example_sentence, notes)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                              measure_word, audio_hash, part_of_speech, example_sentence, notes, dedup_key)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
             deck_id,
             data['hanzi'],
@@ -31,13 +79,15 @@ def add_card(deck_id):
             data['english'],
             data.get('traditional', ''),
             data.get('measure_word', ''),
-            data.get('base64_audio', ''),
+            audio_hash,
             data.get('part_of_speech', ''),
             data.get('example_sentence', ''),
-            data.get('notes', '')
+            data.get('notes', ''),
+            card_key(data['hanzi'], data.get('pinyin', ''))
         ))
         
         card_id = cursor.lastrowid
+        index_cards(conn, [card_id])
         
         # Initialize card progress
         cursor.execute('''
@@ -46,15 +96,67 @@ def add_card(deck_id):
         ''', (card_id, deck_id))
         
         conn.commit()
+        invalidate_dashboard_cache()
         
-        return jsonify({'success': True, 'card_id': card_id})
-    except Exception as e:
+        return jsonify({'success': True, 'card_id': card_id, 'duplicates': duplicates})
+    except Exception:
         conn.rollback()
-        print(f"Database error: {e}")
+        logger.exception("Database error")
         return jsonify({'success': False, 'error': 'Database error'})
     finally:
         conn.close()
 
+@cards_bp.route('/deck/<int:deck_id>/import', methods=['POST'])
+def import_deck_cards(deck_id):
+    """Bulk import cards from an uploaded CSV/TSV file or Anki .apkg"""
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        return jsonify({'success': False, 'error': 'No file uploaded'}), 400
+    fmt = request.form.get('format') or detect_format(upload.filename)
+    if fmt not in IMPORT_FORMATS:
+        return jsonify({'success': False, 'error': f'Unsupported file type; use one of {", ".join(IMPORT_FORMATS)}'}), 400
+
+    path = None
+    conn = get_db_connection()
+    try:
+        if fmt == 'apkg':
+            # An .apkg is a zip holding a SQLite file, so it has to be on disk
+            with tempfile.NamedTemporaryFile(suffix='.apkg', delete=False) as tmp:
+                upload.save(tmp)
+                path = tmp.name
+        result = import_cards(conn, deck_id, iter_file_rows(upload.stream, fmt, path))
+        invalidate_dashboard_cache()
+        return jsonify({'success': True, **result})
+    except DeckNotFound as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        return jsonify({'success': False, 'error': f'Could not read file: {e}'}), 400
+    except Exception:
+        logger.exception("Database error")
+        return jsonify({'success': False, 'error': 'Database error'}), 500
+    finally:
+        conn.close()
+        if path:
+            os.unlink(path)
+
+@cards_bp.route('/api/cards/duplicates')
+def api_card_duplicates():
+    """Words held by more than one active card across all decks (?after=<cursor>, ?limit=)"""
+    try:
+        limit = int(request.args.get('limit', DEFAULT_REPORT_LIMIT))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'limit must be a number'}), 400
+
+    conn = get_db_connection()
+    try:
+        groups, cursor = duplicate_report(conn, request.args.get('after', ''), limit)
+        return jsonify({'success': True, 'duplicates': groups, 'next_cursor': cursor})
+    except Exception:
+        logger.exception("Database error")
+        return jsonify({'success': False, 'error': 'Database error'}), 500
+    finally:
+        conn.close()
+
 @cards_bp.route('/card/<int:card_id>', methods=['DELETE'])
 def delete_card(card_id):
     """Delete a card (soft delete)"""
@@ -70,29 +172,43 @@ def delete_card(card_id):
         # Soft delete the card
         cursor.execute('UPDATE cards SET is_archived = TRUE WHERE id = ?', (card_id,))
         conn.commit()
+        invalidate_dashboard_cache()
         
         return jsonify({'success': True})
-    except Exception as e:
-        print(f"Database error: {e}")
+    except Exception:
+        logger.exception("Database error")
         return jsonify({'success': False, 'error': 'Database error'}), 500
     finally:
         conn.close()
 
 @cards_bp.route('/api/deck/<int:deck_id>/cards')
 def api_deck_cards(deck_id):
-    """API endpoint to get cards for a deck"""
-    conn = get_db_connection()
-    try:
-        cards = conn.execute('''
-            SELECT c.*, cp.srs_level, cp.next_review 
-            FROM cards c 
-            LEFT JOIN card_progress cp ON c.id = cp.card_id 
-            WHERE c.deck_id = ? AND c.is_archived = FALSE
-        ''', (deck_id,)).fetchall()
-        print(cards)
-        return jsonify([dict(card) for card in cards])
-    except Exception as e:
-        print(f"Database error: {e}")
-        return jsonify([])
-    finally:
-        conn.close()
\ No newline at end of file
+    """API endpoint to get cards for a deck, streamed as a JSON array"""
+    def generate():
+        # Checked out inside the stream: the request's teardown has already
+        # run by the time the body is sent
+        conn = get_db_connection()
+        try:
+            rows = iter_rows(conn, f'''
+                SELECT {CARD_COLUMNS}, cp.srs_level, cp.next_review 
+                FROM cards c 
+                LEFT JOIN card_progress cp ON c.id = cp.card_id 
+                WHERE c.deck_id = ? AND c.is_archived = FALSE
+            ''', (deck_id,))
+            try:
+                first = next(rows, None)
+            except Exception:
+                logger.exception("Database error")
+                yield '[]'
+                return
+
+            yield '['
+            if first is not None:
+                yield json.dumps(dict(first), ensure_ascii=False, default=str)
+            for card in rows:
+                yield ',' + json.dumps(dict(card), ensure_ascii=False, default=str)
+            yield ']'
+        finally:
+            conn.close()
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
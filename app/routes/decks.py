@@ -1,58 +1,20 @@
+import logging
 from flask import Blueprint, render_template, request, jsonify, redirect, url_for
 from app.models.database import get_db_connection
-from app.utils.helpers import calculate_mastery_rate, calculate_deck_stats
-from datetime import date
+from app.services.deck_service import get_deck_stats, get_deck_cards_page, CARD_SORTS, DEFAULT_PAGE_SIZE
+from app.services.dashboard_service import get_dashboard_data, invalidate_dashboard_cache
 
 decks_bp = Blueprint('decks', __name__)
+logger = logging.getLogger(__name__)
 
 @decks_bp.route('/')
 def index():
     """Main dashboard page"""
-    conn = get_db_connection()
-    
     try:
-        # Get user streaks
-        streak = conn.execute('SELECT * FROM user_streaks WHERE id = 1').fetchone()
-        if not streak:
-            conn.execute('''
-                INSERT INTO user_streaks (id, current_streak, longest_streak, total_streak_days)
-                VALUES (1, 0, 0, 0)
-            ''')
-            conn.commit()
-            streak = conn.execute('SELECT * FROM user_streaks WHERE id = 1').fetchone()
-        
-        # Get decks
-        decks = conn.execute('''
-            SELECT d.*, COUNT(c.id) as card_count 
-            FROM decks d 
-            LEFT JOIN cards c ON d.id = c.deck_id 
-            WHERE d.is_archived = FALSE
-            GROUP BY d.id
-            ORDER BY d.created_at DESC
-        ''').fetchall()
-        
-        # Get today's study stats
-        today = date.today().isoformat()
-        today_study = conn.execute('''
-            SELECT SUM(cards_studied) as studied_today 
-            FROM study_sessions 
-            WHERE date(session_date) = date(?)
-        ''', (today,)).fetchone()
-        
-        # Calculate total cards and mastery rate
-        total_cards = conn.execute('SELECT COUNT(*) as count FROM cards WHERE is_archived = FALSE').fetchone()['count']
-        mastered_cards = conn.execute('SELECT COUNT(*) as count FROM card_progress WHERE srs_level >= 3').fetchone()['count']
-        mastery_rate = calculate_mastery_rate(mastered_cards, total_cards)
-        
-        return render_template('index.html',
-                             streak=streak,
-                             decks=decks,
-                             total_decks=len(decks),
-                             total_cards=total_cards,
-                             today_studied=today_study['studied_today'] or 0,
-                             mastery_rate=mastery_rate)
-    except Exception as e:
-        print(f"Database error: {e}")
+        data = get_dashboard_data()
+        return render_template('index.html', **data)
+    except Exception:
+        logger.exception("Database error")
         return render_template('index.html',
                              streak={'current_streak': 0, 'longest_streak': 0},
                              decks=[],
@@ -60,12 +22,15 @@ def index():
                              total_cards=0,
                              today_studied=0,
                              mastery_rate=0)
-    finally:
-        conn.close()
 
 @decks_bp.route('/deck/<int:deck_id>')
 def deck_detail(deck_id):
     """Deck detail page"""
+    sort = request.args.get('sort', 'created_at')
+    order = request.args.get('order')
+    cursor = request.args.get('cursor')
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+
     conn = get_db_connection()
     
     try:
@@ -73,26 +38,28 @@ def deck_detail(deck_id):
         if not deck:
             return redirect(url_for('decks.index'))
         
-        cards = conn.execute('''
-            SELECT c.*, cp.srs_level, cp.next_review 
-            FROM cards c 
-            LEFT JOIN card_progress cp ON c.id = cp.card_id 
-            WHERE c.deck_id = ? AND c.is_archived = FALSE
-            ORDER BY c.created_at DESC
-        ''', (deck_id,)).fetchall()
-        
-        cards = [dict(card) for card in cards]
-        print(cards)
-        stats = calculate_deck_stats(cards)
+        try:
+            cards, next_cursor = get_deck_cards_page(conn, deck_id, sort, order, cursor, limit)
+        except ValueError:
+            # Unknown sort or stale cursor: fall back to the first page
+            return redirect(url_for('decks.deck_detail', deck_id=deck_id))
+
+        stats = get_deck_stats(conn, deck_id)
 
         return render_template('deck_detail.html',
                              deck=deck,
                              cards=cards,
                              card_count=stats['card_count'],
                              due_count=stats['due_count'],
-                             mastery_rate=stats['mastery_rate'])
-    except Exception as e:
-        print(f"Database error: {e}")
+                             mastery_rate=stats['mastery_rate'],
+                             sort=sort,
+                             order=order or CARD_SORTS[sort][3],
+                             sorts=list(CARD_SORTS),
+                             is_first_page=not cursor,
+                             next_cursor=next_cursor,
+                             limit=limit)
+    except Exception:
+        logger.exception("Database error")
         return redirect(url_for('decks.index'))
     finally:
         conn.close()
@@ -122,11 +89,12 @@ def create_deck():
         
         deck_id = cursor.lastrowid
         conn.commit()
+        invalidate_dashboard_cache()
         
         return jsonify({'success': True, 'deck_id': deck_id})
-    except Exception as e:
+    except Exception:
         conn.rollback()
-        print(f"Database error: {e}")
+        logger.exception("Database error")
         return jsonify({'success': False, 'error': 'Database error'})
     finally:
         conn.close()
@@ -134,18 +102,8 @@ def create_deck():
 @decks_bp.route('/api/decks')
 def api_decks():
     """API endpoint to get all decks"""
-    conn = get_db_connection()
     try:
-        decks = conn.execute('''
-            SELECT d.*, COUNT(CASE WHEN c.is_archived = FALSE THEN 1 ELSE NULL END) as card_count 
-            FROM decks d 
-            LEFT JOIN cards c ON d.id = c.deck_id 
-            WHERE d.is_archived = FALSE 
-            GROUP BY d.id
-        ''').fetchall()
-        return jsonify([dict(deck) for deck in decks])
-    except Exception as e:
-        print(f"Database error: {e}")
-        return jsonify([])
-    finally:
-        conn.close()
\ No newline at end of file
+        return jsonify(get_dashboard_data()['decks'])
+    except Exception:
+        logger.exception("Database error")
+        return jsonify([])
\ No newline at end of file
@@ -0,0 +1,58 @@
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from app.models.database import get_db_connection
+from app.services.audio_store import get_audio_store
+from app.services.exporter import EXPORT_FORMATS, export_filename, export_stream
+
+export_bp = Blueprint('export', __name__)
+
+
+def _flag(name, default):
+    value = request.args.get(name)
+    return default if value is None else value.lower() in ('1', 'true', 'yes')
+
+
+def _export_response(deck_id=None):
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'success': False, 'error': f'format must be one of {", ".join(EXPORT_FORMATS)}'}), 400
+
+    deck = None
+    if deck_id is not None:
+        conn = get_db_connection()
+        try:
+            deck = conn.execute('SELECT id FROM decks WHERE id = ?', (deck_id,)).fetchone()
+        finally:
+            conn.close()
+        if not deck:
+            return jsonify({'success': False, 'error': 'Deck not found'}), 404
+
+    # A full backup keeps archived cards unless asked not to
+    include_archived = _flag('archived', deck_id is None)
+    include_audio = _flag('audio', True)
+
+    def generate():
+        # Checked out inside the stream: the request's teardown has already
+        # run by the time the body is sent
+        conn = get_db_connection()
+        try:
+            yield from export_stream(conn, get_audio_store(), fmt, deck_id, include_archived, include_audio)
+        finally:
+            conn.close()
+
+    mimetype, _ = EXPORT_FORMATS[fmt]
+    return Response(stream_with_context(generate()), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{export_filename(fmt, deck)}"',
+        'X-Accel-Buffering': 'no',
+    })
+
+
+@export_bp.route('/api/deck/<int:deck_id>/export')
+def export_deck(deck_id):
+    """Stream one deck as ndjson, csv or sqlite (?format=, ?audio=0, ?archived=1)"""
+    return _export_response(deck_id)
+
+
+@export_bp.route('/api/export')
+def export_collection():
+    """Stream a backup of every deck (same options as the deck export)"""
+    return _export_response()
@@ -0,0 +1,53 @@
+import logging
+import sqlite3
+from flask import Blueprint, request, jsonify
+from app.models.database import get_db_connection
+from app.services.search import DEFAULT_SEARCH_LIMIT, search_cards
+
+search_bp = Blueprint('search', __name__)
+logger = logging.getLogger(__name__)
+
+# ?archived= value -> search_cards(archived=)
+ARCHIVED_FILTERS = {'0': False, 'false': False, '1': True, 'true': True, 'all': None}
+
+
+@search_bp.route('/api/search')
+def api_search():
+    """
+    Ranked card search across decks.
+
+    ?q= text (hanzi, pinyin with or without tones, english), ?deck_id=,
+    ?archived=0|1|all, ?srs_level=0,1,2, ?limit=, ?offset=, ?prefix=0 to
+    match the last word exactly.
+    """
+    text = request.args.get('q', '').strip()
+    if not text:
+        return jsonify({'success': False, 'error': 'q is required'}), 400
+
+    archived = request.args.get('archived', '0').lower()
+    if archived not in ARCHIVED_FILTERS:
+        return jsonify({'success': False, 'error': 'archived must be 0, 1 or all'}), 400
+    try:
+        deck_id = request.args.get('deck_id', type=int)
+        srs_levels = [int(value) for value in request.args.get('srs_level', '').split(',') if value]
+        limit = int(request.args.get('limit', DEFAULT_SEARCH_LIMIT))
+        offset = int(request.args.get('offset', 0))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'srs_level, limit and offset must be numbers'}), 400
+    prefix = request.args.get('prefix', '1').lower() not in ('0', 'false', 'no')
+
+    conn = get_db_connection()
+    try:
+        rows, has_more = search_cards(conn, text, deck_id, ARCHIVED_FILTERS[archived], srs_levels,
+                                      limit, offset, prefix)
+        return jsonify({
+            'success': True,
+            'results': [dict(row) for row in rows],
+            'offset': offset,
+            'next_offset': offset + len(rows) if has_more else None,
+        })
+    except sqlite3.OperationalError:
+        logger.exception("Search error")
+        return jsonify({'success': False, 'error': 'Search failed'}), 500
+    finally:
+        conn.close()
@@ -0,0 +1,58 @@
+import logging
+from flask import Blueprint, request, jsonify
+from app.models.database import get_db_connection
+
+stats_bp = Blueprint('stats', __name__)
+logger = logging.getLogger(__name__)
+
+# group_by name -> (SELECT expression, output column)
+REVIEW_GROUPS = {
+    'day': ('date(reviewed_at)', 'day'),
+    'deck': ('deck_id', 'deck_id'),
+    'rating': ('rating', 'rating'),
+}
+
+@stats_bp.route('/api/stats/reviews')
+def api_review_stats():
+    """Review counts aggregated by day, deck and/or rating"""
+    group_by = [g.strip() for g in request.args.get('group_by', 'day,deck,rating').split(',') if g.strip()]
+    unknown = [g for g in group_by if g not in REVIEW_GROUPS]
+    if unknown:
+        return jsonify({'success': False, 'error': f"Unknown group_by: {', '.join(unknown)}"}), 400
+
+    conditions = []
+    params = []
+    if request.args.get('from'):
+        conditions.append('reviewed_at >= date(?)')
+        params.append(request.args['from'])
+    if request.args.get('to'):
+        conditions.append("reviewed_at < date(?, '+1 day')")
+        params.append(request.args['to'])
+    deck_id = request.args.get('deck_id', type=int)
+    if deck_id is not None:
+        conditions.append('deck_id = ?')
+        params.append(deck_id)
+
+    select = [f'{REVIEW_GROUPS[g][0]} AS {REVIEW_GROUPS[g][1]}' for g in group_by]
+    select += [
+        'COUNT(*) AS reviews',
+        'SUM(rating >= 3) AS correct',
+        'ROUND(AVG(rating >= 3) * 100, 1) AS retention_rate',
+        'ROUND(AVG(response_time_ms)) AS avg_response_ms',
+    ]
+    query = f"SELECT {', '.join(select)} FROM review_log"
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    if group_by:
+        columns = ', '.join(REVIEW_GROUPS[g][1] for g in group_by)
+        query += f' GROUP BY {columns} ORDER BY {columns}'
+
+    conn = get_db_connection()
+    try:
+        rows = conn.execute(query, params).fetchall()
+        return jsonify({'success': True, 'group_by': group_by, 'rows': [dict(row) for row in rows]})
+    except Exception:
+        logger.exception("Database error")
+        return jsonify({'success': False, 'error': 'Database error'}), 500
+    finally:
+        conn.close()
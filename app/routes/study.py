@@ -1,8 +1,18 @@
-from flask import Blueprint, render_template, request, jsonify, redirect, url_for
+import logging
+from flask import Blueprint, current_app, render_template, request, jsonify, redirect, url_for
 from app.models.database import get_db_connection
-from app.services.srs_service import rate_card_srs, update_user_streak
+from app.services.dashboard_service import invalidate_dashboard_cache
+from app.services.study_queue import BUCKETS, build_session_queue, get_cards_by_ids, get_study_queue
+from app.services.srs_service import (
+    rate_card_srs, rate_cards_srs_bulk, update_user_streak, MAX_BATCH_REVIEWS
+)
 
 study_bp = Blueprint('study', __name__)
+logger = logging.getLogger(__name__)
+
+# Cards sent with the first response of a session; the rest are fetched by id
+STUDY_PAGE_SIZE = 20
+MAX_PAGE_IDS = 100
 
 @study_bp.route('/deck/<int:deck_id>/study')
 def study_deck(deck_id):
@@ -14,36 +24,102 @@ def study_deck(deck_id):
         if not deck:
             return redirect(url_for('decks.index'))
         
-        # Get due cards for study
-        cards = conn.execute('''
-            SELECT c.*, cp.srs_level, cp.next_review
-            FROM cards c
-            LEFT JOIN card_progress cp ON c.id = cp.card_id
-            WHERE c.deck_id = ? AND c.is_archived = FALSE
-            AND (cp.next_review IS NULL OR cp.next_review <= datetime('now') OR cp.srs_level < 3)
-            ORDER BY cp.srs_level ASC, cp.next_review ASC
-            LIMIT 20
-        ''', (deck_id,)).fetchall()
-        
-        # Convert rows to dictionaries for JSON serialization
-        cards_dict = []
-        for card in cards:
-            card_dict = dict(card)
-            # Ensure all required fields are present
-            for field in ['pinyin', 'example_sentence', 'part_of_speech', 'measure_word', 'notes']:
-                card_dict.setdefault(field, '')
-            cards_dict.append(card_dict)
+        # Due reviews, then learning cards, then new cards (?due=&learning=&new= override the limits)
+        card_ids = [row['card_id'] for row in _deck_queue(conn, deck_id)]
+        cards = get_cards_by_ids(conn, card_ids[:STUDY_PAGE_SIZE])
         
         return render_template('study.html',
                              deck=dict(deck),
-                             cards=cards_dict,
-                             card_count=len(cards_dict))
-    except Exception as e:
-        print(f"Database error: {e}")
+                             cards=cards,
+                             card_count=len(card_ids),
+                             queue=card_ids[STUDY_PAGE_SIZE:])
+    except Exception:
+        logger.exception("Database error")
+        return redirect(url_for('decks.index'))
+    finally:
+        conn.close()
+
+def _deck_queue(conn, deck_id):
+    return get_study_queue(conn, deck_id,
+                           due=request.args.get('due'),
+                           learning=request.args.get('learning'),
+                           new=request.args.get('new'))
+
+def _session_queue(conn):
+    """Cross-deck queue for this request (?new=&reviews= override the daily limits)"""
+    return build_session_queue(
+        conn,
+        new_per_day=request.args.get('new', current_app.config.get('STUDY_NEW_PER_DAY')),
+        reviews_per_day=request.args.get('reviews', current_app.config.get('STUDY_REVIEWS_PER_DAY')),
+    )
+
+@study_bp.route('/study')
+def study_all():
+    """Study session across every deck, interleaving their due cards"""
+    conn = get_db_connection()
+    try:
+        card_ids, info = _session_queue(conn)
+        cards = get_cards_by_ids(conn, card_ids[:STUDY_PAGE_SIZE])
+        return render_template('study.html',
+                             deck=None,
+                             cards=cards,
+                             card_count=len(card_ids),
+                             queue=card_ids[STUDY_PAGE_SIZE:],
+                             session=info)
+    except Exception:
+        logger.exception("Database error")
         return redirect(url_for('decks.index'))
     finally:
         conn.close()
 
+@study_bp.route('/api/study/queue')
+def api_study_queue():
+    """Card ids of a session (one deck with ?deck_id=, else all decks) plus the first page of cards"""
+    try:
+        page_size = max(0, min(int(request.args.get('page_size', STUDY_PAGE_SIZE)), MAX_PAGE_IDS))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'page_size must be a number'}), 400
+
+    conn = get_db_connection()
+    try:
+        deck_id = request.args.get('deck_id', type=int)
+        if deck_id is not None:
+            rows = _deck_queue(conn, deck_id)
+            card_ids = [row['card_id'] for row in rows]
+            info = {'counts': {bucket: sum(row['bucket'] == bucket for row in rows) for bucket in BUCKETS}}
+        else:
+            card_ids, info = _session_queue(conn)
+        return jsonify({
+            'success': True,
+            'queue': card_ids,
+            'cards': get_cards_by_ids(conn, card_ids[:page_size]),
+            **info,
+        })
+    except Exception:
+        logger.exception("Database error")
+        return jsonify({'success': False, 'error': 'Database error'}), 500
+    finally:
+        conn.close()
+
+@study_bp.route('/api/study/cards')
+def api_study_cards():
+    """One page of study cards by id (?ids=1,2,3), in the order given"""
+    try:
+        card_ids = [int(value) for value in request.args.get('ids', '').split(',') if value]
+    except ValueError:
+        return jsonify({'success': False, 'error': 'ids must be comma-separated card ids'}), 400
+    if len(card_ids) > MAX_PAGE_IDS:
+        return jsonify({'success': False, 'error': f'At most {MAX_PAGE_IDS} cards per page'}), 400
+
+    conn = get_db_connection()
+    try:
+        return jsonify({'success': True, 'cards': get_cards_by_ids(conn, card_ids)})
+    except Exception:
+        logger.exception("Database error")
+        return jsonify({'success': False, 'error': 'Database error'}), 500
+    finally:
+        conn.close()
+
 @study_bp.route('/card/<int:card_id>/rate', methods=['POST'])
 def rate_card(card_id):
     """Rate a card after study (SRS algorithm)"""
@@ -60,17 +136,82 @@ def rate_card(card_id):
             return jsonify({'success': False, 'error': 'Card progress not found'})
         
         # Apply SRS algorithm
-        result = rate_card_srs(cursor, progress, rating, card_id)
+        result = rate_card_srs(cursor, progress, rating, card_id, data.get('duration_ms'))
         
         # Update user streak
         update_user_streak(cursor)
         
         conn.commit()
+        invalidate_dashboard_cache()
         
         return jsonify({'success': True, 'next_interval': result['interval']})
-    except Exception as e:
+    except Exception:
         conn.rollback()
-        print(f"Database error: {e}")
+        logger.exception("Database error")
         return jsonify({'success': False, 'error': 'Database error'})
+    finally:
+        conn.close()
+
+@study_bp.route('/study/reviews', methods=['POST'], defaults={'deck_id': None})
+@study_bp.route('/study/<int:deck_id>/reviews', methods=['POST'])
+def submit_reviews(deck_id):
+    """Apply a buffered batch of ratings in one transaction (any deck's cards without deck_id)"""
+    # force=True: navigator.sendBeacon on page unload may not set the JSON content type
+    data = request.get_json(force=True, silent=True) or {}
+    raw_reviews = data.get('reviews')
+
+    if not isinstance(raw_reviews, list) or not raw_reviews:
+        return jsonify({'success': False, 'error': 'No reviews provided'}), 400
+    if len(raw_reviews) > MAX_BATCH_REVIEWS:
+        return jsonify({'success': False, 'error': f'At most {MAX_BATCH_REVIEWS} reviews per batch'}), 400
+
+    reviews = []
+    for item in raw_reviews:
+        try:
+            rating = int(item['rating'])
+            card_id = int(item['card_id'])
+        except (KeyError, TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'Each review needs card_id and rating'}), 400
+        if not 1 <= rating <= 4:
+            return jsonify({'success': False, 'error': 'Rating must be between 1 and 4'}), 400
+        try:
+            duration_ms = max(int(item['duration_ms']), 0) if item.get('duration_ms') is not None else None
+        except (TypeError, ValueError):
+            duration_ms = None
+        reviews.append({
+            'card_id': card_id,
+            'rating': rating,
+            'review_id': str(item['review_id'])[:64] if item.get('review_id') else None,
+            'reviewed_at': item.get('reviewed_at'),
+            'duration_ms': duration_ms,
+        })
+
+    conn = get_db_connection()
+    try:
+        # IMMEDIATE takes the write lock up front so concurrent retries of the
+        # same batch cannot both pass the duplicate check
+        conn.execute('BEGIN IMMEDIATE')
+        cursor = conn.cursor()
+
+        result = rate_cards_srs_bulk(cursor, deck_id, reviews)
+
+        if result['applied']:
+            minutes = max(1, round(result['duration_ms'] / 60000))
+            update_user_streak(cursor, cards_studied=len(result['applied']), minutes_studied=minutes)
+
+        conn.commit()
+        invalidate_dashboard_cache()
+
+        return jsonify({
+            'success': True,
+            'applied': len(result['applied']),
+            'duplicates': result['duplicates'],
+            'rejected': result['rejected'],
+            'intervals': result['intervals'],
+        })
+    except Exception:
+        conn.rollback()
+        logger.exception("Database error")
+        return jsonify({'success': False, 'error': 'Database error'}), 500
     finally:
         conn.close()
\ No newline at end of file
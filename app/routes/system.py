@@ -0,0 +1,60 @@
+from flask import Blueprint, Response, jsonify
+from app.models.database import pool_stats
+from app.services.dashboard_service import dashboard_cache_stats
+from app.services.ai_integration import get_enhancement_cache
+from app.services.dictionary import get_dictionary
+from app.services.eleven_ai_voice import voice_latency_stats, get_tts_cache
+from app.services.jobs import get_job_queue
+from app.services.metrics import CONTENT_TYPE_LATEST, render_metrics
+
+system_bp = Blueprint('system', __name__)
+
+@system_bp.route('/api/db/pool')
+def api_db_pool():
+    """Connection pool metrics for this worker"""
+    return jsonify(pool_stats())
+
+
+@system_bp.route('/api/cache/dashboard')
+def api_dashboard_cache():
+    """Dashboard cache hit/miss counters for this worker"""
+    return jsonify(dashboard_cache_stats())
+
+@system_bp.route('/api/cache/ai')
+def api_ai_cache():
+    """AI enhancement cache hit/miss counters for this worker"""
+    return jsonify(get_enhancement_cache().stats())
+
+
+@system_bp.route('/api/dictionary')
+def api_dictionary():
+    """Local dictionary lookup hit rate and AI calls it saved, for this worker"""
+    dictionary = get_dictionary()
+    if dictionary is None:
+        return jsonify({'loaded': False})
+    return jsonify({'loaded': True, **dictionary.stats()})
+
+
+@system_bp.route('/api/voice/latency')
+def api_voice_latency():
+    """Per-stage voice generation latency for this worker"""
+    return jsonify(voice_latency_stats())
+
+
+@system_bp.route('/api/cache/tts')
+def api_tts_cache():
+    """Synthesized audio cache hit/miss counters for this worker"""
+    return jsonify(get_tts_cache().stats())
+
+
+
+@system_bp.route('/api/queue')
+def api_job_queue():
+    """Background job pool size and counters for this worker"""
+    return jsonify(get_job_queue().stats())
+
+
+@system_bp.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint, summed over every gunicorn worker"""
+    return Response(render_metrics(), content_type=CONTENT_TYPE_LATEST)
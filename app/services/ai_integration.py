@@ -1,14 +1,28 @@
 from google import genai
+import asyncio
 import dotenv
+import hashlib
 import json
-import re
-import time
-from typing import Dict, Any, Optional
+import logging
+import os
+import random
+import threading
+import unicodedata
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Tuple
+from app.services.ai_stub import StubGenAIClient
+from app.services.async_runner import iter_sync, run_sync
+from app.services.cache import PersistentCache
+from app.services.dictionary import fill_from_dictionary, get_dictionary
+from app.services.jobs import register_job
+from app.services.metrics import count_retry, track_external
+from app.utils.json_extract import extract_json, parse_partial_json
 
 # Load environment variables
 dotenv.load_dotenv()
 GEMINI_API_KEY = dotenv.get_key(dotenv.find_dotenv(), "GEMINI_API_KEY")
 
+logger = logging.getLogger(__name__)
+
 PRE_PROMPT = """
 You are an assistant that helps create flashcards by suggesting content for empty fields.
 You will receive input in JSON format representing a flashcard, with some fields possibly empty.
@@ -53,93 +67,215 @@ EXAMPLE OUTPUT:
 }
 """
 
-def clean_json_response(text: str) -> str:
+# Bulk variant: the rules are sent once for a whole JSON array of cards
+BATCH_PRE_PROMPT = """
+You help complete Chinese flashcards. INPUT is a JSON array of flashcards; each has an "id" and some empty fields.
+Return ONLY a JSON array with one object per input flashcard, containing its "id" and suggestions for its empty fields.
+Never change filled fields. No text outside the JSON.
+
+Fields: hanzi (simplified), pinyin (with tone marks), traditional, part_of_speech (one of noun, verb, adjective,
+adverb, pronoun, preposition, conjunction, interjection), measure_word (common measure word, or "" if none),
+example_sentence (a common, natural sentence in the form "汉字 (pinyin) - English"), notes (usage or etymology,
+e.g. "nǐ (you) + hǎo (good)").
+
+EXAMPLE INPUT:
+[{"id": 1, "english": "Hello", "hanzi": "", "pinyin": ""}]
+EXAMPLE OUTPUT:
+[{"id": 1, "hanzi": "你好", "pinyin": "nǐ hǎo"}]
+"""
+
+# Bumped automatically whenever either prompt changes, invalidating cached
+# answers; single-card and batch results share the enhancement cache
+PROMPT_VERSION = hashlib.sha256((PRE_PROMPT + BATCH_PRE_PROMPT).encode("utf-8")).hexdigest()[:12]
+
+# Set AI_USE_STUB=1 to answer from StubGenAIClient without network access
+AI_USE_STUB = os.getenv("AI_USE_STUB", "").lower() in ("1", "true", "yes")
+
+# Seconds before a single Gemini call is abandoned and retried
+AI_TIMEOUT = float(os.getenv("AI_TIMEOUT", 30))
+# Append raw model replies to this JSONL file (corpus for benchmarks/json_extract_bench.py)
+AI_RECORD_RESPONSES = os.getenv("AI_RECORD_RESPONSES")
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+
+_enhancement_cache = None
+# Set by init_app(): AI_CACHE_PATH, or ai_cache.db in the instance folder
+_enhancement_cache_path = None
+_clients = {}
+_clients_lock = threading.Lock()
+_record_lock = threading.Lock()
+
+
+def get_genai_client(api_key: Optional[str] = None):
     """
-    Clean and extract JSON from AI response text.
-    Handles various formats the AI might return.
+    Long-lived Gemini client for this process (one per API key), or the
+    offline stub when AI_USE_STUB is set. Reusing it keeps its HTTP
+    connection pools warm across calls.
     """
-    # Remove markdown code blocks
-    cleaned = re.sub(r'```json\n?', '', text)
-    cleaned = re.sub(r'```\n?', '', cleaned)
-    cleaned = cleaned.strip()
-    
-    # Try to find JSON object pattern
-    json_match = re.search(r'\{[^{}]*\{.*\}[^{}]*\}|\{.*\}', cleaned, re.DOTALL)
-    if json_match:
-        cleaned = json_match.group()
-    
-    # Remove any non-JSON text before and after
-    lines = cleaned.split('\n')
-    json_lines = []
-    in_json = False
-    
-    for line in lines:
-        line = line.strip()
-        if line.startswith('{') or in_json:
-            in_json = True
-            json_lines.append(line)
-        if line.endswith('}'):
-            break
-    
-    if json_lines:
-        cleaned = '\n'.join(json_lines)
-    
-    return cleaned
+    key = (os.getpid(), api_key or GEMINI_API_KEY, AI_USE_STUB)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = StubGenAIClient() if AI_USE_STUB else genai.Client(api_key=key[1])
+                _clients[key] = client
+    return client
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with jitter so concurrent retries don't line up"""
+    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
 
-def parse_json_safely(text: str, max_attempts: int = 3) -> Optional[Dict[str, Any]]:
+def is_rate_limited(error: Exception) -> bool:
+    return getattr(error, "code", None) == 429 or "RESOURCE_EXHAUSTED" in str(error)
+
+
+async def generate_content_async(client, model: str, contents: str, timeout: float = AI_TIMEOUT,
+                                 operation: str = "enhance"):
+    """One async Gemini call, cancelled after `timeout` seconds"""
+    with track_external("gemini", operation):
+        response = await asyncio.wait_for(
+            client.aio.models.generate_content(model=model, contents=contents), timeout
+        )
+    if AI_RECORD_RESPONSES:
+        _record_response(model, response.text)
+    return response
+
+
+async def generate_content_stream_async(client, model: str, contents: str,
+                                        timeout: float = AI_TIMEOUT,
+                                        operation: str = "enhance_stream") -> AsyncIterator[str]:
     """
-    Safely parse JSON with multiple attempts and error recovery.
+    Text of one streamed Gemini call, chunk by chunk. `timeout` bounds the
+    wait for the stream and then for each chunk, not the whole reply.
+    Needs google-genai >= 1.0, where the async generate_content_stream is a
+    coroutine returning the iterator (0.x returned the iterator directly).
     """
-    for attempt in range(max_attempts):
-        try:
-            return json.loads(text)
-        except json.JSONDecodeError as e:
-            if attempt < max_attempts - 1:
-                # Try to fix common JSON issues
-                # Remove trailing commas
-                text = re.sub(r',\s*}', '}', text)
-                text = re.sub(r',\s*]', ']', text)
-                # Fix missing quotes
-                text = re.sub(r'(\w+):', r'"\1":', text)
-            else:
-                raise e
-    return None
+    parts = []
+    with track_external("gemini", operation):
+        stream = await asyncio.wait_for(
+            client.aio.models.generate_content_stream(model=model, contents=contents), timeout
+        )
+        chunks = stream.__aiter__()
+        while True:
+            try:
+                chunk = await asyncio.wait_for(chunks.__anext__(), timeout)
+            except StopAsyncIteration:
+                break
+            if chunk.text:
+                parts.append(chunk.text)
+                yield chunk.text
+    if AI_RECORD_RESPONSES:
+        _record_response(model, "".join(parts))
+
+
+def _record_response(model: str, text: Optional[str]) -> None:
+    with _record_lock, open(AI_RECORD_RESPONSES, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"model": model, "text": text}, ensure_ascii=False) + "\n")
+
+
+def get_enhancement_cache() -> PersistentCache:
+    """
+    Process-wide cache of enhancement results.
+
+    Backed by AI_CACHE_PATH (default <instance>/ai_cache.db) so all workers
+    share it; entries expire after AI_CACHE_TTL seconds (default 30 days).
+    """
+    global _enhancement_cache
+    if _enhancement_cache is None:
+        if _enhancement_cache_path is None:
+            raise RuntimeError("ai_integration.init_app() has not been called")
+        _enhancement_cache = PersistentCache(
+            _enhancement_cache_path,
+            table="ai_enhancements",
+            ttl=float(os.getenv("AI_CACHE_TTL", 30 * 24 * 3600)),
+            max_entries=int(os.getenv("AI_CACHE_MAX_ENTRIES", 50000)),
+            memory_entries=int(os.getenv("AI_CACHE_MEMORY_ENTRIES", 1024)),
+        )
+    return _enhancement_cache
+
+
+def _normalize_text(value: Any) -> str:
+    return " ".join(unicodedata.normalize("NFKC", str(value)).casefold().split())
+
+
+def enhancement_cache_key(flashcard_data: Dict[str, Any], original_fields, model: str) -> str:
+    """
+    Cache key for an enhancement request.
+
+    Built from the normalized english term, the set of fields asked for,
+    the model and PROMPT_VERSION. Other filled fields (e.g. a given hanzi)
+    are part of the key too, since they steer the model's answer.
+    """
+    requested = sorted(f for f in original_fields if not flashcard_data.get(f))
+    context = sorted(
+        (f, _normalize_text(flashcard_data[f]))
+        for f in original_fields
+        if f != "english" and flashcard_data.get(f)
+    )
+    payload = json.dumps(
+        [_normalize_text(flashcard_data["english"]), requested, context, model, PROMPT_VERSION],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def build_batch_prompt(flashcards) -> str:
+    """Prompt for a list of flashcard dicts, each carrying an "id" """
+    return BATCH_PRE_PROMPT + "\nINPUT:\n" + json.dumps(flashcards, ensure_ascii=False, separators=(",", ":"))
+
 
 def enhance_flashcard(flashcard_data: Dict[str, Any], 
                      api_key: str = None, 
                      model: str = "gemini-2.5-flash",
-                     max_retries: int = 2) -> Dict[str, Any]:
+                     max_retries: int = 2,
+                     client=None,
+                     use_cache: bool = True,
+                     timeout: float = AI_TIMEOUT) -> Dict[str, Any]:
     """
-    Enhance a flashcard by generating suggestions for empty fields using Gemini AI.
-    
-    Args:
-        flashcard_data: Dictionary with flashcard fields. Only "english" is required.
-        api_key: Gemini API key (uses environment variable if not provided)
-        model: Gemini model to use
-        max_retries: Number of retry attempts for API calls
-    
-    Returns:
-        Dictionary with:
-        - status: "success", "no_suggestions", or "error"
-        - suggestions: dict with only the suggested fields (only for fields originally sent)
-        - enhanced_data: flashcard with original fields + suggestions (only fields originally sent)
-        - message: optional error or info message
-    
-    Example:
-        >>> flashcard = {"english": "Hey", "hanzi": ""}
-        >>> result = enhance_flashcard(flashcard)
-        >>> print(result["suggestions"])  # Only contains "hanzi" suggestion
+    Synchronous facade over enhance_flashcard_async for Flask routes and
+    job threads; the call runs on the shared AI event loop.
     """
-    
-    # Use provided API key or environment variable
-    if api_key is None:
-        api_key = GEMINI_API_KEY
-    
-    if not api_key:
+    return run_sync(enhance_flashcard_async(
+        flashcard_data, api_key=api_key, model=model, max_retries=max_retries,
+        client=client, use_cache=use_cache, timeout=timeout,
+    ))
+
+
+def enhance_flashcard_stream(flashcard_data: Dict[str, Any],
+                             api_key: str = None,
+                             model: str = "gemini-2.5-flash",
+                             max_retries: int = 2,
+                             client=None,
+                             use_cache: bool = True,
+                             timeout: float = AI_TIMEOUT) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Synchronous facade over enhance_flashcard_stream_async for streamed
+    Flask responses; each event is yielded as soon as the loop produces it.
+    """
+    return iter_sync(enhance_flashcard_stream_async(
+        flashcard_data, api_key=api_key, model=model, max_retries=max_retries,
+        client=client, use_cache=use_cache, timeout=timeout,
+    ))
+
+
+def _start_enhancement(flashcard_data: Dict[str, Any], api_key: Optional[str], client,
+                       model: str, use_cache: bool):
+    """
+    Validation, dictionary lookup and cache check shared by the plain and
+    streaming enhancers.
+
+    Returns (result, original_fields, from_dictionary, cache_key); result
+    is the final answer when the model does not need to be called, else None.
+    """
+    if client is None and not api_key and not AI_USE_STUB:
         return {
             "status": "error",
             "message": "API key not provided and GEMINI_API_KEY not found in environment variables"
-        }
+        }, [], {}, None
     
     # Define all possible fields (only english is required)
     all_fields = ["hanzi", "pinyin", "english", "traditional", 
@@ -150,14 +286,14 @@ def enhance_flashcard(flashcard_data: Dict[str, Any],
         return {
             "status": "error", 
             "message": "Input must be a dictionary"
-        }
+        }, [], {}, None
     
     # Check if english field is provided (only required field)
     if "english" not in flashcard_data or not flashcard_data["english"]:
         return {
             "status": "error",
             "message": "The 'english' field is required"
-        }
+        }, [], {}, None
     
     # Track which fields were originally sent by the user
     original_fields = list(flashcard_data.keys())
@@ -176,69 +312,145 @@ def enhance_flashcard(flashcard_data: Dict[str, Any],
             "message": "All provided fields are already filled",
             "suggestions": {},
             "enhanced_data": {field: flashcard_data[field] for field in original_fields}
-        }
+        }, original_fields, {}, None
+    
+    # Dictionary fields (pinyin, traditional, ...) are looked up locally when
+    # the hanzi is known; the model is only asked for what is still empty
+    from_dictionary = fill_from_dictionary(flashcard_data, original_fields)
+    flashcard_data.update(from_dictionary)
+
+    if from_dictionary and all(flashcard_data.get(field) for field in original_fields):
+        get_dictionary().count("ai_calls_skipped")
+        return _success_result(flashcard_data, original_fields, from_dictionary, {}), \
+            original_fields, from_dictionary, None
+    
+    # Identical requests are answered from the cache without a network call
+    cache_key = enhancement_cache_key(flashcard_data, original_fields, model) if use_cache else None
+    if cache_key:
+        cached = get_enhancement_cache().get(cache_key)
+        if cached is not None:
+            return _success_result(flashcard_data, original_fields, from_dictionary, dict(cached), cached=True), \
+                original_fields, from_dictionary, cache_key
+    return None, original_fields, from_dictionary, cache_key
+
+
+def _success_result(flashcard_data, original_fields, from_dictionary, suggestions, cached=False) -> Dict[str, Any]:
+    suggestions = {**from_dictionary, **suggestions}
+    # enhanced_data holds ONLY the originally sent fields
+    enhanced_data = {field: flashcard_data[field] for field in original_fields}
+    enhanced_data.update(suggestions)
+    return {
+        "status": "success",
+        "suggestions": suggestions,
+        "enhanced_data": enhanced_data,
+        "message": f"Generated suggestions for {len(suggestions)} fields",
+        "cached": cached,
+        "dictionary_fields": sorted(from_dictionary),
+    }
+
+
+def _no_suggestions_result(flashcard_data, original_fields, from_dictionary) -> Dict[str, Any]:
+    """Answer for a "No suggestions" reply from the model"""
+    if from_dictionary:
+        return _success_result(flashcard_data, original_fields, from_dictionary, {})
+    return {
+        "status": "no_suggestions",
+        "message": "No suggestions provided by AI",
+        "suggestions": {},
+        "enhanced_data": {field: flashcard_data[field] for field in original_fields}
+    }
+
+
+def _is_no_suggestions(text: str) -> bool:
+    return text.strip().lower() in ["no suggestions", '"no suggestions"']
+
+
+def _suggestion_allowed(field: str, value: Any, flashcard_data, original_fields) -> bool:
+    """Only non-empty suggestions for originally empty fields THAT WERE ORIGINALLY SENT"""
+    return field in original_fields and not flashcard_data.get(field) and bool(value)
+
+
+async def enhance_flashcard_async(flashcard_data: Dict[str, Any],
+                                  api_key: str = None,
+                                  model: str = "gemini-2.5-flash",
+                                  max_retries: int = 2,
+                                  client=None,
+                                  use_cache: bool = True,
+                                  timeout: float = AI_TIMEOUT) -> Dict[str, Any]:
+    """
+    Enhance a flashcard by generating suggestions for empty fields using Gemini AI.
+    
+    Args:
+        flashcard_data: Dictionary with flashcard fields. Only "english" is required.
+        api_key: Gemini API key (uses environment variable if not provided)
+        model: Gemini model to use
+        max_retries: Number of retry attempts for API calls
+        client: genai-compatible client to use (e.g. StubGenAIClient)
+        use_cache: Serve and store results through get_enhancement_cache()
+        timeout: Seconds allowed per API call before it is retried
+    
+    Returns:
+        Dictionary with:
+        - status: "success", "no_suggestions", or "error"
+        - suggestions: dict with only the suggested fields (only for fields originally sent)
+        - enhanced_data: flashcard with original fields + suggestions (only fields originally sent)
+        - message: optional error or info message
+        - cached: True when the suggestions came from the cache
+        - dictionary_fields: suggested fields that came from the local dictionary
+    
+    Example:
+        >>> flashcard = {"english": "Hey", "hanzi": ""}
+        >>> result = enhance_flashcard(flashcard)
+        >>> print(result["suggestions"])  # Only contains "hanzi" suggestion
+    """
+    
+    # Use provided API key or environment variable
+    if api_key is None:
+        api_key = GEMINI_API_KEY
+    
+    result, original_fields, from_dictionary, cache_key = _start_enhancement(
+        flashcard_data, api_key, client, model, use_cache
+    )
+    if result is not None:
+        return result
+    
+    if client is None:
+        client = get_genai_client(api_key)
     
     # Retry logic for API calls
     for retry in range(max_retries + 1):
         try:
-            # Initialize client and make API call
-            client = genai.Client(api_key=api_key)
-            
             input_text = json.dumps(flashcard_data, ensure_ascii=False, indent=2)
             
-            response = client.models.generate_content(
-                model=model,
-                contents=PRE_PROMPT + "\nINPUT:\n" + input_text
+            response = await generate_content_async(
+                client, model, PRE_PROMPT + "\nINPUT:\n" + input_text, timeout
             )
             
             # Clean and parse the response
             cleaned_text = response.text.strip()
             
             # Handle "No suggestions" response
-            if cleaned_text.lower() in ["no suggestions", '"no suggestions"']:
-                return {
-                    "status": "no_suggestions",
-                    "message": "No suggestions provided by AI",
-                    "suggestions": {},
-                    "enhanced_data": {field: flashcard_data[field] for field in original_fields}
-                }
-            
-            # Clean the JSON response
-            cleaned_text = clean_json_response(cleaned_text)
-            
-            # Parse JSON safely with error recovery
-            suggestions = parse_json_safely(cleaned_text)
+            if _is_no_suggestions(cleaned_text):
+                return _no_suggestions_result(flashcard_data, original_fields, from_dictionary)
             
-            if suggestions is None:
-                raise json.JSONDecodeError("Failed to parse JSON after cleaning", cleaned_text, 0)
+            # First JSON object in the reply, skipping code fences and chatter
+            suggestions = extract_json(cleaned_text, dict)
             
-            # Validate that suggestions is a dictionary
-            if not isinstance(suggestions, dict):
-                raise ValueError(f"Expected dictionary but got {type(suggestions)}")
-            
-            # Filter to only include suggestions for originally empty fields THAT WERE ORIGINALLY SENT
-            filtered_suggestions = {}
-            for field in original_fields:
-                if field in suggestions and (not flashcard_data.get(field)):
-                    # Ensure the suggestion is not empty
-                    if suggestions[field]:
-                        filtered_suggestions[field] = suggestions[field]
+            filtered_suggestions = {
+                field: value for field, value in suggestions.items()
+                if _suggestion_allowed(field, value, flashcard_data, original_fields)
+            }
             
-            # Create enhanced flashcard data - ONLY with originally sent fields
-            enhanced_data = {field: flashcard_data[field] for field in original_fields}
-            enhanced_data.update(filtered_suggestions)
+            if cache_key and filtered_suggestions:
+                get_enhancement_cache().set(cache_key, filtered_suggestions)
             
-            return {
-                "status": "success",
-                "suggestions": filtered_suggestions,
-                "enhanced_data": enhanced_data,
-                "message": f"Generated suggestions for {len(filtered_suggestions)} fields"
-            }
+            return _success_result(flashcard_data, original_fields, from_dictionary, filtered_suggestions)
             
         except json.JSONDecodeError as e:
             if retry < max_retries:
-                print(f"JSON parse error, retrying... (attempt {retry + 1}/{max_retries})")
-                time.sleep(1)  # Brief delay before retry
+                logger.warning("JSON parse error, retrying", extra={"attempt": retry + 1, "max_retries": max_retries})
+                count_retry("gemini", "enhance")
+                await asyncio.sleep(backoff_delay(retry))
                 continue
             else:
                 return {
@@ -247,43 +459,132 @@ def enhance_flashcard(flashcard_data: Dict[str, Any],
                     "raw_response": response.text if 'response' in locals() else None
                 }
         except Exception as e:
+            error = f"timed out after {timeout}s" if isinstance(e, asyncio.TimeoutError) else e
             if retry < max_retries:
-                print(f"API error, retrying... (attempt {retry + 1}/{max_retries}) Error: {e}")
-                time.sleep(1)  # Brief delay before retry
+                logger.warning("API error, retrying", extra={
+                    "attempt": retry + 1, "max_retries": max_retries, "error": str(error),
+                })
+                count_retry("gemini", "enhance")
+                await asyncio.sleep(backoff_delay(retry))
                 continue
             else:
                 return {
                     "status": "error",
-                    "message": f"Error calling AI API after {max_retries + 1} attempts: {e}"
+                    "message": f"Error calling AI API after {max_retries + 1} attempts: {error}"
                 }
 
-# Example usage with better testing
-if __name__ == "__main__":
-    test_cases = [
-        {"english": "Hey", "hanzi": ""},
-        {"english": "Hello", "pinyin": "", "hanzi": ""},
-        {"english": "Thank you", "notes": ""},
-        {"english": "Water"} 
-    ]
-    
-    for i, test_case in enumerate(test_cases):
-        print(f"\n🧪 Test Case {i + 1}: {test_case}")
-        print("=" * 50)
-        
-        result = enhance_flashcard(test_case)
-        
-        if result["status"] == "success":
-            print("✅ Success! Generated suggestions:")
-            for field, suggestion in result["suggestions"].items():
-                print(f"   {field}: {suggestion}")
-                
-            print("\n🎯 Enhanced flashcard:")
-            for field, value in result["enhanced_data"].items():
-                print(f"   {field}: {value}")
-                
-        elif result["status"] == "no_suggestions":
-            print("ℹ️", result["message"])
-        else:
-            print("❌ Error:", result["message"])
-            if "raw_response" in result and result["raw_response"]:
-                print("Raw AI response:", result["raw_response"][:200] + "...")
\ No newline at end of file
+
+async def enhance_flashcard_stream_async(flashcard_data: Dict[str, Any],
+                                         api_key: str = None,
+                                         model: str = "gemini-2.5-flash",
+                                         max_retries: int = 2,
+                                         client=None,
+                                         use_cache: bool = True,
+                                         timeout: float = AI_TIMEOUT) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    enhance_flashcard_async with the model's reply streamed: yields
+    ("field", {"field", "value", "source"}) for each suggestion as soon as
+    it is complete, then ("result", ...) with exactly what
+    enhance_flashcard_async would return.
+
+    source is "dictionary", "cache" or "ai". A field counts as complete
+    once parse_partial_json sees the key after it (or the closing brace),
+    so a half-received string is never sent. Fields already sent are kept
+    if a retry is needed.
+    """
+    if api_key is None:
+        api_key = GEMINI_API_KEY
+
+    result, original_fields, from_dictionary, cache_key = _start_enhancement(
+        flashcard_data, api_key, client, model, use_cache
+    )
+    if result is not None:
+        for field, value in result.get("suggestions", {}).items():
+            source = "dictionary" if field in from_dictionary else "cache"
+            yield "field", {"field": field, "value": value, "source": source}
+        yield "result", result
+        return
+
+    for field, value in from_dictionary.items():
+        yield "field", {"field": field, "value": value, "source": "dictionary"}
+
+    if client is None:
+        client = get_genai_client(api_key)
+
+    prompt = PRE_PROMPT + "\nINPUT:\n" + json.dumps(flashcard_data, ensure_ascii=False, indent=2)
+    streamed = {}
+    for retry in range(max_retries + 1):
+        text = ""
+        try:
+            async for chunk in generate_content_stream_async(client, model, prompt, timeout):
+                text += chunk
+                partial, complete = parse_partial_json(text, dict)
+                if not partial:
+                    continue
+                # The last key may still be growing until the object closes
+                finished = list(partial) if complete else list(partial)[:-1]
+                for field in finished:
+                    value = partial[field]
+                    if field not in streamed and _suggestion_allowed(field, value, flashcard_data, original_fields):
+                        streamed[field] = value
+                        yield "field", {"field": field, "value": value, "source": "ai"}
+
+            if _is_no_suggestions(text):
+                yield "result", _no_suggestions_result(flashcard_data, original_fields, from_dictionary)
+                return
+
+            suggestions = extract_json(text, dict)
+            filtered_suggestions = {
+                field: value for field, value in suggestions.items()
+                if _suggestion_allowed(field, value, flashcard_data, original_fields)
+            }
+            filtered_suggestions.update(streamed)
+            # Anything the incremental parse could not place (e.g. an odd
+            # last value) still reaches the client before the result
+            for field, value in filtered_suggestions.items():
+                if field not in streamed:
+                    yield "field", {"field": field, "value": value, "source": "ai"}
+
+            if cache_key and filtered_suggestions:
+                get_enhancement_cache().set(cache_key, filtered_suggestions)
+            yield "result", _success_result(flashcard_data, original_fields, from_dictionary, filtered_suggestions)
+            return
+
+        except json.JSONDecodeError as e:
+            if retry < max_retries:
+                logger.warning("JSON parse error, retrying", extra={"attempt": retry + 1, "max_retries": max_retries})
+                count_retry("gemini", "enhance")
+                await asyncio.sleep(backoff_delay(retry))
+                continue
+            yield "result", {
+                "status": "error",
+                "message": f"Failed to parse AI response as JSON after {max_retries + 1} attempts: {e}",
+                "raw_response": text or None
+            }
+        except Exception as e:
+            error = f"timed out after {timeout}s" if isinstance(e, asyncio.TimeoutError) else e
+            if retry < max_retries:
+                logger.warning("API error, retrying", extra={
+                    "attempt": retry + 1, "max_retries": max_retries, "error": str(error),
+                })
+                count_retry("gemini", "enhance")
+                await asyncio.sleep(backoff_delay(retry))
+                continue
+            yield "result", {
+                "status": "error",
+                "message": f"Error calling AI API after {max_retries + 1} attempts: {error}"
+            }
+
+@register_job("enhance_flashcard")
+def enhance_flashcard_job(job_id: str, flashcard: Dict[str, Any]) -> Dict[str, Any]:
+    """Job handler: enhance_flashcard, failing the job on an error result"""
+    result = enhance_flashcard(dict(flashcard))
+    if result["status"] == "error":
+        raise RuntimeError(result["message"])
+    return result
+
+
+def init_app(app):
+    global _enhancement_cache_path
+    _enhancement_cache_path = app.config.get('AI_CACHE_PATH') or os.path.join(app.instance_path, 'ai_cache.db')
+
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+
+# Canned answers for a few common words; anything else gets placeholders
+STUB_ENTRIES = {
+    "hello": {
+        "hanzi": "你好",
+        "pinyin": "nǐ hǎo",
+        "traditional": "你好",
+        "part_of_speech": "interjection",
+        "measure_word": "",
+        "example_sentence": "你好，你吃了吗？ (Nǐ hǎo, nǐ chī le ma?) - Hello, have you eaten?",
+        "notes": "Common greeting\nnǐ (you) + hǎo (good)",
+    },
+    "water": {
+        "hanzi": "水",
+        "pinyin": "shuǐ",
+        "traditional": "水",
+        "part_of_speech": "noun",
+        "measure_word": "杯",
+        "example_sentence": "我想喝水。 (Wǒ xiǎng hē shuǐ.) - I want to drink water.",
+        "notes": "Radical 氵 is a compressed form of 水",
+    },
+}
+
+
+class StubResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _StubModels:
+    def __init__(self, client):
+        self._client = client
+
+    def generate_content(self, model: str, contents: str) -> StubResponse:
+        return self._client._generate(model, contents)
+
+    def generate_content_stream(self, model: str, contents: str) -> Iterator[StubResponse]:
+        text = self._client._generate(model, contents).text
+        for i in range(0, len(text), self._client.chunk_chars):
+            yield StubResponse(text[i:i + self._client.chunk_chars])
+
+
+class _StubAsyncModels:
+    def __init__(self, client):
+        self._client = client
+
+    async def generate_content(self, model: str, contents: str) -> StubResponse:
+        if self._client.latency:
+            await asyncio.sleep(self._client.latency)
+        return self._client._generate(model, contents, sleep=False)
+
+    async def generate_content_stream(self, model: str, contents: str) -> AsyncIterator[StubResponse]:
+        if self._client.latency:
+            await asyncio.sleep(self._client.latency)
+        text = self._client._generate(model, contents, sleep=False).text
+        return self._chunks(text)
+
+    async def _chunks(self, text: str) -> AsyncIterator[StubResponse]:
+        for i in range(0, len(text), self._client.chunk_chars):
+            if self._client.chunk_delay:
+                await asyncio.sleep(self._client.chunk_delay)
+            yield StubResponse(text[i:i + self._client.chunk_chars])
+
+
+class _StubAio:
+    def __init__(self, client):
+        self.models = _StubAsyncModels(client)
+
+
+class StubGenAIClient:
+    """
+    Offline stand-in for google.genai.Client.
+
+    Answers generate_content() (sync, or async through .aio) by filling the
+    empty fields of the flashcard JSON found after "INPUT:" in the prompt
+    (or of each flashcard, for a batch prompt's JSON array). Counts calls
+    so tests can check whether a request reached the "network".
+    generate_content_stream() sends the same reply in chunk_chars pieces,
+    chunk_delay seconds apart.
+    """
+
+    def __init__(self, entries: Optional[Dict[str, Dict[str, str]]] = None, latency: float = 0.0,
+                 chunk_chars: int = 16, chunk_delay: float = 0.0):
+        self.entries = entries if entries is not None else STUB_ENTRIES
+        self.latency = latency
+        self.chunk_chars = chunk_chars
+        self.chunk_delay = chunk_delay
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.models = _StubModels(self)
+        self.aio = _StubAio(self)
+
+    def _generate(self, model: str, contents: str, sleep: bool = True) -> StubResponse:
+        with self._lock:
+            self.calls += 1
+        if self.latency and sleep:
+            time.sleep(self.latency)
+
+        flashcard = json.loads(contents.rsplit("INPUT:", 1)[-1])
+        if isinstance(flashcard, list):
+            filled = [self.fill(card) for card in flashcard]
+        else:
+            filled = self.fill(flashcard)
+        return StubResponse(json.dumps(filled, ensure_ascii=False))
+
+    def fill(self, flashcard: Dict[str, Any]) -> Dict[str, Any]:
+        entry = self.entries.get(str(flashcard.get("english", "")).strip().lower(), {})
+        filled = dict(flashcard)
+        for field, value in flashcard.items():
+            if not value:
+                filled[field] = entry.get(field, f"stub {field}")
+        return filled
@@ -0,0 +1,63 @@
+"""
+Per-process asyncio loop for the AI service layer.
+
+Flask routes and job threads are synchronous, so coroutines are handed to
+one long-lived event loop running on a daemon thread. Keeping a single
+loop lets async HTTP clients reuse their connection pools across calls.
+Never call run_sync() or iter_sync() from a coroutine running on this
+loop: it would wait on itself.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Awaitable, Iterator, Optional
+
+_lock = threading.Lock()
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_pid: Optional[int] = None
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """This process's background loop, started on first use (and after fork)"""
+    global _loop, _loop_pid
+    if _loop is not None and _loop_pid == os.getpid():
+        return _loop
+
+    with _lock:
+        if _loop is None or _loop_pid != os.getpid():
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name='ai-event-loop', daemon=True)
+            thread.start()
+            _loop, _loop_pid = loop, os.getpid()
+    return _loop
+
+
+def submit(coro: Awaitable[Any]) -> Future:
+    """Schedule a coroutine on the background loop and return a concurrent Future"""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def run_sync(coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+    """Run a coroutine on the background loop and block until it finishes"""
+    return submit(coro).result(timeout)
+
+
+async def _anext(iterator: AsyncIterator[Any]) -> Any:
+    return await iterator.__anext__()
+
+
+def iter_sync(iterator: AsyncIterator[Any], timeout: Optional[float] = None) -> Iterator[Any]:
+    """
+    Iterate an async generator from synchronous code, running each step on
+    the background loop. Closing this generator early (e.g. the client of a
+    streamed response went away) closes the async one too.
+    """
+    try:
+        while True:
+            try:
+                yield run_sync(_anext(iterator), timeout)
+            except StopAsyncIteration:
+                return
+    finally:
+        run_sync(iterator.aclose(), timeout)
@@ -0,0 +1,192 @@
+import base64
+import binascii
+import hashlib
+import logging
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import BinaryIO
+
+import click
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+AUDIO_HASH_RE = re.compile(r'^[0-9a-f]{64}$')
+AUDIO_MIMETYPE = 'audio/mpeg'
+
+
+class AudioWriter:
+    """
+    Incremental writer for AudioStore: bytes go to a temp file as they
+    arrive and are hashed on the fly, so nothing is buffered in memory.
+    """
+
+    def __init__(self, store):
+        self._store = store
+        store.root.mkdir(parents=True, exist_ok=True)
+        fd, self._tmp_path = tempfile.mkstemp(dir=store.root, prefix='.tmp-')
+        self._file = os.fdopen(fd, 'wb')
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk: bytes) -> None:
+        self._file.write(chunk)
+        self._hash.update(chunk)
+        self.size += len(chunk)
+
+    def commit(self) -> str:
+        """Move the finished file into place and return its hash"""
+        self._file.close()
+        audio_hash = self._hash.hexdigest()
+        path = self._store.path_for(audio_hash)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(self._tmp_path, path)
+        return audio_hash
+
+    def abort(self) -> None:
+        self._file.close()
+        try:
+            os.unlink(self._tmp_path)
+        except OSError:
+            pass
+
+
+class AudioStore:
+    """
+    Content-addressed store of raw MP3 bytes on disk.
+
+    Files live at <root>/<hash[:2]>/<hash>.mp3 where hash is the SHA-256 of
+    the bytes, so identical audio is stored once and a stored file never
+    changes. Writes go through a temp file and os.replace, which keeps them
+    atomic across gunicorn workers sharing the directory.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    @staticmethod
+    def hash_bytes(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def path_for(self, audio_hash: str) -> Path:
+        if not AUDIO_HASH_RE.match(audio_hash or ''):
+            raise ValueError(f'Invalid audio hash: {audio_hash!r}')
+        return self.root / audio_hash[:2] / f'{audio_hash}.mp3'
+
+    def exists(self, audio_hash: str) -> bool:
+        try:
+            return self.path_for(audio_hash).is_file()
+        except ValueError:
+            return False
+
+    def put(self, data: bytes) -> str:
+        """Store bytes (no-op if already present) and return their hash"""
+        audio_hash = self.hash_bytes(data)
+        path = self.path_for(audio_hash)
+        if path.is_file():
+            return audio_hash
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        return audio_hash
+
+    @staticmethod
+    def decode_base64(audio_base64: str) -> bytes:
+        """Bytes of base64 audio, optionally a data: URL"""
+        if audio_base64.startswith('data:'):
+            audio_base64 = audio_base64.split(',', 1)[-1]
+        return base64.b64decode(audio_base64, validate=True)
+
+    def put_base64(self, audio_base64: str) -> str:
+        """Decode base64 (optionally a data: URL) and store the bytes"""
+        return self.put(self.decode_base64(audio_base64))
+
+    def writer(self) -> AudioWriter:
+        return AudioWriter(self)
+
+    def get(self, audio_hash: str) -> bytes:
+        return self.path_for(audio_hash).read_bytes()
+
+    def open(self, audio_hash: str) -> BinaryIO:
+        return self.path_for(audio_hash).open('rb')
+
+    def delete(self, audio_hash: str) -> None:
+        self.path_for(audio_hash).unlink(missing_ok=True)
+
+
+def get_audio_store(app=None) -> AudioStore:
+    app = app or current_app._get_current_object()
+    store = app.extensions.get('audio_store')
+    if store is None:
+        store = AudioStore(app.config.get('AUDIO_STORE_PATH') or os.path.join(app.instance_path, 'audio'))
+        app.extensions['audio_store'] = store
+    return store
+
+
+def migrate_base64_audio(conn, store: AudioStore, batch_size: int = 100) -> dict:
+    """
+    Move legacy cards.base64_audio into the store, one committed batch at a
+    time, setting audio_hash and clearing the inline copy.
+
+    Safe to re-run or to run concurrently: already-moved cards are skipped
+    and identical audio hashes to the same file. Rows whose base64 cannot be
+    decoded are left untouched and counted as failed.
+    """
+    moved = failed = 0
+    last_id = 0
+    while True:
+        rows = conn.execute('''
+            SELECT id, base64_audio FROM cards
+            WHERE id > ? AND audio_hash IS NULL
+              AND base64_audio IS NOT NULL AND base64_audio != ''
+            ORDER BY id
+            LIMIT ?
+        ''', (last_id, batch_size)).fetchall()
+        if not rows:
+            break
+
+        updates = []
+        for row in rows:
+            try:
+                updates.append((store.put_base64(row['base64_audio']), row['id']))
+            except (binascii.Error, ValueError) as e:
+                failed += 1
+                logger.warning("Skipping undecodable audio", extra={'card_id': row['id'], 'error': str(e)})
+        last_id = rows[-1]['id']
+
+        conn.executemany(
+            'UPDATE cards SET audio_hash = ?, base64_audio = NULL WHERE id = ?', updates
+        )
+        conn.commit()
+        if updates:
+            moved += len(updates)
+            logger.info("Moved audio to the store", extra={'cards': moved})
+
+    return {'moved': moved, 'failed': failed}
+
+
+def init_app(app):
+    @app.cli.command('migrate-audio')
+    @click.option('--batch-size', default=100, show_default=True,
+                  help='Cards moved per committed batch.')
+    def migrate_audio_command(batch_size):
+        """Move base64 audio out of the cards table into the audio store."""
+        from app.models.database import get_db_connection
+        conn = get_db_connection()
+        try:
+            result = migrate_base64_audio(conn, get_audio_store(), batch_size)
+        finally:
+            conn.close()
+        click.echo(f"Moved {result['moved']} audio clips, {result['failed']} failed")
@@ -0,0 +1,250 @@
+"""
+Deck-level AI enhancement.
+
+Cards are packed into batched prompts (BATCH_PRE_PROMPT is sent once per
+batch instead of PRE_PROMPT once per card), batches fan out concurrently on
+the shared AI event loop up to a limit, and everything the model suggests
+is written back to cards in a single transaction at the end.
+"""
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import as_completed
+from typing import Any, Dict, List, Sequence, Tuple
+
+from app.models.database import get_db_connection
+from app.services.ai_integration import (
+    AI_TIMEOUT, backoff_delay, build_batch_prompt, enhancement_cache_key, generate_content_async,
+    get_enhancement_cache, get_genai_client, is_rate_limited,
+)
+from app.services.async_runner import submit
+from app.services.dictionary import fill_from_dictionary, get_dictionary
+from app.services.duplicates import update_dedup_keys
+from app.services.jobs import register_job, set_job_progress
+from app.services.metrics import count_retry
+from app.services.search import index_cards
+from app.utils.json_extract import extract_json
+from app.utils.pinyin import card_key
+
+logger = logging.getLogger(__name__)
+
+# Card columns the model may fill in
+ENHANCE_FIELDS = ("hanzi", "pinyin", "traditional", "part_of_speech",
+                  "measure_word", "example_sentence", "notes")
+
+DEFAULT_MODEL = "gemini-2.5-flash"
+DEFAULT_BATCH_SIZE = int(os.getenv("AI_BULK_BATCH_SIZE", 25))
+DEFAULT_CONCURRENCY = int(os.getenv("AI_BULK_CONCURRENCY", 8))
+MAX_BATCH_SIZE = 100
+MAX_CONCURRENCY = 32
+MAX_BATCH_ATTEMPTS = 5
+
+# Fills only columns that are still empty, so edits made while the job ran win.
+_CARD_FILL_SQL = 'UPDATE cards SET {}, updated_at = CURRENT_TIMESTAMP WHERE id = ?'.format(
+    ', '.join(f"{field} = COALESCE(NULLIF({field}, ''), ?, {field})" for field in ENHANCE_FIELDS)
+)
+
+
+class RateLimiter:
+    """
+    Cooldown shared by every batch of a job: once the API reports a rate
+    limit, all batches hold off instead of retrying against it in parallel.
+    Only used from the AI event loop, so it needs no locking.
+    """
+
+    def __init__(self):
+        self._until = 0.0
+        self.hits = 0
+
+    async def wait(self) -> None:
+        delay = self._until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def backoff(self, attempt: int) -> None:
+        self._until = max(self._until, time.monotonic() + backoff_delay(attempt))
+        self.hits += 1
+
+
+def _taken_in_deck(conn, deck_id: int, suggestions: Dict[int, Dict[str, str]],
+                   pinyin: Dict[int, str]) -> set:
+    """Cards whose suggested hanzi would make them a duplicate (same dedup_key) in their deck"""
+    keys = {row[0] for row in conn.execute(
+        'SELECT dedup_key FROM cards WHERE deck_id = ? AND is_archived = FALSE AND dedup_key IS NOT NULL',
+        (deck_id,))}
+    taken = set()
+    for card_id, card_suggestions in suggestions.items():
+        if not card_suggestions.get("hanzi"):
+            continue
+        key = card_key(card_suggestions["hanzi"], pinyin[card_id] or card_suggestions.get("pinyin", ""))
+        if key in keys:
+            taken.add(card_id)
+        else:
+            keys.add(key)
+    return taken
+
+
+async def _enhance_batch(client, model: str, batch: List[Dict[str, Any]], limiter: RateLimiter,
+                         semaphore: asyncio.Semaphore) -> Tuple[Dict[int, Dict[str, str]], int]:
+    """
+    Send one batch and return ({card id: suggestions}, attempts made).
+    Suggestions only cover fields that were empty in the input.
+    """
+    prompt = build_batch_prompt(batch)
+    async with semaphore:
+        for attempt in range(MAX_BATCH_ATTEMPTS):
+            await limiter.wait()
+            try:
+                # A batch answers many cards, so it gets a proportionally longer timeout
+                response = await generate_content_async(client, model, prompt, AI_TIMEOUT * 2, "enhance_batch")
+                items = extract_json(response.text, list)
+                break
+            except Exception as e:
+                if attempt == MAX_BATCH_ATTEMPTS - 1:
+                    raise
+                count_retry("gemini", "enhance_batch")
+                if is_rate_limited(e):
+                    logger.warning("Rate limited, backing off", extra={
+                        "attempt": attempt + 1, "max_attempts": MAX_BATCH_ATTEMPTS,
+                    })
+                    limiter.backoff(attempt)
+                else:
+                    logger.warning("Batch failed, retrying", extra={
+                        "attempt": attempt + 1, "max_attempts": MAX_BATCH_ATTEMPTS, "error": repr(e),
+                    })
+                    await asyncio.sleep(backoff_delay(attempt))
+
+    by_id = {card["id"]: card for card in batch}
+    results = {}
+    for item in items:
+        if not isinstance(item, dict) or item.get("id") not in by_id:
+            continue
+        card = by_id[item["id"]]
+        results[card["id"]] = {
+            field: str(value).strip()
+            for field, value in item.items()
+            if field in card and field not in ("id", "english") and not card[field]
+            and isinstance(value, (str, int, float)) and str(value).strip()
+        }
+    return results, attempt + 1
+
+
+@register_job("enhance_deck")
+def enhance_deck(job_id: str, deck_id: int, fields: Sequence[str] = ENHANCE_FIELDS,
+                 batch_size: int = DEFAULT_BATCH_SIZE, concurrency: int = DEFAULT_CONCURRENCY,
+                 model: str = DEFAULT_MODEL, client=None) -> Dict[str, Any]:
+    """
+    Fill the empty `fields` of every active card in a deck. Runs as the
+    "enhance_deck" job; progress is reported per finished batch.
+
+    The local dictionary fills pinyin/traditional/english/measure_word
+    first; cards it completes, or that the enhancement cache answers, skip
+    the API. A batch that still fails after MAX_BATCH_ATTEMPTS is counted
+    as failed and the rest of the job carries on.
+    """
+    start = time.perf_counter()
+    fields = [field for field in ENHANCE_FIELDS if field in fields]
+    empty_any = ' OR '.join(f"COALESCE({field}, '') = ''" for field in fields)
+
+    conn = get_db_connection()
+    try:
+        rows = conn.execute(f'''
+            SELECT id, english, {', '.join(dict.fromkeys(["hanzi", "pinyin", *fields]))} FROM cards
+            WHERE deck_id = ? AND is_archived = FALSE AND english != '' AND ({empty_any})
+            ORDER BY id
+        ''', (deck_id,)).fetchall()
+    finally:
+        conn.close()
+    set_job_progress(job_id, 0, total=len(rows))
+
+    # Same keys as a single-card request for these fields, so both share answers
+    original_fields = ["english", *fields]
+    cache = get_enhancement_cache()
+    suggestions, cache_keys, pending = {}, {}, []
+    # Dictionary lookups come first; the model only sees the fields left empty
+    dictionary_count = cached_count = 0
+    for row in rows:
+        data = {field: row[field] or "" for field in original_fields}
+        filled = fill_from_dictionary({**data, "hanzi": row["hanzi"]}, fields)
+        if filled:
+            dictionary_count += 1
+            data.update(filled)
+            if all(data[field] for field in original_fields):
+                suggestions[row["id"]] = filled
+                get_dictionary().count("ai_calls_skipped")
+                continue
+        key = enhancement_cache_key(data, original_fields, model)
+        cached = cache.get(key)
+        if cached is not None:
+            cached_count += 1
+            suggestions[row["id"]] = {**filled, **cached}
+        else:
+            if filled:
+                # Kept even if the model fails for this card
+                suggestions[row["id"]] = filled
+            cache_keys[row["id"]] = key
+            pending.append({"id": row["id"], **data})
+
+    batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+    limiter = RateLimiter()
+    done, failed, api_calls = len(rows) - len(pending), 0, 0
+    if batches:
+        set_job_progress(job_id, done)
+        client = client or get_genai_client()
+        semaphore = asyncio.Semaphore(concurrency)
+        futures = {submit(_enhance_batch(client, model, batch, limiter, semaphore)): batch
+                   for batch in batches}
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                batch_results, attempts = future.result()
+            except Exception as e:
+                logger.error("Giving up on batch", extra={"cards": len(batch), "error": repr(e)})
+                failed += len(batch)
+                api_calls += MAX_BATCH_ATTEMPTS
+            else:
+                api_calls += attempts
+                failed += len(batch) - len(batch_results)
+                for card_id, card_suggestions in batch_results.items():
+                    suggestions[card_id] = {**suggestions.get(card_id, {}), **card_suggestions}
+                    if card_suggestions:
+                        cache.set(cache_keys[card_id], card_suggestions)
+            done += len(batch)
+            set_job_progress(job_id, done)
+
+    pinyin = {row["id"]: row["pinyin"] or "" for row in rows}
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        # A card the model gave the hanzi of another card in the deck is left alone
+        taken = _taken_in_deck(conn, deck_id, suggestions, pinyin)
+        suggestions = {card_id: card_suggestions for card_id, card_suggestions in suggestions.items()
+                       if card_suggestions and card_id not in taken}
+        updates = [
+            (*(card_suggestions.get(field) for field in ENHANCE_FIELDS), card_id)
+            for card_id, card_suggestions in suggestions.items()
+        ]
+        conn.executemany(_CARD_FILL_SQL, updates)
+        update_dedup_keys(conn, [card_id for card_id, card_suggestions in suggestions.items()
+                                 if "hanzi" in card_suggestions or "pinyin" in card_suggestions])
+        index_cards(conn, [update[-1] for update in updates])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    return {
+        "cards": len(rows),
+        "enhanced": len(updates),
+        "duplicates": len(taken),
+        "cached": cached_count,
+        "dictionary": dictionary_count,
+        "failed": failed,
+        "batches": len(batches),
+        "api_calls": api_calls,
+        "rate_limited": limiter.hits,
+        "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
@@ -0,0 +1,249 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# How many writes a process makes between eviction passes
+_EVICT_EVERY = 64
+# Memory hits move last_used on disk at most once per key per interval, and
+# the queued moves are written together once there are a batch of them or
+# the oldest has waited an interval
+_TOUCH_INTERVAL = 60.0
+_TOUCH_BATCH = 64
+
+
+class PersistentCache:
+    """
+    Two-tier key/value cache: a small in-process LRU in front of an SQLite
+    table that every gunicorn worker shares.
+
+    Values are bytes (stored as-is) or anything JSON-serializable. Entries
+    expire after `ttl` seconds; the SQLite tier is trimmed to `max_entries`
+    and `max_bytes` by evicting the least recently used rows. Memory hits
+    count as uses too, so an entry that stays hot in one worker's memory is
+    not the first row to be evicted.
+
+    `set()` may record a size other than the stored value's, for values that
+    stand for data kept elsewhere, and `on_evict` is called with the
+    (key, value) pairs each eviction pass removes so that data can go too.
+    """
+
+    def __init__(self, path: str, table: str, ttl: Optional[float] = None,
+                 max_entries: Optional[int] = None, max_bytes: Optional[int] = None,
+                 memory_entries: int = 256,
+                 on_evict: Optional[Callable[[List[Tuple[str, Any]]], None]] = None):
+        if not table.isidentifier():
+            raise ValueError(f'Invalid cache table name: {table!r}')
+        self.path = path
+        self.table = table
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self.on_evict = on_evict
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._writes_since_evict = 0
+        self._touches = {}
+        self._touches_since = 0.0
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0,
+                       'writes': 0, 'evictions': 0, 'expired': 0}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._ensure_table()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _ensure_table(self):
+        conn = self._connect()
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {self.table} (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                is_json BOOLEAN NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        ''')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{self.table}_last_used ON {self.table}(last_used)')
+
+    def _count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def _remember(self, key, value, created_at, touched_at):
+        with self._lock:
+            self._memory[key] = (value, created_at, touched_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _expired(self, created_at, now):
+        return self.ttl is not None and created_at + self.ttl < now
+
+    @staticmethod
+    def _decode(raw, is_json):
+        return json.loads(raw) if is_json else bytes(raw)
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and self._expired(entry[1], now):
+                del self._memory[key]
+                entry = None
+            if entry is not None:
+                value, created_at, touched_at = entry
+                self._memory.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                if now - touched_at >= _TOUCH_INTERVAL:
+                    self._memory[key] = (value, created_at, now)
+                    if not self._touches:
+                        self._touches_since = now
+                    self._touches[key] = now
+                flush = bool(self._touches) and (len(self._touches) >= _TOUCH_BATCH
+                                                 or now - self._touches_since >= _TOUCH_INTERVAL)
+        if entry is not None:
+            if flush:
+                self.flush_touches()
+            return value
+
+        conn = self._connect()
+        row = conn.execute(
+            f'SELECT value, is_json, created_at FROM {self.table} WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            self._count('misses')
+            return None
+
+        raw, is_json, created_at = row
+        if self._expired(created_at, now):
+            conn.execute(f'DELETE FROM {self.table} WHERE key = ?', (key,))
+            self._count('expired')
+            self._count('misses')
+            return None
+
+        conn.execute(f'UPDATE {self.table} SET last_used = ? WHERE key = ?', (now, key))
+        value = self._decode(raw, is_json)
+        self._remember(key, value, created_at, now)
+        self._count('disk_hits')
+        return value
+
+    def set(self, key: str, value: Any, size: Optional[int] = None) -> None:
+        """Store value; size (default: its stored length) counts toward max_bytes"""
+        now = time.time()
+        is_json = not isinstance(value, (bytes, bytearray, memoryview))
+        raw = json.dumps(value, ensure_ascii=False).encode('utf-8') if is_json else bytes(value)
+
+        conn = self._connect()
+        conn.execute(f'''
+            INSERT OR REPLACE INTO {self.table} (key, value, is_json, size, created_at, last_used)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (key, raw, is_json, len(raw) if size is None else size, now, now))
+        self._remember(key, value, now, now)
+
+        with self._lock:
+            self._stats['writes'] += 1
+            self._writes_since_evict += 1
+            evict = self._writes_since_evict >= _EVICT_EVERY
+            if evict:
+                self._writes_since_evict = 0
+        if evict:
+            self.evict()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._memory.pop(key, None)
+        self._connect().execute(f'DELETE FROM {self.table} WHERE key = ?', (key,))
+
+    def flush_touches(self) -> None:
+        """Write the last_used times queued up by memory hits"""
+        with self._lock:
+            touches, self._touches = self._touches, {}
+        if touches:
+            self._connect().executemany(
+                f'UPDATE {self.table} SET last_used = MAX(last_used, ?) WHERE key = ?',
+                [(touched_at, key) for key, touched_at in touches.items()],
+            )
+
+    def evict(self) -> int:
+        """Drop expired rows, then LRU rows beyond the entry/byte budgets"""
+        self.flush_touches()
+        conn = self._connect()
+        removed = 0
+        evicted = []
+        if self.ttl is not None:
+            cutoff = time.time() - self.ttl
+            if self.on_evict is not None:
+                evicted.extend(conn.execute(
+                    f'SELECT key, value, is_json FROM {self.table} WHERE created_at < ?', (cutoff,)
+                ))
+            removed += conn.execute(
+                f'DELETE FROM {self.table} WHERE created_at < ?', (cutoff,)
+            ).rowcount
+
+        count, total = conn.execute(f'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}').fetchone()
+        if (self.max_entries is not None and count > self.max_entries) or \
+                (self.max_bytes is not None and total > self.max_bytes):
+            # Walk from least recently used, keeping a running total of what stays
+            excess_entries = count - self.max_entries if self.max_entries is not None else 0
+            excess_bytes = total - self.max_bytes if self.max_bytes is not None else 0
+            doomed = []
+            columns = 'key, size' if self.on_evict is None else 'key, size, value, is_json'
+            for row in conn.execute(f'SELECT {columns} FROM {self.table} ORDER BY last_used'):
+                if excess_entries <= 0 and excess_bytes <= 0:
+                    break
+                key, size = row[0], row[1]
+                doomed.append((key,))
+                if self.on_evict is not None:
+                    evicted.append((key, row[2], row[3]))
+                excess_entries -= 1
+                excess_bytes -= size
+            conn.executemany(f'DELETE FROM {self.table} WHERE key = ?', doomed)
+            removed += len(doomed)
+            with self._lock:
+                for (key,) in doomed:
+                    self._memory.pop(key, None)
+
+        with self._lock:
+            self._stats['evictions'] += removed
+        if evicted:
+            try:
+                self.on_evict([(key, self._decode(raw, is_json)) for key, raw, is_json in evicted])
+            except Exception:
+                logger.exception("Cache eviction callback failed", extra={'table': self.table})
+        return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._touches.clear()
+        self._connect().execute(f'DELETE FROM {self.table}')
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._memory)
+        hits = stats['memory_hits'] + stats['disk_hits']
+        lookups = hits + stats['misses']
+        stats['hits'] = hits
+        stats['hit_rate'] = round(hits / lookups, 4) if lookups else 0.0
+        return stats
@@ -0,0 +1,106 @@
+import threading
+import time
+from flask import current_app
+from app.models.database import get_db_connection
+from app.utils.helpers import calculate_mastery_rate
+
+DEFAULT_DASHBOARD_CACHE_TTL = 5.0
+
+# One row per active deck, each carrying the same summary columns; the
+# LEFT JOIN from the one-row summary keeps it when there are no decks.
+DASHBOARD_QUERY = '''
+    WITH summary AS (
+        SELECT
+            us.current_streak, us.longest_streak, us.total_streak_days, us.last_study_date,
+            (SELECT cards_studied FROM daily_study_logs WHERE study_date = date('now')) AS studied_today,
+            (SELECT COALESCE(SUM(card_count), 0) FROM deck_stats) AS total_cards,
+            (SELECT COALESCE(SUM(mastered_count), 0) FROM deck_stats) AS mastered_cards
+        FROM (SELECT 1) AS one
+        LEFT JOIN user_streaks us ON us.id = 1
+    )
+    SELECT s.*, d.id, d.name, d.description, d.category, d.level, d.color,
+           d.is_archived, d.created_at, d.updated_at,
+           COALESCE(ds.card_count, 0) AS card_count,
+           COALESCE(ds.mastered_count, 0) AS mastered_count
+    FROM summary s
+    LEFT JOIN decks d ON d.is_archived = FALSE
+    LEFT JOIN deck_stats ds ON ds.deck_id = d.id
+    ORDER BY d.created_at DESC
+'''
+
+DECK_FIELDS = ('id', 'name', 'description', 'category', 'level', 'color',
+               'is_archived', 'created_at', 'updated_at', 'card_count', 'mastered_count')
+
+_cache_lock = threading.Lock()
+# generation is bumped by every invalidation, so a load that raced one is not cached
+_cache = {'value': None, 'expires': 0.0, 'generation': 0}
+_cache_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+
+def _load_dashboard_data():
+    conn = get_db_connection()
+    try:
+        rows = conn.execute(DASHBOARD_QUERY).fetchall()
+        summary = rows[0]
+        if summary['current_streak'] is None:
+            conn.execute('''
+                INSERT OR IGNORE INTO user_streaks (id, current_streak, longest_streak, total_streak_days)
+                VALUES (1, 0, 0, 0)
+            ''')
+            conn.commit()
+
+        decks = [{field: row[field] for field in DECK_FIELDS} for row in rows if row['id'] is not None]
+        total_cards = summary['total_cards']
+        return {
+            'streak': {
+                'current_streak': summary['current_streak'] or 0,
+                'longest_streak': summary['longest_streak'] or 0,
+                'total_streak_days': summary['total_streak_days'] or 0,
+                'last_study_date': summary['last_study_date'],
+            },
+            'decks': decks,
+            'total_decks': len(decks),
+            'total_cards': total_cards,
+            'today_studied': summary['studied_today'] or 0,
+            'mastery_rate': calculate_mastery_rate(summary['mastered_cards'], total_cards),
+        }
+    finally:
+        conn.close()
+
+
+def get_dashboard_data():
+    """
+    Dashboard aggregates (streak, decks with counts, today's reviews,
+    totals and mastery), served from a short-lived in-process cache.
+
+    Writes in this worker call invalidate_dashboard_cache(); writes in other
+    gunicorn workers become visible once the TTL expires.
+    """
+    ttl = current_app.config.get('DASHBOARD_CACHE_TTL', DEFAULT_DASHBOARD_CACHE_TTL)
+    now = time.monotonic()
+    with _cache_lock:
+        if _cache['value'] is not None and now < _cache['expires']:
+            _cache_stats['hits'] += 1
+            return _cache['value']
+        _cache_stats['misses'] += 1
+        generation = _cache['generation']
+
+    data = _load_dashboard_data()
+    with _cache_lock:
+        if _cache['generation'] == generation:
+            _cache['value'] = data
+            _cache['expires'] = now + ttl
+    return data
+
+
+def invalidate_dashboard_cache():
+    with _cache_lock:
+        _cache['value'] = None
+        _cache['expires'] = 0.0
+        _cache['generation'] += 1
+        _cache_stats['invalidations'] += 1
+
+
+def dashboard_cache_stats():
+    with _cache_lock:
+        return dict(_cache_stats)
@@ -0,0 +1,129 @@
+import base64
+import json
+from app.utils.helpers import calculate_mastery_rate
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Columns shown on the deck page; audio is fetched separately by hash
+CARD_LIST_COLUMNS = '''
+    c.id, c.deck_id, c.hanzi, c.pinyin, c.english, c.traditional, c.measure_word,
+    c.part_of_speech, c.example_sentence, c.notes, c.audio_hash, c.created_at,
+    cp.srs_level, cp.next_review
+'''
+
+# sort name -> (key column, id column, FROM clause, default order).
+# Each FROM clause is driven by an index whose trailing columns match the
+# (key, id) ordering, so a page is a single index range scan.
+CARD_SORTS = {
+    'created_at': (
+        'c.created_at', 'c.id',
+        'cards c LEFT JOIN card_progress cp ON cp.card_id = c.id',
+        'desc',
+    ),
+    'srs_level': (
+        'cp.srs_level', 'cp.card_id',
+        'card_progress cp JOIN cards c ON c.id = cp.card_id',
+        'asc',
+    ),
+    'next_review': (
+        'cp.next_review', 'cp.card_id',
+        'card_progress cp JOIN cards c ON c.id = cp.card_id',
+        'asc',
+    ),
+}
+
+
+def get_deck_stats(conn, deck_id):
+    """Total, due and mastered counts for a deck's active cards in one query"""
+    row = conn.execute('''
+        SELECT COUNT(*) AS card_count,
+               COUNT(CASE WHEN cp.next_review < date('now', '+1 day') THEN 1 END) AS due_count,
+               COUNT(CASE WHEN cp.srs_level >= 3 THEN 1 END) AS mastered_count
+        FROM cards c
+        LEFT JOIN card_progress cp ON cp.card_id = c.id
+        WHERE c.deck_id = ? AND c.is_archived = FALSE
+    ''', (deck_id,)).fetchone()
+
+    return {
+        'card_count': row['card_count'],
+        'due_count': row['due_count'],
+        'mastered_count': row['mastered_count'],
+        'mastery_rate': calculate_mastery_rate(row['mastered_count'], row['card_count']),
+    }
+
+
+def encode_cursor(key, card_id):
+    raw = json.dumps([key, card_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError for a malformed cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        key, card_id = json.loads(raw)
+    except (TypeError, ValueError) as e:
+        raise ValueError('Invalid cursor') from e
+    if not isinstance(card_id, int):
+        raise ValueError('Invalid cursor')
+    return key, card_id
+
+
+def _keyset_condition(key_col, id_col, order, key, card_id):
+    """
+    WHERE fragment selecting rows strictly after (key, card_id).
+
+    SQLite sorts NULL first ascending and last descending, so a NULL key
+    needs its own branch rather than a plain comparison.
+    """
+    if order == 'asc':
+        if key is None:
+            return f'(({key_col} IS NULL AND {id_col} > ?) OR {key_col} IS NOT NULL)', [card_id]
+        return f'({key_col} > ? OR ({key_col} = ? AND {id_col} > ?))', [key, key, card_id]
+    if key is None:
+        return f'({key_col} IS NULL AND {id_col} < ?)', [card_id]
+    return (f'({key_col} < ? OR ({key_col} = ? AND {id_col} < ?) OR {key_col} IS NULL)',
+            [key, key, card_id])
+
+
+def get_deck_cards_page(conn, deck_id, sort='created_at', order=None, cursor=None,
+                        limit=DEFAULT_PAGE_SIZE):
+    """
+    One page of a deck's active cards using keyset pagination.
+
+    Returns (cards, next_cursor); next_cursor is None on the last page.
+    Raises ValueError for an unknown sort/order or a malformed cursor.
+    """
+    if sort not in CARD_SORTS:
+        raise ValueError(f'Unknown sort: {sort}')
+    key_col, id_col, from_clause, default_order = CARD_SORTS[sort]
+    order = order or default_order
+    if order not in ('asc', 'desc'):
+        raise ValueError(f'Unknown order: {order}')
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+    deck_col = 'c.deck_id' if sort == 'created_at' else 'cp.deck_id'
+    conditions = [f'{deck_col} = ?', 'c.is_archived = FALSE']
+    params = [deck_id]
+    if cursor:
+        key, card_id = decode_cursor(cursor)
+        condition, condition_params = _keyset_condition(key_col, id_col, order, key, card_id)
+        conditions.append(condition)
+        params.extend(condition_params)
+
+    direction = order.upper()
+    rows = conn.execute(f'''
+        SELECT {CARD_LIST_COLUMNS}
+        FROM {from_clause}
+        WHERE {' AND '.join(conditions)}
+        ORDER BY {key_col} {direction}, {id_col} {direction}
+        LIMIT ?
+    ''', [*params, limit + 1]).fetchall()
+
+    cards = [dict(row) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = cards[-1]
+        next_cursor = encode_cursor(last[sort], last['id'])
+    return cards, next_cursor
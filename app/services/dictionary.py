@@ -0,0 +1,302 @@
+"""
+Local CC-CEDICT dictionary.
+
+`flask import-dictionary cedict_ts.u8` compiles a CC-CEDICT file into a
+read-only SQLite database at DICTIONARY_PATH (default <instance>/cedict.db): one row
+per entry plus a WITHOUT ROWID index of headwords, both simplified and
+traditional. Opening it costs nothing up front and it is memory-mapped, so
+gunicorn workers share the OS page cache instead of each parsing the file;
+a lookup is one index probe.
+
+enhance_flashcard and enhance_deck fill pinyin, traditional, english and
+measure_word from here whenever the card has hanzi, and only ask the model
+for the fields that are still empty.
+"""
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+import click
+
+from app.utils.pinyin import card_key, numbered_to_marks
+
+DICTIONARY_MMAP_SIZE = 256 * 1024 * 1024
+
+# Card fields a dictionary entry can fill
+DICTIONARY_FIELDS = ("pinyin", "traditional", "english", "measure_word")
+# Definitions joined into the english field
+MAX_GLOSSES = 3
+
+# 傳統 传统 [chuan2 tong3] /tradition/traditional/
+_LINE_RE = re.compile(r'^(\S+) (\S+) \[([^\]]*)\] /(.*)/\s*$')
+# 個|个[ge4] or 个[ge4]
+_CLASSIFIER_RE = re.compile(r'(?:[^|\[,]+\|)?([^|\[,]+)\[')
+_SKIPPED_GLOSS_PREFIXES = ("CL:", "variant of", "old variant of", "see ", "Taiwan pr.")
+
+_SCHEMA = '''
+    CREATE TABLE entries (
+        id INTEGER PRIMARY KEY,
+        simplified TEXT NOT NULL,
+        traditional TEXT NOT NULL,
+        pinyin TEXT NOT NULL,
+        definitions TEXT NOT NULL
+    );
+    CREATE TABLE headwords (
+        word TEXT NOT NULL,
+        entry_id INTEGER NOT NULL,
+        PRIMARY KEY (word, entry_id)
+    ) WITHOUT ROWID;
+    CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+'''
+
+
+class DictionaryEntry(NamedTuple):
+    simplified: str
+    traditional: str
+    pinyin: str  # CC-CEDICT numbered form, e.g. "ni3 hao3"
+    definitions: tuple
+
+    @property
+    def pinyin_marks(self) -> str:
+        return numbered_to_marks(self.pinyin)
+
+    @property
+    def gloss(self) -> str:
+        glosses = [d for d in self.definitions if not d.startswith(_SKIPPED_GLOSS_PREFIXES)]
+        return '; '.join(glosses[:MAX_GLOSSES])
+
+    @property
+    def measure_word(self) -> str:
+        for definition in self.definitions:
+            if definition.startswith('CL:'):
+                match = _CLASSIFIER_RE.search(definition[3:])
+                if match:
+                    return match.group(1)
+        return ''
+
+
+def parse_cedict(lines: Iterable[str]) -> Iterator[DictionaryEntry]:
+    """Entries of a CC-CEDICT file; comments and malformed lines are skipped"""
+    for line in lines:
+        if line.startswith('#'):
+            continue
+        match = _LINE_RE.match(line)
+        if match:
+            traditional, simplified, pinyin, definitions = match.groups()
+            yield DictionaryEntry(simplified, traditional, pinyin, tuple(definitions.split('/')))
+
+
+def build_dictionary(source_path: str, target_path: str) -> int:
+    """
+    Compile a CC-CEDICT file into the SQLite dictionary at target_path and
+    return the entry count. The file is built beside the target and moved
+    into place, so running workers keep reading the old one until reopened.
+    """
+    target_dir = os.path.dirname(os.path.abspath(target_path))
+    os.makedirs(target_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=target_dir, prefix='.tmp-', suffix='.db')
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.executescript(_SCHEMA)
+            with open(source_path, encoding='utf-8') as f:
+                conn.executemany(
+                    'INSERT INTO entries (simplified, traditional, pinyin, definitions) VALUES (?, ?, ?, ?)',
+                    ((e.simplified, e.traditional, e.pinyin, '/'.join(e.definitions)) for e in parse_cedict(f)),
+                )
+            conn.execute('''
+                INSERT OR IGNORE INTO headwords (word, entry_id)
+                SELECT simplified, id FROM entries UNION ALL SELECT traditional, id FROM entries
+            ''')
+            count = conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+            conn.executemany('INSERT INTO meta (key, value) VALUES (?, ?)', [
+                ('entries', str(count)),
+                ('max_word_length', str(conn.execute('SELECT MAX(length(word)) FROM headwords').fetchone()[0] or 0)),
+                ('source', os.path.basename(source_path)),
+                ('built_at', time.strftime('%Y-%m-%d %H:%M:%S')),
+            ])
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(tmp_path, target_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    return count
+
+
+class Dictionary:
+    """
+    Read-only lookups against a compiled dictionary, one connection per
+    thread. Counts lookups so the hit rate can be watched at /api/dictionary.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {'lookups': 0, 'hits': 0, 'misses': 0, 'segmented_chars': 0, 'unknown_chars': 0,
+                       'cards': 0, 'fields_filled': 0, 'ai_calls_skipped': 0}
+        self.meta = dict(self._connect().execute('SELECT key, value FROM meta').fetchall())
+        self.max_word_length = int(self.meta.get('max_word_length', 0))
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            # immutable: the file is only ever replaced, never written in place
+            conn = sqlite3.connect(f'file:{os.path.abspath(self.path)}?mode=ro&immutable=1',
+                                   uri=True, check_same_thread=False)
+            conn.execute(f'PRAGMA mmap_size = {DICTIONARY_MMAP_SIZE}')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def count(self, stat: str, amount: int = 1) -> None:
+        with self._lock:
+            self._stats[stat] += amount
+
+    def lookup(self, word: str) -> List[DictionaryEntry]:
+        """Entries whose simplified or traditional form is word, in file order"""
+        rows = self._connect().execute('''
+            SELECT e.simplified, e.traditional, e.pinyin, e.definitions
+            FROM headwords h JOIN entries e ON e.id = h.entry_id
+            WHERE h.word = ?
+            ORDER BY e.id
+        ''', (word,)).fetchall()
+        with self._lock:
+            self._stats['lookups'] += 1
+            self._stats['hits' if rows else 'misses'] += 1
+        return [DictionaryEntry(s, t, p, tuple(d.split('/'))) for s, t, p, d in rows]
+
+    def segment(self, text: str) -> List[str]:
+        """
+        Split text into dictionary words by longest match from the left;
+        characters that start no word come out one at a time. Each
+        position is one query over every candidate length.
+        """
+        conn = self._connect()
+        words, unknown = [], 0
+        pos = 0
+        while pos < len(text):
+            if text[pos].isspace():
+                pos += 1
+                continue
+            longest = min(len(text), pos + max(1, self.max_word_length))
+            candidates = [text[pos:end] for end in range(pos + 1, longest + 1)]
+            found = {row[0] for row in conn.execute(
+                f"SELECT DISTINCT word FROM headwords WHERE word IN ({','.join('?' * len(candidates))})",
+                candidates,
+            )}
+            word = next((candidate for candidate in reversed(candidates) if candidate in found), text[pos])
+            unknown += word not in found
+            words.append(word)
+            pos += len(word)
+        with self._lock:
+            self._stats['segmented_chars'] += len(text)
+            self._stats['unknown_chars'] += unknown
+        return words
+
+    def best_entry(self, hanzi: str, pinyin: Optional[str] = None) -> Optional[DictionaryEntry]:
+        """
+        The entry for hanzi: the one matching pinyin when given (so 行 xíng
+        and 行 háng get their own definitions), otherwise the common-noun
+        reading with the most definitions.
+        """
+        entries = self.lookup(hanzi)
+        if pinyin:
+            key = card_key(hanzi, pinyin)
+            for entry in entries:
+                if card_key(hanzi, entry.pinyin) == key:
+                    return entry
+        # Capitalized pinyin marks names (surnames, places)
+        return max(entries, key=lambda e: (not e.pinyin[:1].isupper(), len(e.definitions)), default=None)
+
+    def fill(self, flashcard: Dict[str, Any], fields: Iterable[str]) -> Dict[str, str]:
+        """
+        Values for the DICTIONARY_FIELDS among `fields` that are empty in
+        flashcard, looked up by its hanzi. A phrase missing from the
+        dictionary gets pinyin and traditional word by word, as long as
+        every word is known.
+        """
+        hanzi = str(flashcard.get('hanzi') or '').strip()
+        wanted = [f for f in DICTIONARY_FIELDS if f in fields and not flashcard.get(f)]
+        if not hanzi or not wanted:
+            return {}
+
+        entry = self.best_entry(hanzi, flashcard.get('pinyin'))
+        if entry is not None:
+            values = {'pinyin': entry.pinyin_marks, 'traditional': entry.traditional,
+                      'english': entry.gloss, 'measure_word': entry.measure_word}
+        else:
+            parts = []
+            for word in self.segment(hanzi):
+                word_entry = self.best_entry(word)
+                if word_entry is None and any(char.isalnum() for char in word):
+                    return {}
+                parts.append((word, word_entry))
+            values = {
+                'pinyin': ' '.join(e.pinyin_marks for _, e in parts if e is not None),
+                'traditional': ''.join(e.traditional if e is not None else word for word, e in parts),
+            }
+
+        filled = {field: values[field] for field in wanted if values.get(field)}
+        if filled:
+            with self._lock:
+                self._stats['cards'] += 1
+                self._stats['fields_filled'] += len(filled)
+        return filled
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats['hit_rate'] = round(stats['hits'] / stats['lookups'], 4) if stats['lookups'] else None
+        stats['path'] = self.path
+        stats['entries'] = int(self.meta.get('entries', 0))
+        return stats
+
+
+_dictionary = None
+_dictionary_lock = threading.Lock()
+# Set by init_app(): DICTIONARY_PATH, or cedict.db in the instance folder
+_dictionary_path = None
+
+
+def get_dictionary() -> Optional[Dictionary]:
+    """This process's dictionary, or None until `flask import-dictionary` has built one"""
+    global _dictionary
+    if _dictionary is None:
+        if _dictionary_path is None or not os.path.exists(_dictionary_path):
+            return None
+        with _dictionary_lock:
+            if _dictionary is None:
+                _dictionary = Dictionary(_dictionary_path)
+    return _dictionary
+
+
+def fill_from_dictionary(flashcard: Dict[str, Any], fields: Iterable[str]) -> Dict[str, str]:
+    """Dictionary.fill() on the shared dictionary; {} when there is none"""
+    dictionary = get_dictionary()
+    return dictionary.fill(flashcard, fields) if dictionary is not None else {}
+
+
+def init_app(app):
+    global _dictionary_path
+    _dictionary_path = app.config.get('DICTIONARY_PATH') or os.path.join(app.instance_path, 'cedict.db')
+
+    @app.cli.command('import-dictionary')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--output', default=_dictionary_path, show_default=True,
+                  help='Compiled dictionary to write (DICTIONARY_PATH).')
+    def import_dictionary_command(path, output):
+        """Compile a CC-CEDICT file (e.g. cedict_ts.u8) for local lookups."""
+        start = time.perf_counter()
+        count = build_dictionary(path, output)
+        click.echo(f"Compiled {count} entries into {output} in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,102 @@
+"""
+Duplicate detection across decks.
+
+Every card carries dedup_key = card_key(hanzi, pinyin) (migration 10),
+indexed with its deck for active cards. Looking up one word and listing
+every duplicated word are both reads of idx_cards_dedup_key alone.
+
+The key is set by the code that writes hanzi or pinyin (add_card, the
+importer, bulk enhancement) rather than by a trigger, so the cards table
+stays writable without the app's SQL functions. Cards written from
+outside the app get their keys from `flask rebuild-dedup-keys`.
+"""
+import click
+
+from app.utils.pinyin import card_key
+
+DEFAULT_REPORT_LIMIT = 100
+MAX_REPORT_LIMIT = 500
+
+DUPLICATE_REPORT_SQL = '''
+    SELECT dedup_key, COUNT(*) AS card_count, COUNT(DISTINCT deck_id) AS deck_count,
+           GROUP_CONCAT(id) AS card_ids, GROUP_CONCAT(deck_id) AS deck_ids
+    FROM cards
+    WHERE is_archived = FALSE AND dedup_key > ?
+    GROUP BY dedup_key
+    HAVING COUNT(*) > 1
+    ORDER BY dedup_key
+    LIMIT ?
+'''
+
+
+def update_dedup_keys(conn, card_ids) -> None:
+    """Recompute dedup_key for cards whose hanzi or pinyin just changed (pooled connections only)"""
+    conn.executemany('UPDATE cards SET dedup_key = card_key(hanzi, pinyin) WHERE id = ?',
+                     [(card_id,) for card_id in card_ids])
+
+
+def rebuild_dedup_keys(conn) -> int:
+    """Fix every stale or missing dedup_key; returns the number of cards changed"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        count = conn.execute('''
+            UPDATE cards SET dedup_key = card_key(hanzi, pinyin)
+            WHERE dedup_key IS NOT card_key(hanzi, pinyin)
+        ''').rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return count
+
+
+def find_duplicates(conn, hanzi, pinyin):
+    """Active cards with the same normalized hanzi and pinyin, with their deck names"""
+    key = card_key(hanzi, pinyin)
+    if key is None:
+        return []
+    rows = conn.execute('''
+        SELECT c.id, c.deck_id, d.name AS deck_name
+        FROM cards c
+        JOIN decks d ON d.id = c.deck_id
+        WHERE c.dedup_key = ? AND c.is_archived = FALSE
+        ORDER BY c.id
+    ''', (key,)).fetchall()
+    return [dict(row) for row in rows]
+
+
+def duplicate_report(conn, after='', limit=DEFAULT_REPORT_LIMIT):
+    """
+    Words held by more than one active card, in key order, as one GROUP BY
+    over the index. Pass the returned cursor as `after` for the next page
+    (None on the last page).
+    """
+    limit = max(1, min(limit, MAX_REPORT_LIMIT))
+    groups = []
+    for row in conn.execute(DUPLICATE_REPORT_SQL, (after or '', limit)):
+        hanzi, _, pinyin = row['dedup_key'].partition('|')
+        card_ids = [int(value) for value in row['card_ids'].split(',')]
+        deck_ids = [int(value) for value in row['deck_ids'].split(',')]
+        groups.append({
+            'key': row['dedup_key'],
+            'hanzi': hanzi,
+            'pinyin': pinyin,
+            'card_count': row['card_count'],
+            'deck_count': row['deck_count'],
+            'cards': [{'id': card_id, 'deck_id': deck_id} for card_id, deck_id in zip(card_ids, deck_ids)],
+        })
+    cursor = groups[-1]['key'] if len(groups) == limit else None
+    return groups, cursor
+
+
+def init_app(app):
+    @app.cli.command('rebuild-dedup-keys')
+    def rebuild_dedup_keys_command():
+        """Recompute duplicate-detection keys, e.g. after cards were edited outside the app."""
+        from app.models.database import get_db_connection
+        conn = get_db_connection()
+        try:
+            count = rebuild_dedup_keys(conn)
+        finally:
+            conn.close()
+        click.echo(f"Updated {count} cards")
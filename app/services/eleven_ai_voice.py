@@ -1,47 +1,337 @@
 
 import os
-import base64
+import hashlib
+import json
+import logging
+import threading
+import time
+import unicodedata
+from contextlib import contextmanager
+from functools import partial
+from typing import Dict, Iterator, Optional
+import click
 from dotenv import load_dotenv
 from elevenlabs import VoiceSettings
 from elevenlabs.client import ElevenLabs
 from elevenlabs.play import play
+from flask import current_app
 from app.services.ai_integration import enhance_flashcard
+from app.services.audio_store import get_audio_store
+from app.services.cache import PersistentCache
+from app.services.jobs import register_job
+from app.services.metrics import observe_external, track_external
+from app.services.tts_stub import StubElevenLabsClient
 load_dotenv(dotenv_path="../")
 
+logger = logging.getLogger(__name__)
+
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
-elevenlabs = ElevenLabs(
-    api_key=ELEVENLABS_API_KEY,
-)
+# Set TTS_USE_STUB=1 to synthesize fake audio without network access
+TTS_USE_STUB = os.getenv("TTS_USE_STUB", "").lower() in ("1", "true", "yes")
+
+_elevenlabs_client = None
+_elevenlabs_pid = None
+_client_lock = threading.Lock()
+
+
+def get_elevenlabs_client():
+    """
+    ElevenLabs client shared by every request in this process, built on
+    first use (and again after fork) rather than at import time.
+    """
+    global _elevenlabs_client, _elevenlabs_pid
+    if _elevenlabs_client is None or _elevenlabs_pid != os.getpid():
+        with _client_lock:
+            if _elevenlabs_client is None or _elevenlabs_pid != os.getpid():
+                if TTS_USE_STUB:
+                    _elevenlabs_client = StubElevenLabsClient()
+                else:
+                    _elevenlabs_client = ElevenLabs(api_key=ELEVENLABS_API_KEY)
+                _elevenlabs_pid = os.getpid()
+    return _elevenlabs_client
+
+VOICE_ID = "fQj4gJSexpu8RDE2Ii5m"
+MODEL_ID = "eleven_turbo_v2_5"
+OUTPUT_FORMAT = "mp3_22050_32"
+VOICE_SETTINGS = {
+    "stability": 0.0,
+    "similarity_boost": 1.0,
+    "style": 0.0,
+    "use_speaker_boost": True,
+    "speed": 0.8,
+}
+# Read size when a cached clip is streamed back from the audio store
+STREAM_CHUNK_SIZE = 16 * 1024
+# Hashes looked up per query when checking evicted clips against cards
+RELEASE_CHUNK = 500
+
+_tts_cache = None
+# Set by init_app(): TTS_CACHE_PATH, or tts_cache.db in the instance folder
+_tts_cache_path = None
+
+
+def get_tts_cache() -> PersistentCache:
+    """
+    Audio store hash of each synthesized clip, shared by all workers
+    through TTS_CACHE_PATH (default <instance>/tts_cache.db). The MP3
+    itself lives only in the audio store, but each entry counts the clip's
+    size, so the cache is trimmed LRU-first to TTS_CACHE_MAX_BYTES of audio
+    (and TTS_CACHE_MAX_ENTRIES) and evicted clips no card uses are deleted
+    from the store.
+    """
+    global _tts_cache
+    if _tts_cache is None:
+        if _tts_cache_path is None:
+            raise RuntimeError("eleven_ai_voice.init_app() has not been called")
+        _tts_cache = PersistentCache(
+            _tts_cache_path,
+            table="tts_audio",
+            max_entries=int(os.getenv("TTS_CACHE_MAX_ENTRIES", 100000)),
+            max_bytes=int(os.getenv("TTS_CACHE_MAX_BYTES", 256 * 1024 * 1024)),
+            memory_entries=int(os.getenv("TTS_CACHE_MEMORY_ENTRIES", 4096)),
+            on_evict=partial(_release_evicted_audio, current_app._get_current_object()),
+        )
+    return _tts_cache
+
+
+def _release_evicted_audio(app, entries) -> None:
+    """Delete the clips of evicted cache entries from the audio store unless a card uses them"""
+    from app.models.database import get_db_connection
+    hashes = list({audio_hash for _, audio_hash in entries if isinstance(audio_hash, str)})
+    if not hashes:
+        return
+    # Eviction can run after a streamed response's request context is gone
+    with app.app_context():
+        conn = get_db_connection()
+        try:
+            kept = set()
+            for start in range(0, len(hashes), RELEASE_CHUNK):
+                chunk = hashes[start:start + RELEASE_CHUNK]
+                placeholders = ','.join('?' * len(chunk))
+                kept.update(row['audio_hash'] for row in conn.execute(
+                    f'SELECT DISTINCT audio_hash FROM cards WHERE audio_hash IN ({placeholders})', chunk
+                ))
+        finally:
+            conn.close()
+        store = get_audio_store(app)
+        released = [audio_hash for audio_hash in hashes if audio_hash not in kept]
+        for audio_hash in released:
+            store.delete(audio_hash)
+    if released:
+        logger.info("Released evicted audio", extra={'clips': len(released), 'kept': len(kept)})
+
 
-def text_to_speech_(text: str) -> str:
+def tts_cache_key(hanzi: str, voice_id: str = VOICE_ID, model_id: str = MODEL_ID,
+                  output_format: str = OUTPUT_FORMAT, settings: Optional[Dict] = None) -> str:
+    """Key on normalized hanzi plus everything that changes the produced audio"""
+    settings_hash = hashlib.sha256(
+        json.dumps(settings or VOICE_SETTINGS, sort_keys=True).encode("utf-8")
+    ).hexdigest()[:16]
+    normalized = "".join(unicodedata.normalize("NFKC", hanzi).split())
+    payload = json.dumps([normalized, voice_id, model_id, output_format, settings_hash], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# Aggregated latency per voice-generation stage, for this worker
+_stage_lock = threading.Lock()
+_stage_stats = {}
+
+
+def _record_stage(name: str, elapsed_ms: float, timings: Optional[Dict[str, float]]):
+    if timings is not None:
+        timings[name] = round(elapsed_ms, 1)
+    with _stage_lock:
+        stats = _stage_stats.setdefault(name, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+        stats['count'] += 1
+        stats['total_ms'] += elapsed_ms
+        stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+
+
+@contextmanager
+def _timed_stage(name: str, timings: Optional[Dict[str, float]]):
+    start = time.perf_counter()
     try:
+        yield
+    finally:
+        _record_stage(name, (time.perf_counter() - start) * 1000, timings)
+
+
+def voice_latency_stats() -> Dict[str, Dict[str, float]]:
+    """Count, average and max latency of each voice-generation stage"""
+    with _stage_lock:
+        return {
+            name: {
+                'count': stats['count'],
+                'avg_ms': round(stats['total_ms'] / stats['count'], 1),
+                'max_ms': round(stats['max_ms'], 1),
+            }
+            for name, stats in _stage_stats.items()
+        }
+
+
+def resolve_hanzi(text: str, hanzi: Optional[str] = None,
+                  timings: Optional[Dict[str, float]] = None) -> str:
+    """Hanzi to speak: the given one, else a translation of text via Gemini"""
+    if hanzi and hanzi.strip():
+        return hanzi.strip()
+
+    with _timed_stage('translate', timings):
         chinese_text = enhance_flashcard({"english": text, "hanzi": ""})
-        # Enhanced text for TTS: {'status': 'success', 'suggestions': {'hanzi': '你好'}, 'enhanced_data': {'english': 'Hello', 'hanzi': '你好'}, 'message': 'Generated suggestions for 1 fields'}
-        if chinese_text["status"] == "success" and "hanzi" in chinese_text["suggestions"]:
-            chinese_text = chinese_text["suggestions"]["hanzi"]
-        else:
-            chinese_text = text
-        response = elevenlabs.text_to_speech.convert(
-            voice_id="fQj4gJSexpu8RDE2Ii5m",
-            output_format="mp3_22050_32",
-            text=chinese_text,
-            model_id="eleven_turbo_v2_5",
-            voice_settings=VoiceSettings(
-                stability=0.0,
-                similarity_boost=1.0,
-                style=0.0,
-                use_speaker_boost=True,
-                speed=0.8,
-            ),
-        )
-        
-        audio_data = b""
+    # Enhanced text for TTS: {'status': 'success', 'suggestions': {'hanzi': '你好'}, 'enhanced_data': {'english': 'Hello', 'hanzi': '你好'}, 'message': 'Generated suggestions for 1 fields'}
+    if chinese_text["status"] == "success" and "hanzi" in chinese_text["suggestions"]:
+        return chinese_text["suggestions"]["hanzi"]
+    return text
+
+
+def cached_audio_hash(hanzi: str, store, timings: Optional[Dict[str, float]] = None) -> Optional[str]:
+    """Hash of this exact audio in the store, if it has been synthesized before"""
+    with _timed_stage('cache_lookup', timings):
+        audio_hash = get_tts_cache().get(tts_cache_key(hanzi))
+        # The store is the source of truth; a file removed from it is a miss
+        if isinstance(audio_hash, str) and store.exists(audio_hash):
+            return audio_hash
+    return None
+
+
+def synthesize(hanzi: str, store, timings: Optional[Dict[str, float]] = None,
+               use_cache: bool = True) -> str:
+    """
+    Synthesize hanzi into the audio store and return the audio hash,
+    skipping ElevenLabs when the TTS cache already points at this audio.
+    Chunks go straight to the store's writer, never into one buffer.
+    """
+    if use_cache:
+        audio_hash = cached_audio_hash(hanzi, store, timings)
+        if audio_hash is not None:
+            return audio_hash
+
+    writer = store.writer()
+    try:
+        with _timed_stage('synthesize', timings), track_external('elevenlabs', 'convert'):
+            response = get_elevenlabs_client().text_to_speech.convert(
+                voice_id=VOICE_ID,
+                output_format=OUTPUT_FORMAT,
+                text=hanzi,
+                model_id=MODEL_ID,
+                voice_settings=VoiceSettings(**VOICE_SETTINGS),
+            )
+            for chunk in response:
+                writer.write(chunk)
+        if writer.size == 0:
+            raise ValueError("No audio returned")
+    except BaseException:
+        writer.abort()
+        raise
+    audio_hash = writer.commit()
+
+    logger.info("Synthesized audio", extra={'hanzi': hanzi, 'bytes': writer.size})
+    if use_cache:
+        get_tts_cache().set(tts_cache_key(hanzi), audio_hash, size=writer.size)
+    return audio_hash
+
+
+def stream_speech(hanzi: str, store, timings: Optional[Dict[str, float]] = None) -> Iterator[bytes]:
+    """
+    Yield MP3 chunks for hanzi as ElevenLabs produces them.
+
+    Chunks are also written to the audio store as they pass through; once
+    the stream completes the audio is committed there and its hash added to
+    the TTS cache. A cache hit is read back from the store in chunks without
+    calling ElevenLabs. An interrupted stream leaves nothing behind.
+    """
+    audio_hash = cached_audio_hash(hanzi, store, timings)
+    if audio_hash is not None:
+        with store.open(audio_hash) as f:
+            yield from iter(lambda: f.read(STREAM_CHUNK_SIZE), b'')
+        return
+
+    start = time.perf_counter()
+    response = get_elevenlabs_client().text_to_speech.stream(
+        voice_id=VOICE_ID,
+        output_format=OUTPUT_FORMAT,
+        text=hanzi,
+        model_id=MODEL_ID,
+        voice_settings=VoiceSettings(**VOICE_SETTINGS),
+    )
+    writer = store.writer()
+    completed = False
+    try:
         for chunk in response:
-            audio_data += chunk
-        
-        print(f"Generated audio content of length: {len(audio_data)} bytes")
-        return base64.b64encode(audio_data).decode("utf-8")
-        
+            if not chunk:
+                continue
+            if writer.size == 0 and timings is not None:
+                timings['first_chunk'] = round((time.perf_counter() - start) * 1000, 1)
+            writer.write(chunk)
+            yield chunk
+        completed = writer.size > 0
+    finally:
+        if completed:
+            audio_hash = writer.commit()
+            get_tts_cache().set(tts_cache_key(hanzi), audio_hash, size=writer.size)
+            logger.info("Streamed audio", extra={'hanzi': hanzi, 'bytes': writer.size})
+        else:
+            writer.abort()
+        elapsed = time.perf_counter() - start
+        _record_stage('stream', elapsed * 1000, timings)
+        observe_external('elevenlabs', 'stream', 'success' if completed else 'error', elapsed)
+
+
+def text_to_speech_(text: str, hanzi: Optional[str] = None,
+                    timings: Optional[Dict[str, float]] = None) -> str:
+    """
+    Synthesize Mandarin speech into the audio store and return its hash.
+
+    When hanzi is given the Gemini translation step is skipped entirely.
+    If a timings dict is passed, per-stage latencies (ms) are written to it.
+    """
+    try:
+        chinese_text = resolve_hanzi(text, hanzi, timings)
+        return synthesize(chinese_text, get_audio_store(), timings)
     except Exception as e:
-        print(f"Error in text_to_speech_: {str(e)}")
-        raise Exception(f"Failed to generate audio: {str(e)}")
\ No newline at end of file
+        logger.exception("Error in text_to_speech_")
+        raise Exception(f"Failed to generate audio: {str(e)}")
+
+
+@register_job('generate_voice')
+def generate_voice_job(job_id: str, text: str = '', hanzi: Optional[str] = None) -> Dict[str, object]:
+    """Job handler: synthesize into the audio store and return the hash"""
+    timings = {}
+    audio_hash = text_to_speech_(text, hanzi=hanzi, timings=timings)
+    return {'audio_hash': audio_hash, 'timings_ms': timings}
+
+
+def warm_tts_cache(conn, deck_id: int) -> Dict[str, int]:
+    """Synthesize and cache audio for every active card in a deck"""
+    store = get_audio_store()
+    result = {'cached': 0, 'synthesized': 0, 'failed': 0}
+    hanzi_list = [row['hanzi'] for row in conn.execute(
+        'SELECT DISTINCT hanzi FROM cards WHERE deck_id = ? AND is_archived = FALSE', (deck_id,)
+    )]
+    for hanzi in hanzi_list:
+        if cached_audio_hash(hanzi, store) is not None:
+            result['cached'] += 1
+            continue
+        try:
+            synthesize(hanzi, store)
+            result['synthesized'] += 1
+        except Exception as e:
+            result['failed'] += 1
+            logger.warning("Failed to synthesize", extra={'hanzi': hanzi, 'error': str(e)})
+    return result
+
+
+def init_app(app):
+    global _tts_cache_path
+    _tts_cache_path = app.config.get('TTS_CACHE_PATH') or os.path.join(app.instance_path, 'tts_cache.db')
+
+    @app.cli.command('warm-tts')
+    @click.argument('deck_id', type=int)
+    def warm_tts_command(deck_id):
+        """Pre-synthesize pronunciation audio for every card in DECK_ID."""
+        from app.models.database import get_db_connection
+        conn = get_db_connection()
+        try:
+            result = warm_tts_cache(conn, deck_id)
+        finally:
+            conn.close()
+        click.echo(f"Deck {deck_id}: {result['synthesized']} synthesized, "
+                   f"{result['cached']} already cached, {result['failed']} failed")
@@ -0,0 +1,207 @@
+"""
+Streaming deck and collection export.
+
+Every format is a generator of output chunks: rows come out of SQLite with
+fetchmany() and audio files are copied from the audio store in blocks, so
+memory stays flat however large the collection is. Audio is never inlined
+into card rows; it follows them as entries of its own.
+
+- ndjson: one JSON object per line ({"type": "deck"|"card"|"audio", ...})
+- csv:    cards only, with headers the importer understands
+- sqlite: a zip holding a sqlite3 backup-API snapshot plus audio/<hash>.mp3
+"""
+import base64
+import csv
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import zipfile
+from typing import Any, Dict, Iterator, Optional
+
+from app.services.importer import IMPORT_FIELDS
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+    'sqlite': ('application/zip', 'zip'),
+}
+EXPORT_FETCH_SIZE = 500
+COPY_CHUNK_SIZE = 64 * 1024
+
+CARD_EXPORT_COLUMNS = ('id', 'deck_id', *IMPORT_FIELDS, 'audio_hash', 'is_archived', 'created_at', 'updated_at')
+PROGRESS_EXPORT_COLUMNS = ('srs_level', 'next_review', 'interval_days', 'ease_factor', 'repetitions',
+                           'total_reviews', 'correct_reviews', 'last_reviewed')
+
+# Tables whose rows belong to a deck; everything else is dropped from a deck snapshot
+_DECK_TABLES = ('cards', 'card_progress', 'review_log', 'study_sessions', 'deck_stats')
+
+
+def iter_rows(conn, sql: str, params=(), size: int = EXPORT_FETCH_SIZE) -> Iterator[sqlite3.Row]:
+    """Rows of a query, fetched `size` at a time"""
+    cursor = conn.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield from rows
+
+
+def _scope(deck_id: Optional[int], include_archived: bool, alias: str = 'c'):
+    """WHERE clause and params selecting the exported cards"""
+    clauses, params = [], []
+    if deck_id is not None:
+        clauses.append(f'{alias}.deck_id = ?')
+        params.append(deck_id)
+    if not include_archived:
+        clauses.append(f'{alias}.is_archived = FALSE')
+    return ('WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+
+def iter_cards(conn, deck_id: Optional[int] = None, include_archived: bool = False) -> Iterator[sqlite3.Row]:
+    where, params = _scope(deck_id, include_archived)
+    columns = ', '.join([*(f'c.{column}' for column in CARD_EXPORT_COLUMNS),
+                         *(f'cp.{column}' for column in PROGRESS_EXPORT_COLUMNS)])
+    return iter_rows(conn, f'''
+        SELECT {columns}
+        FROM cards c
+        LEFT JOIN card_progress cp ON cp.card_id = c.id
+        {where}
+        ORDER BY c.id
+    ''', params)
+
+
+def iter_audio_hashes(conn, deck_id: Optional[int] = None, include_archived: bool = False) -> Iterator[str]:
+    where, params = _scope(deck_id, include_archived)
+    where = f"{where} AND c.audio_hash IS NOT NULL" if where else 'WHERE c.audio_hash IS NOT NULL'
+    for row in iter_rows(conn, f'SELECT DISTINCT c.audio_hash FROM cards c {where}', params):
+        yield row[0]
+
+
+def _iter_decks(conn, deck_id: Optional[int]) -> Iterator[sqlite3.Row]:
+    if deck_id is None:
+        return iter_rows(conn, 'SELECT * FROM decks ORDER BY id')
+    return iter_rows(conn, 'SELECT * FROM decks WHERE id = ?', (deck_id,))
+
+
+def _iter_file(path, size: int = COPY_CHUNK_SIZE) -> Iterator[bytes]:
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def export_ndjson(conn, store, deck_id: Optional[int] = None, include_archived: bool = False,
+                  include_audio: bool = True) -> Iterator[bytes]:
+    for deck in _iter_decks(conn, deck_id):
+        yield json.dumps({'type': 'deck', **dict(deck)}, ensure_ascii=False, default=str).encode('utf-8') + b'\n'
+    for card in iter_cards(conn, deck_id, include_archived):
+        yield json.dumps({'type': 'card', **dict(card)}, ensure_ascii=False, default=str).encode('utf-8') + b'\n'
+    if not include_audio:
+        return
+    for audio_hash in iter_audio_hashes(conn, deck_id, include_archived):
+        path = store.path_for(audio_hash)
+        if not path.is_file():
+            continue
+        # One clip per line: only a single clip is ever held in memory
+        data = base64.b64encode(path.read_bytes()).decode('ascii')
+        yield json.dumps({'type': 'audio', 'hash': audio_hash, 'data': data}).encode('utf-8') + b'\n'
+
+
+def export_csv(conn, deck_id: Optional[int] = None, include_archived: bool = False) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # Written with a BOM so spreadsheet apps detect UTF-8; the importer strips it
+    writer.writerow([*CARD_EXPORT_COLUMNS, *PROGRESS_EXPORT_COLUMNS])
+    yield ('\ufeff' + buffer.getvalue()).encode('utf-8')
+    for card in iter_cards(conn, deck_id, include_archived):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(['' if value is None else value for value in card])
+        yield buffer.getvalue().encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    """Unseekable file that collects whatever zipfile writes, for streaming"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _snapshot(conn, path: str, deck_id: Optional[int]) -> None:
+    """Copy the database to path with the backup API, optionally cut down to one deck"""
+    target = sqlite3.connect(path)
+    try:
+        # Copied in steps so writers are not held off for the whole copy
+        conn.backup(target, pages=1024)
+        if deck_id is not None:
+            for table in _DECK_TABLES:
+                target.execute(f'DELETE FROM {table} WHERE deck_id != ?', (deck_id,))
+            target.execute('DELETE FROM decks WHERE id != ?', (deck_id,))
+            target.execute('DELETE FROM review_submissions WHERE card_id NOT IN (SELECT id FROM cards)')
+            target.execute('DELETE FROM jobs')
+            target.commit()
+            target.execute('VACUUM')
+        target.execute('PRAGMA journal_mode = DELETE')
+    finally:
+        target.close()
+
+
+def export_sqlite(conn, store, deck_id: Optional[int] = None, include_audio: bool = True) -> Iterator[bytes]:
+    sink = _ChunkSink()
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot_path = os.path.join(tmp, 'collection.sqlite')
+        _snapshot(conn, snapshot_path, deck_id)
+
+        with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            with archive.open('collection.sqlite', 'w', force_zip64=True) as entry:
+                for chunk in _iter_file(snapshot_path):
+                    entry.write(chunk)
+                    yield sink.drain()
+            os.unlink(snapshot_path)
+
+            if include_audio:
+                # MP3 does not compress, so audio entries are stored as-is
+                for audio_hash in iter_audio_hashes(conn, deck_id, include_archived=True):
+                    path = store.path_for(audio_hash)
+                    if not path.is_file():
+                        continue
+                    info = zipfile.ZipInfo(f'audio/{audio_hash}.mp3')
+                    info.compress_type = zipfile.ZIP_STORED
+                    with archive.open(info, 'w') as entry:
+                        for chunk in _iter_file(path):
+                            entry.write(chunk)
+                            yield sink.drain()
+        yield sink.drain()
+
+
+def export_stream(conn, store, fmt: str, deck_id: Optional[int] = None, include_archived: bool = False,
+                  include_audio: bool = True) -> Iterator[bytes]:
+    """Chunks of an export in `fmt` (one of EXPORT_FORMATS)"""
+    if fmt == 'ndjson':
+        return export_ndjson(conn, store, deck_id, include_archived, include_audio)
+    if fmt == 'csv':
+        return export_csv(conn, deck_id, include_archived)
+    if fmt == 'sqlite':
+        return export_sqlite(conn, store, deck_id, include_audio)
+    raise ValueError(f'Unknown export format: {fmt}')
+
+
+def export_filename(fmt: str, deck: Optional[Dict[str, Any]] = None) -> str:
+    name = f"deck-{deck['id']}" if deck else 'collection'
+    return f'{name}.{EXPORT_FORMATS[fmt][1]}'
@@ -0,0 +1,252 @@
+"""
+Bulk card import from CSV/TSV files and Anki .apkg exports.
+
+Rows are parsed lazily by generators and written in executemany batches
+inside one transaction, so a 5,000-word list costs one commit instead of
+5,000 requests. Cards already in the deck (same dedup_key, i.e. the same
+normalized hanzi and pinyin, so heteronyms such as 行 xíng / háng are
+both kept) are skipped, and a bad row is reported with its line number
+instead of failing the whole import.
+"""
+import csv
+import html
+import io
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import zipfile
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import click
+
+from app.services.search import index_cards
+from app.utils.pinyin import card_key
+
+IMPORT_FIELDS = ('hanzi', 'pinyin', 'english', 'traditional', 'measure_word',
+                 'part_of_speech', 'example_sentence', 'notes')
+IMPORT_FORMATS = ('csv', 'tsv', 'apkg')
+DEFAULT_BATCH_SIZE = 500
+# Only this many row errors are listed in the report; all are counted
+MAX_REPORTED_ERRORS = 100
+
+# Header / Anki field name -> card column
+FIELD_ALIASES = {
+    'hanzi': 'hanzi', 'chinese': 'hanzi', 'simplified': 'hanzi', 'character': 'hanzi',
+    'characters': 'hanzi', 'word': 'hanzi', 'front': 'hanzi', '汉字': 'hanzi', '简体': 'hanzi',
+    'pinyin': 'pinyin', 'reading': 'pinyin', '拼音': 'pinyin',
+    'english': 'english', 'meaning': 'english', 'definition': 'english', 'translation': 'english',
+    'back': 'english',
+    'traditional': 'traditional', '繁體': 'traditional',
+    'measure_word': 'measure_word', 'measure word': 'measure_word', 'classifier': 'measure_word',
+    'part_of_speech': 'part_of_speech', 'part of speech': 'part_of_speech', 'pos': 'part_of_speech',
+    'example_sentence': 'example_sentence', 'example': 'example_sentence', 'sentence': 'example_sentence',
+    'notes': 'notes', 'note': 'notes',
+}
+# Column order assumed for files without a recognizable header
+POSITIONAL_FIELDS = ('hanzi', 'pinyin', 'english')
+
+_CARD_INSERT_SQL = '''
+    INSERT INTO cards (deck_id, {columns}, dedup_key) VALUES (?, {placeholders}, ?)
+'''.format(columns=', '.join(IMPORT_FIELDS), placeholders=', '.join('?' * len(IMPORT_FIELDS)))
+
+_TAG_RE = re.compile(r'<[^>]+>')
+_SOUND_RE = re.compile(r'\[sound:[^\]]*\]')
+
+# (line number, card fields)
+Row = Tuple[int, Dict[str, str]]
+
+
+class DeckNotFound(LookupError):
+    """import_cards() was pointed at a deck that does not exist"""
+
+
+def _map_header(names: Iterable[str]) -> Optional[List[Optional[str]]]:
+    """Card column per header name, or None if this does not look like a header"""
+    mapped = [FIELD_ALIASES.get(name.strip().lower()) for name in names]
+    return mapped if 'hanzi' in mapped else None
+
+
+def _card_fields(columns: List[Optional[str]], values: List[str]) -> Dict[str, str]:
+    fields = {}
+    for column, value in zip(columns, values):
+        if column and value and value.strip() and column not in fields:
+            fields[column] = value.strip()
+    return fields
+
+
+def iter_delimited_rows(stream: io.TextIOBase, delimiter: str) -> Iterator[Row]:
+    """
+    Rows of a CSV/TSV text stream. A first row naming a hanzi column is
+    used as the header; otherwise columns are hanzi, pinyin, english.
+    """
+    reader = csv.reader(stream, delimiter=delimiter)
+    columns = None
+    for values in reader:
+        line = reader.line_num
+        if not any(value.strip() for value in values) or values[0].lstrip().startswith('#'):
+            continue  # Blank lines and comments (Anki text exports start with #)
+        if columns is None:
+            columns = _map_header(values)
+            if columns is not None:
+                continue
+            columns = list(POSITIONAL_FIELDS)
+        yield line, _card_fields(columns, values)
+
+
+def _clean_anki_field(value: str) -> str:
+    value = _SOUND_RE.sub('', value)
+    value = re.sub(r'<br\s*/?>', '\n', value, flags=re.IGNORECASE)
+    return html.unescape(_TAG_RE.sub('', value)).replace('\xa0', ' ').strip()
+
+
+def iter_apkg_rows(path: str) -> Iterator[Row]:
+    """
+    Notes of an Anki .apkg export, one row per note. Fields are mapped by
+    their names in the note type, falling back to hanzi, pinyin, english
+    by position. Only the legacy collection format is readable; exports
+    made with "Support older Anki versions" unticked are rejected.
+    """
+    try:
+        archive = zipfile.ZipFile(path)
+    except zipfile.BadZipFile as e:
+        raise ValueError(f'Not an Anki package: {e}')
+    with archive:
+        names = set(archive.namelist())
+        member = next((name for name in ('collection.anki21', 'collection.anki2') if name in names), None)
+        if member is None or ('collection.anki21b' in names and member == 'collection.anki2'):
+            # anki21b packages only carry a placeholder collection.anki2
+            raise ValueError('Unsupported Anki package; export with "Support older Anki versions" ticked')
+
+        with tempfile.TemporaryDirectory() as tmp:
+            collection = archive.extract(member, tmp)
+            conn = sqlite3.connect(collection)
+            try:
+                models = json.loads(conn.execute('SELECT models FROM col').fetchone()[0] or '{}')
+                columns_by_model = {}
+                for model_id, model in models.items():
+                    field_names = [field['name'] for field in sorted(model.get('flds', []), key=lambda f: f['ord'])]
+                    columns_by_model[str(model_id)] = _map_header(field_names) or list(POSITIONAL_FIELDS)
+
+                for number, (model_id, flds) in enumerate(conn.execute('SELECT mid, flds FROM notes ORDER BY id'), 1):
+                    columns = columns_by_model.get(str(model_id), list(POSITIONAL_FIELDS))
+                    values = [_clean_anki_field(value) for value in flds.split('\x1f')]
+                    yield number, _card_fields(columns, values)
+            except sqlite3.DatabaseError as e:
+                raise ValueError(f'Unreadable Anki collection: {e}')
+            except (KeyError, TypeError, AttributeError) as e:
+                # Models or notes missing the fields every Anki version writes
+                raise ValueError('Unreadable Anki collection') from e
+            finally:
+                conn.close()
+
+
+def detect_format(filename: str) -> Optional[str]:
+    extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    if extension == 'txt':
+        return 'tsv'  # Anki's "notes in plain text" export
+    return extension if extension in IMPORT_FORMATS else None
+
+
+def iter_file_rows(fileobj, fmt: str, path: Optional[str] = None) -> Iterator[Row]:
+    """Rows of an uploaded/opened file; apkg needs a real path (it is a zip)"""
+    if fmt == 'apkg':
+        return iter_apkg_rows(path)
+    stream = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    return iter_delimited_rows(stream, '\t' if fmt == 'tsv' else ',')
+
+
+def import_cards(conn, deck_id: int, rows: Iterable[Row], batch_size: int = DEFAULT_BATCH_SIZE) -> Dict[str, Any]:
+    """
+    Insert cards (and their card_progress) from rows into a deck in one
+    transaction. Rows whose dedup_key is already active in the deck, or
+    earlier in the file, are counted as duplicates. Raises DeckNotFound for
+    an unknown deck; an error raised by the row source rolls the import back.
+    """
+    result = {'rows': 0, 'imported': 0, 'duplicates': 0, 'error_count': 0, 'errors': []}
+
+    def reject(line, error):
+        result['error_count'] += 1
+        if len(result['errors']) < MAX_REPORTED_ERRORS:
+            result['errors'].append({'line': line, 'error': error})
+
+    def write(batch):
+        keys = [card_key(fields['hanzi'], fields.get('pinyin', '')) for _, fields in batch]
+        placeholders = ','.join('?' * len(keys))
+        existing = {row[0] for row in conn.execute(f'''
+            SELECT dedup_key FROM cards WHERE dedup_key IN ({placeholders}) AND deck_id = ? AND is_archived = FALSE
+        ''', [*keys, deck_id])}
+        fresh = []
+        for (_, fields), key in zip(batch, keys):
+            if key in existing:
+                result['duplicates'] += 1
+            else:
+                existing.add(key)
+                fresh.append((deck_id, *(fields.get(field, '') for field in IMPORT_FIELDS), key))
+
+        # The write lock is held, so every card above last_id is from this batch
+        last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM cards').fetchone()[0]
+        conn.executemany(_CARD_INSERT_SQL, fresh)
+        inserted = conn.execute('''
+            INSERT INTO card_progress (card_id, deck_id, srs_level, next_review)
+            SELECT id, deck_id, 0, datetime('now') FROM cards WHERE id > ? AND deck_id = ?
+        ''', (last_id, deck_id)).rowcount
+        index_cards(conn, [row[0] for row in conn.execute(
+            'SELECT id FROM cards WHERE id > ? AND deck_id = ?', (last_id, deck_id))])
+        result['imported'] += inserted
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if not conn.execute('SELECT 1 FROM decks WHERE id = ?', (deck_id,)).fetchone():
+            raise DeckNotFound('Deck not found')
+
+        batch = []
+        for line, fields in rows:
+            result['rows'] += 1
+            if not fields.get('hanzi') or not fields.get('english'):
+                reject(line, 'Hanzi and English are required')
+                continue
+            batch.append((line, fields))
+            if len(batch) >= batch_size:
+                write(batch)
+                batch = []
+        if batch:
+            write(batch)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return result
+
+
+def init_app(app):
+    @app.cli.command('import-cards')
+    @click.argument('deck_id', type=int)
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'fmt', type=click.Choice(IMPORT_FORMATS),
+                  help='File format; guessed from the extension by default.')
+    @click.option('--batch-size', default=DEFAULT_BATCH_SIZE, show_default=True,
+                  help='Cards inserted per executemany batch.')
+    def import_cards_command(deck_id, path, fmt, batch_size):
+        """Import cards from a CSV/TSV file or Anki .apkg into DECK_ID."""
+        from app.models.database import get_db_connection
+        from app.services.dashboard_service import invalidate_dashboard_cache
+        fmt = fmt or detect_format(path)
+        if fmt is None:
+            raise click.UsageError('Unknown file type; pass --format')
+
+        conn = get_db_connection()
+        try:
+            with open(path, 'rb') as f:
+                result = import_cards(conn, deck_id, iter_file_rows(f, fmt, path), batch_size)
+        except (DeckNotFound, ValueError, UnicodeDecodeError, csv.Error) as e:
+            raise click.ClickException(str(e))
+        finally:
+            conn.close()
+        invalidate_dashboard_cache()
+
+        for error in result['errors']:
+            click.echo(f"line {error['line']}: {error['error']}")
+        click.echo(f"Deck {deck_id}: {result['imported']} imported, {result['duplicates']} duplicates, "
+                   f"{result['error_count']} errors out of {result['rows']} rows")
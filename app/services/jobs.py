@@ -0,0 +1,287 @@
+"""
+Background jobs for slow AI/TTS work.
+
+Jobs are rows in the jobs table, so any gunicorn worker can report their
+status, and they run on a small per-process thread pool instead of the
+request worker. Identical jobs submitted while one is still queued or
+running get the existing job's id (single-flight), enforced across
+workers by the partial unique index on jobs.dedup_key.
+
+A queued job only lives in the thread pool of the process that created it
+(jobs.worker). When a worker starts its pool it fails the jobs of local
+workers that have exited, and `flask abandon-jobs` fails every unfinished
+job before a restarted server takes requests.
+"""
+import hashlib
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import click
+from flask import current_app
+
+from app.models.database import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+JOB_FIELDS = ('status', 'progress', 'total', 'result', 'error')
+DEFAULT_JOB_WORKERS = 4
+# A running job whose heartbeat (updated_at) is this old is assumed lost
+STALE_JOB_SECONDS = 15 * 60
+# Finished jobs are pruned after this long
+JOB_RETENTION_DAYS = 7
+
+# kind -> handler(job_id, **params) returning a JSON-serializable result
+JOB_HANDLERS: Dict[str, Callable[..., Any]] = {}
+
+
+def register_job(kind: str):
+    """Decorator registering a job handler under `kind`"""
+    def decorator(handler):
+        JOB_HANDLERS[kind] = handler
+        return handler
+    return decorator
+
+
+def job_dedup_key(kind: str, params: Dict[str, Any]) -> str:
+    payload = json.dumps([kind, params], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def create_job(conn, kind: str, params: Optional[Dict[str, Any]] = None, total: int = 0,
+               dedup_key: Optional[str] = None, worker: Optional[str] = None) -> Tuple[str, bool]:
+    """
+    Record a queued job. Returns (job_id, created); created is False when
+    an identical job (same dedup_key) is already queued or running.
+
+    Queued jobs are never swept here: one may wait behind a busy pool for
+    any length of time, and its row is what keeps duplicates out.
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute(f'''
+            UPDATE jobs SET status = 'failed', error = 'Abandoned', updated_at = CURRENT_TIMESTAMP
+            WHERE status = 'running' AND updated_at < datetime('now', '-{STALE_JOB_SECONDS} seconds')
+        ''')
+        conn.execute(f'''
+            DELETE FROM jobs
+            WHERE status IN ('done', 'failed') AND updated_at < datetime('now', '-{JOB_RETENTION_DAYS} days')
+        ''')
+        if dedup_key:
+            row = conn.execute('''
+                SELECT id FROM jobs WHERE dedup_key = ? AND status IN ('queued', 'running')
+            ''', (dedup_key,)).fetchone()
+            if row:
+                conn.commit()
+                return row['id'], False
+
+        job_id = uuid.uuid4().hex
+        conn.execute(
+            'INSERT INTO jobs (id, kind, params, total, dedup_key, worker) VALUES (?, ?, ?, ?, ?, ?)',
+            (job_id, kind, json.dumps(params or {}, ensure_ascii=False), total, dedup_key, worker),
+        )
+        conn.commit()
+        return job_id, True
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def update_job(conn, job_id: str, **fields) -> None:
+    """Set any of JOB_FIELDS on a job; result is stored as JSON"""
+    unknown = set(fields) - set(JOB_FIELDS)
+    if unknown:
+        raise ValueError(f'Unknown job fields: {sorted(unknown)}')
+    if 'result' in fields:
+        fields['result'] = json.dumps(fields['result'], ensure_ascii=False)
+
+    assignments = ', '.join(f'{field} = ?' for field in fields)
+    conn.execute(
+        f'UPDATE jobs SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+        (*fields.values(), job_id),
+    )
+    conn.commit()
+
+
+def get_job(conn, job_id: str) -> Optional[Dict[str, Any]]:
+    row = conn.execute('''
+        SELECT id, kind, status, progress, total, params, result, error, created_at, updated_at
+        FROM jobs WHERE id = ?
+    ''', (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = dict(row)
+    job['params'] = json.loads(job['params']) if job['params'] else {}
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    return job
+
+
+def _worker_exited(worker: str) -> bool:
+    """Whether the host:pid that owns a job is known to be gone"""
+    host, _, pid = worker.rpartition(':')
+    if host != socket.gethostname() or not pid.isdigit():
+        return False  # Another host's workers cannot be checked from here
+    if int(pid) == os.getpid():
+        return True  # Only called before this process queues anything
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def abandon_jobs(conn, all_workers: bool = False) -> int:
+    """
+    Fail unfinished jobs whose process has exited, or every unfinished job
+    with all_workers (when no worker is running yet). Returns the count.
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        rows = conn.execute(
+            "SELECT id, worker FROM jobs WHERE status IN ('queued', 'running')"
+        ).fetchall()
+        abandoned = [(row['id'],) for row in rows
+                     if all_workers or (row['worker'] and _worker_exited(row['worker']))]
+        conn.executemany('''
+            UPDATE jobs SET status = 'failed', error = 'Abandoned', updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', abandoned)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if abandoned:
+        logger.warning("Abandoned unfinished jobs", extra={'jobs': len(abandoned)})
+    return len(abandoned)
+
+
+def set_job_progress(job_id: str, progress: int, total: Optional[int] = None) -> None:
+    """Progress update from inside a running job (needs an app context)"""
+    fields = {'progress': progress}
+    if total is not None:
+        fields['total'] = total
+    conn = get_db_connection()
+    try:
+        update_job(conn, job_id, **fields)
+    finally:
+        conn.close()
+
+
+class JobQueue:
+    """
+    Per-process pool of job runner threads.
+
+    Each job runs its handler inside an app context; the return value
+    becomes the job result and an exception marks the job failed.
+    """
+
+    def __init__(self, app, workers: int = DEFAULT_JOB_WORKERS):
+        self.app = app
+        self.workers = workers
+        self.pid = os.getpid()
+        self.worker = f'{socket.gethostname()}:{self.pid}'
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self._lock = threading.Lock()
+        self._active = 0
+        self._stats = {'submitted': 0, 'deduplicated': 0, 'done': 0, 'failed': 0}
+
+    def submit(self, kind: str, params: Optional[Dict[str, Any]] = None,
+               dedupe: bool = True) -> Tuple[str, bool]:
+        """Queue a job and return (job_id, created)"""
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f'Unknown job kind: {kind}')
+        params = params or {}
+        dedup_key = job_dedup_key(kind, params) if dedupe else None
+
+        conn = get_db_connection()
+        try:
+            job_id, created = create_job(conn, kind, params, dedup_key=dedup_key, worker=self.worker)
+        finally:
+            conn.close()
+
+        with self._lock:
+            self._stats['submitted' if created else 'deduplicated'] += 1
+            if created:
+                self._active += 1
+        if created:
+            self._executor.submit(self._run, job_id, kind, params)
+        return job_id, created
+
+    def _run(self, job_id: str, kind: str, params: Dict[str, Any]) -> None:
+        outcome = 'failed'
+        try:
+            with self.app.app_context():
+                conn = get_db_connection()
+                try:
+                    update_job(conn, job_id, status='running')
+                    try:
+                        result = JOB_HANDLERS[kind](job_id, **params)
+                    except Exception as e:
+                        logger.exception("Job failed", extra={'job_id': job_id, 'kind': kind})
+                        update_job(conn, job_id, status='failed', error=str(e))
+                    else:
+                        update_job(conn, job_id, status='done', result=result)
+                        outcome = 'done'
+                finally:
+                    conn.close()
+        except sqlite3.Error:
+            logger.exception("Could not record job status", extra={'job_id': job_id, 'kind': kind})
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._stats[outcome] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'pid': self.pid, 'workers': self.workers, 'active': self._active, **self._stats}
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+
+_queue_lock = threading.Lock()
+
+
+def get_job_queue(app=None) -> JobQueue:
+    """This worker's job queue, created on first use (and again after fork)"""
+    app = app or current_app._get_current_object()
+    job_queue = app.extensions.get('job_queue')
+    if job_queue is not None and job_queue.pid == os.getpid():
+        return job_queue
+
+    with _queue_lock:
+        job_queue = app.extensions.get('job_queue')
+        if job_queue is None or job_queue.pid != os.getpid():
+            with app.app_context():
+                conn = get_db_connection()
+                try:
+                    abandon_jobs(conn)
+                finally:
+                    conn.close()
+            job_queue = JobQueue(app, app.config.get('JOB_WORKERS', DEFAULT_JOB_WORKERS))
+            app.extensions['job_queue'] = job_queue
+    return job_queue
+
+
+def submit_job(kind: str, params: Optional[Dict[str, Any]] = None, dedupe: bool = True) -> Tuple[str, bool]:
+    return get_job_queue().submit(kind, params, dedupe)
+
+
+def init_app(app):
+    @app.cli.command('abandon-jobs')
+    def abandon_jobs_command():
+        """Fail every queued or running job; run before the workers start."""
+        conn = get_db_connection()
+        try:
+            count = abandon_jobs(conn, all_workers=True)
+        finally:
+            conn.close()
+        click.echo(f"Abandoned {count} jobs")
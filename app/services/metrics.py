@@ -0,0 +1,159 @@
+"""
+Prometheus metrics for requests, SQL and external API calls.
+
+init_app() (called by create_app) times every request by endpoint and
+counts the SQL it runs through the pooled connections handed out by
+get_db_connection. Gemini and ElevenLabs calls report through
+track_external() and count_retry(). GET /metrics renders it all in the
+Prometheus text format.
+
+Gunicorn workers are separate processes, so set PROMETHEUS_MULTIPROC_DIR
+to an empty directory (cleared before the server starts, as the
+Dockerfile does): each worker then writes its samples there and /metrics
+sums them whichever worker answers the scrape. Without it the numbers
+cover this process only, which is what `flask run` wants.
+"""
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from flask import request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+
+# Endpoint label for SQL run outside a request (jobs, CLI commands)
+BACKGROUND = "background"
+
+REQUEST_LATENCY = Histogram(
+    "flashcards_http_request_duration_seconds",
+    "Time from routing a request until its response body has been sent",
+    ["method", "endpoint"],
+)
+REQUESTS = Counter(
+    "flashcards_http_requests", "Requests by endpoint and status code", ["method", "endpoint", "status"],
+)
+REQUEST_DB_QUERIES = Histogram(
+    "flashcards_http_request_db_queries", "SQL statements executed per request", ["endpoint"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 1000),
+)
+REQUEST_DB_SECONDS = Histogram(
+    "flashcards_http_request_db_seconds", "Time spent executing SQL per request", ["endpoint"],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5),
+)
+DB_QUERIES = Counter(
+    "flashcards_db_queries", "SQL statements executed, by endpoint (\"background\" outside requests)", ["endpoint"],
+)
+DB_SECONDS = Counter(
+    "flashcards_db_query_seconds", "Time spent executing SQL, by endpoint", ["endpoint"],
+)
+EXTERNAL_LATENCY = Histogram(
+    "flashcards_external_call_duration_seconds", "Gemini and ElevenLabs API call durations",
+    ["service", "operation", "outcome"],
+    buckets=(.1, .25, .5, 1, 2, 4, 8, 15, 30, 60, 120),
+)
+EXTERNAL_RETRIES = Counter(
+    "flashcards_external_call_retries", "Gemini and ElevenLabs calls retried after a failure",
+    ["service", "operation"],
+)
+
+
+class _RequestMetrics:
+    __slots__ = ("method", "endpoint", "start", "queries", "db_seconds")
+
+    def __init__(self, method: str, endpoint: str):
+        self.method = method
+        self.endpoint = endpoint
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+# Set per request; streamed bodies run in the same thread after the app
+# context is gone, so this lives in a context variable rather than in g
+_current: ContextVar[Optional[_RequestMetrics]] = ContextVar("request_metrics", default=None)
+
+
+_background_queries = DB_QUERIES.labels(BACKGROUND)
+_background_seconds = DB_SECONDS.labels(BACKGROUND)
+
+
+def observe_query(seconds: float) -> None:
+    """Pool hook: one execute()/executemany()/executescript() took `seconds`"""
+    current = _current.get()
+    if current is None:
+        _background_queries.inc()
+        _background_seconds.inc(seconds)
+    else:
+        current.queries += 1
+        current.db_seconds += seconds
+
+
+def _start_request() -> None:
+    _current.set(_RequestMetrics(request.method, request.endpoint or "unmatched"))
+
+
+def _finish_request(response):
+    current = _current.get()
+    if current is not None:
+        status = str(response.status_code)
+        # Runs once the body is sent, so streamed responses are timed in full
+        response.call_on_close(lambda: _observe_request(current, status))
+    return response
+
+
+def _observe_request(current: _RequestMetrics, status: str) -> None:
+    if _current.get() is current:
+        _current.set(None)
+    endpoint = current.endpoint
+    REQUEST_LATENCY.labels(current.method, endpoint).observe(time.perf_counter() - current.start)
+    REQUESTS.labels(current.method, endpoint, status).inc()
+    REQUEST_DB_QUERIES.labels(endpoint).observe(current.queries)
+    REQUEST_DB_SECONDS.labels(endpoint).observe(current.db_seconds)
+    if current.queries:
+        DB_QUERIES.labels(endpoint).inc(current.queries)
+        DB_SECONDS.labels(endpoint).inc(current.db_seconds)
+
+
+@contextmanager
+def track_external(service: str, operation: str):
+    """Time one external API call; outcome is success, timeout or error"""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "success"
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        raise
+    finally:
+        observe_external(service, operation, outcome, time.perf_counter() - start)
+
+
+def observe_external(service: str, operation: str, outcome: str, seconds: float) -> None:
+    """Record a call timed by hand, e.g. a stream consumed across yields"""
+    EXTERNAL_LATENCY.labels(service, operation, outcome).observe(seconds)
+
+
+def count_retry(service: str, operation: str) -> None:
+    EXTERNAL_RETRIES.labels(service, operation).inc()
+
+
+def render_metrics() -> bytes:
+    """Exposition text for every worker (multiprocess mode) or just this process"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def init_app(app):
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    # Picked up by get_pool() when it builds this worker's ConnectionPool
+    app.extensions["db_query_observer"] = observe_query
+
@@ -0,0 +1,224 @@
+"""
+Pure SM-2 scheduling engine.
+
+Nothing in here touches the database: functions take progress state as
+plain data and return the new state, either for a single card (dicts) or
+for many cards at once (NumPy arrays). The route/service layer is
+responsible for loading and persisting the result.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional
+
+import numpy as np
+
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+MASTERED_LEVEL = 3
+# Caps runaway growth so next_review stays a representable date
+MAX_INTERVAL_DAYS = 36500
+SECONDS_PER_DAY = 86400
+
+# Fields of card_progress that the scheduler owns
+STATE_FIELDS = (
+    "srs_level", "ease_factor", "interval_days", "repetitions",
+    "total_reviews", "correct_reviews", "streak_current", "streak_best",
+)
+
+# Below this many cards with reviews left, replay finishes in plain Python;
+# per-step NumPy overhead would dominate for a handful of long histories
+_SCALAR_REPLAY_THRESHOLD = 32
+
+
+def initial_state() -> Dict[str, Any]:
+    """Progress of a card that has never been reviewed"""
+    return {
+        "srs_level": 0,
+        "ease_factor": DEFAULT_EASE,
+        "interval_days": 0,
+        "repetitions": 0,
+        "total_reviews": 0,
+        "correct_reviews": 0,
+        "streak_current": 0,
+        "streak_best": 0,
+    }
+
+
+def _ease_delta(rating):
+    return 0.1 - (5 - rating) * (0.08 + (5 - rating) * 0.02)
+
+
+def _step(srs_level, ease, interval, repetitions, total, correct_total,
+          streak, streak_best, rating):
+    """One SM-2 review on scalars; shared by schedule_review and replay"""
+    correct = rating >= 3
+    if correct:
+        repetitions += 1
+        if repetitions == 1:
+            interval = 1
+        elif repetitions == 2:
+            interval = 6
+        else:
+            interval = min(round(interval * ease), MAX_INTERVAL_DAYS)
+        ease = max(MIN_EASE, ease + _ease_delta(rating))
+        srs_level += 1
+        correct_total += 1
+        streak += 1
+        streak_best = max(streak_best, streak)
+    else:  # Again or Hard - reset
+        repetitions = 0
+        interval = 1
+        srs_level = max(srs_level - 1, 0)
+        streak = 0
+    return srs_level, ease, interval, repetitions, total + 1, correct_total, streak, streak_best
+
+
+def schedule_review(state: Dict[str, Any], rating: int,
+                    reviewed_at: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Compute the progress of one card after a review.
+
+    Args:
+        state: Current progress; missing or NULL fields fall back to the
+            values of a never-reviewed card (a row from card_progress works).
+        rating: 1-4 (Again, Hard, Good, Easy)
+        reviewed_at: Review time (naive UTC); defaults to now
+
+    Returns:
+        A new dict with every STATE_FIELDS entry plus last_reviewed and
+        next_review as datetimes. The input is not modified.
+    """
+    if reviewed_at is None:
+        reviewed_at = datetime.utcnow().replace(microsecond=0)
+
+    current = initial_state()
+    for field in STATE_FIELDS:
+        value = state[field] if field in state.keys() else None
+        if value:
+            current[field] = value
+
+    values = _step(*(current[field] for field in STATE_FIELDS), rating)
+    result = dict(zip(STATE_FIELDS, values))
+    result["last_reviewed"] = reviewed_at
+    result["next_review"] = reviewed_at + timedelta(days=result["interval_days"])
+    return result
+
+
+def _as_state_arrays(state: Dict[str, Any], n: int) -> Dict[str, np.ndarray]:
+    defaults = initial_state()
+    arrays = {}
+    for field in STATE_FIELDS:
+        dtype = np.float64 if field == "ease_factor" else np.int64
+        values = state.get(field)
+        if values is None:
+            arrays[field] = np.full(n, defaults[field], dtype=dtype)
+        else:
+            arrays[field] = np.array(values, dtype=dtype, copy=True)
+    # Mirror the `or` fallback of the scalar path for NULL/zero ease
+    arrays["ease_factor"] = np.where(arrays["ease_factor"] > 0, arrays["ease_factor"], DEFAULT_EASE)
+    return arrays
+
+
+def _step_arrays(s: Dict[str, np.ndarray], ratings: np.ndarray, idx=None) -> None:
+    """In-place vectorized SM-2 step for the cards selected by idx"""
+    sel = slice(None) if idx is None else idx
+    correct = ratings >= 3
+
+    repetitions = np.where(correct, s["repetitions"][sel] + 1, 0)
+    ease = s["ease_factor"][sel]
+    grown = np.minimum(np.round(s["interval_days"][sel] * ease), MAX_INTERVAL_DAYS).astype(np.int64)
+    interval = np.where(repetitions == 1, 1, np.where(repetitions == 2, 6, grown))
+    interval = np.where(correct, interval, 1)
+    ease = np.where(correct, np.maximum(MIN_EASE, ease + _ease_delta(ratings)), ease)
+    level = s["srs_level"][sel]
+    streak = np.where(correct, s["streak_current"][sel] + 1, 0)
+
+    s["repetitions"][sel] = repetitions
+    s["interval_days"][sel] = interval
+    s["ease_factor"][sel] = ease
+    s["srs_level"][sel] = np.where(correct, level + 1, np.maximum(level - 1, 0))
+    s["total_reviews"][sel] += 1
+    s["correct_reviews"][sel] += correct
+    s["streak_current"][sel] = streak
+    s["streak_best"][sel] = np.maximum(s["streak_best"][sel], streak)
+
+
+def schedule_reviews(state: Dict[str, Any], ratings) -> Dict[str, np.ndarray]:
+    """
+    Vectorized schedule_review for many distinct cards, one review each.
+
+    Args:
+        state: Mapping of STATE_FIELDS to equal-length sequences; missing
+            fields use never-reviewed defaults.
+        ratings: Sequence of ratings (1-4), one per card
+
+    Returns:
+        A new mapping of STATE_FIELDS to NumPy arrays. Timestamps are left
+        to the caller: next review is reviewed_at + interval_days.
+    """
+    ratings = np.asarray(ratings, dtype=np.int64)
+    arrays = _as_state_arrays(state, len(ratings))
+    _step_arrays(arrays, ratings)
+    return arrays
+
+
+def replay_reviews(card_ids, ratings, reviewed_at) -> Dict[str, np.ndarray]:
+    """
+    Rebuild progress for every card from a full review history.
+
+    Args:
+        card_ids: Card id of each review
+        ratings: Rating (1-4) of each review
+        reviewed_at: Review time of each review as epoch seconds
+
+    Reviews may be given in any order; each card's reviews are replayed
+    chronologically from a never-reviewed state. Cards are stepped in
+    lockstep, so the number of NumPy passes is the length of the longest
+    history rather than the number of reviews.
+
+    Returns:
+        Mapping with "card_id", every STATE_FIELDS entry, and
+        "last_reviewed"/"next_review" as epoch seconds, one row per card.
+    """
+    card_ids = np.asarray(card_ids, dtype=np.int64)
+    ratings = np.asarray(ratings, dtype=np.int64)
+    reviewed_at = np.asarray(reviewed_at, dtype=np.float64)
+
+    order = np.lexsort((reviewed_at, card_ids))
+    card_ids, ratings, reviewed_at = card_ids[order], ratings[order], reviewed_at[order]
+
+    unique_ids, starts, counts = np.unique(card_ids, return_index=True, return_counts=True)
+    state = _as_state_arrays({}, len(unique_ids))
+    last_reviewed = np.zeros(len(unique_ids), dtype=np.float64)
+
+    if len(unique_ids):
+        # Cards sorted by history length, so the active set is always a suffix
+        by_length = np.argsort(counts, kind="stable")
+        sorted_counts = counts[by_length]
+        step = 0
+        while True:
+            first_active = np.searchsorted(sorted_counts, step, side="right")
+            active = by_length[first_active:]
+            if len(active) == 0:
+                break
+            if len(active) < _SCALAR_REPLAY_THRESHOLD:
+                _replay_scalar(state, active, starts, counts, ratings, step)
+                break
+            _step_arrays(state, ratings[starts[active] + step], active)
+            step += 1
+        last_reviewed = reviewed_at[starts + counts - 1]
+
+    result = {"card_id": unique_ids}
+    result.update(state)
+    result["last_reviewed"] = last_reviewed
+    result["next_review"] = last_reviewed + state["interval_days"] * SECONDS_PER_DAY
+    return result
+
+
+def _replay_scalar(state, active, starts, counts, ratings, step):
+    """Finish the remaining histories of a few cards without NumPy overhead"""
+    for card in active.tolist():
+        values = tuple(state[field][card].item() for field in STATE_FIELDS)
+        for position in range(starts[card] + step, starts[card] + counts[card]):
+            values = _step(*values, int(ratings[position]))
+        for field, value in zip(STATE_FIELDS, values):
+            state[field][card] = value
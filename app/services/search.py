@@ -0,0 +1,139 @@
+"""
+Card search over the cards_fts index (migration 9).
+
+User input is turned into an FTS5 query rather than passed through, so
+stray quotes or operators never reach the parser:
+
+- hanzi runs become phrases of single characters ("世界" -> "世 界")
+- words with tone marks or numbers search pinyin_numbered ("nǐhǎo",
+  "ni3hao3" -> ni3hao3)
+- anything else matches any column, with diacritics folded, so "nihao",
+  "ni hao" and "cafe" all work
+
+The last word (if at least MIN_PREFIX_CHARS long) is a prefix match
+unless prefix=False, for as-you-type search. Results are ordered by
+bm25 with the column weights in SEARCH_RANK.
+
+The index is written by the app, not by triggers: the normalization lives
+in Python (app/utils/pinyin.py), and triggers calling it would make the
+cards table unwritable from the sqlite3 CLI or an exported snapshot. Code
+that writes card text calls index_cards() in the same transaction; cards
+written from outside the app are picked up by `flask rebuild-search-index`.
+"""
+import re
+import unicodedata
+
+import click
+
+from app.models.database import SEARCH_INDEX_INSERT, get_db_connection
+from app.services.deck_service import CARD_LIST_COLUMNS
+from app.utils.pinyin import CJK_RE, parse_pinyin
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+MAX_QUERY_TERMS = 16
+# A one-letter prefix matches (and ranks) most of a large collection
+MIN_PREFIX_CHARS = 2
+# Card ids per index_cards() statement, under SQLite's variable limit
+INDEX_CHUNK = 500
+
+_TERM_RE = re.compile(rf'{CJK_RE.pattern}+|[^\W_]+')
+
+SEARCH_SQL = '''
+    SELECT {columns}, c.is_archived, d.name AS deck_name, d.color AS deck_color
+    FROM cards_fts
+    JOIN cards c ON c.id = cards_fts.rowid
+    JOIN decks d ON d.id = c.deck_id
+    LEFT JOIN card_progress cp ON cp.card_id = c.id
+    WHERE cards_fts MATCH ? {filters}
+    ORDER BY cards_fts.rank
+    LIMIT ? OFFSET ?
+'''
+
+
+def build_match_query(text, prefix=True):
+    """FTS5 MATCH expression for a search box string, or None if it has no terms"""
+    terms = _TERM_RE.findall(unicodedata.normalize('NFC', text or ''))[:MAX_QUERY_TERMS]
+    parts = []
+    for index, term in enumerate(terms):
+        star = '*' if prefix and index == len(terms) - 1 and len(term) >= MIN_PREFIX_CHARS else ''
+        if CJK_RE.match(term):
+            parts.append('"{}"'.format(' '.join(term)))
+            continue
+        syllables = parse_pinyin(term)
+        if any(tone for _, tone in syllables):
+            numbered = ''.join(syllable.replace('ü', 'v') + (str(tone) if tone else '')
+                               for syllable, tone in syllables)
+            parts.append(f'pinyin_numbered : "{numbered}"{star}')
+        else:
+            parts.append(f'"{term.lower()}"{star}')
+    return ' '.join(parts) or None
+
+
+def search_cards(conn, text, deck_id=None, archived=False, srs_levels=None,
+                 limit=DEFAULT_SEARCH_LIMIT, offset=0, prefix=True):
+    """
+    One page of cards matching text, best match first. archived is
+    False (active cards), True (archived only) or None (both). Returns
+    (rows, has_more).
+    """
+    query = build_match_query(text, prefix)
+    if query is None:
+        return [], False
+
+    filters, params = [], [query]
+    if deck_id is not None:
+        filters.append('c.deck_id = ?')
+        params.append(deck_id)
+    if archived is not None:
+        filters.append('c.is_archived = ?')
+        params.append(bool(archived))
+    if srs_levels:
+        filters.append(f"cp.srs_level IN ({','.join('?' * len(srs_levels))})")
+        params.extend(srs_levels)
+
+    limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+    sql = SEARCH_SQL.format(columns=CARD_LIST_COLUMNS, filters=''.join(f' AND {f}' for f in filters))
+    # One extra row tells whether there is a next page without counting every match
+    rows = conn.execute(sql, [*params, limit + 1, max(0, offset)]).fetchall()
+    return rows[:limit], len(rows) > limit
+
+
+def index_cards(conn, card_ids) -> None:
+    """(Re)index these cards from their current row; run it in the writing transaction"""
+    card_ids = list(card_ids)
+    for i in range(0, len(card_ids), INDEX_CHUNK):
+        chunk = card_ids[i:i + INDEX_CHUNK]
+        placeholders = ','.join('?' * len(chunk))
+        conn.execute(f'DELETE FROM cards_fts WHERE rowid IN ({placeholders})', chunk)
+        conn.execute(SEARCH_INDEX_INSERT.format(prefix='', rowid='id')
+                     + f' FROM cards WHERE id IN ({placeholders})', chunk)
+
+
+def rebuild_search_index(conn):
+    """
+    Re-index every card, e.g. after the normalization in app/utils/pinyin.py
+    changes or after cards were written without the app
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute('DELETE FROM cards_fts')
+        count = conn.execute(SEARCH_INDEX_INSERT.format(prefix='', rowid='id') + ' FROM cards').rowcount
+        conn.execute("INSERT INTO cards_fts (cards_fts) VALUES ('optimize')")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return count
+
+
+def init_app(app):
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index_command():
+        """Rebuild the full-text search index from the cards table."""
+        conn = get_db_connection()
+        try:
+            count = rebuild_search_index(conn)
+        finally:
+            conn.close()
+        click.echo(f"Indexed {count} cards")
@@ -1,66 +1,225 @@
-from datetime import datetime, date
+import logging
+from datetime import datetime, date, timezone
+from app.services.scheduler import schedule_review, replay_reviews, STATE_FIELDS
 
-def rate_card_srs(cursor, progress, rating, card_id):
+logger = logging.getLogger(__name__)
+
+_PROGRESS_UPDATE_SQL = '''
+    UPDATE card_progress
+    SET srs_level = ?, ease_factor = ?, interval_days = ?, repetitions = ?,
+        next_review = ?, last_reviewed = ?, total_reviews = ?, correct_reviews = ?,
+        streak_current = ?, streak_best = ?, updated_at = CURRENT_TIMESTAMP
+    WHERE card_id = ?
+'''
+
+
+_REVIEW_LOG_INSERT_SQL = '''
+    INSERT INTO review_log
+    (card_id, deck_id, rating, prev_interval, new_interval, ease_factor, reviewed_at, response_time_ms)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+def _format_ts(value):
+    """Format a datetime the way SQLite's datetime('now') does"""
+    return value.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _progress_params(card_id, state):
+    return (
+        state['srs_level'], state['ease_factor'], state['interval_days'], state['repetitions'],
+        _format_ts(state['next_review']), _format_ts(state['last_reviewed']),
+        state['total_reviews'], state['correct_reviews'],
+        state['streak_current'], state['streak_best'], card_id,
+    )
+
+
+def _review_log_params(card_id, deck_id, rating, prev_interval, state, response_time_ms):
+    return (
+        card_id, deck_id, rating, prev_interval or 0, state['interval_days'],
+        state['ease_factor'], _format_ts(state['last_reviewed']), response_time_ms,
+    )
+
+
+def rate_card_srs(cursor, progress, rating, card_id, response_time_ms=None):
     """Apply SM-2 Spaced Repetition Algorithm"""
     try:
-        ease_factor = progress['ease_factor'] or 2.5
-        interval = progress['interval_days'] or 0
-        repetitions = progress['repetitions'] or 0
-        
-        if rating <= 2:  # Again or Hard - reset
-            repetitions = 0
-            interval = 1
-        else:  # Good or Easy
-            repetitions += 1
-            if repetitions == 1:
-                interval = 1
-            elif repetitions == 2:
-                interval = 6
-            else:
-                interval = round(interval * ease_factor)
-            
-            # Adjust ease factor
-            ease_factor = max(1.3, ease_factor + (0.1 - (5 - rating) * (0.08 + (5 - rating) * 0.02)))
-        
-        # Update card progress
-        cursor.execute('''
-            UPDATE card_progress 
-            SET srs_level = CASE 
-                WHEN ? >= 3 THEN srs_level + 1
-                ELSE CASE WHEN srs_level - 1 > 0 THEN srs_level - 1 ELSE 0 END
-            END,
-            ease_factor = ?,
-            interval_days = ?,
-            repetitions = ?,
-            next_review = datetime('now', ? || ' days'),
-            last_reviewed = datetime('now'),
-            total_reviews = total_reviews + 1,
-            correct_reviews = correct_reviews + CASE WHEN ? >= 3 THEN 1 ELSE 0 END,
-            streak_current = CASE 
-                WHEN ? >= 3 THEN streak_current + 1 
-                ELSE 0 
-            END,
-            streak_best = CASE 
-                WHEN ? >= 3 AND streak_current + 1 > streak_best THEN streak_current + 1
-                ELSE streak_best
-            END
-            WHERE card_id = ?
-        ''', (
-            rating, ease_factor, interval, repetitions, 
-            interval, rating, rating, rating, card_id
+        state = schedule_review(progress, rating)
+        cursor.execute(_PROGRESS_UPDATE_SQL, _progress_params(card_id, state))
+        cursor.execute(_REVIEW_LOG_INSERT_SQL, _review_log_params(
+            card_id, progress['deck_id'], rating, progress['interval_days'], state, response_time_ms
         ))
-        
-        return {'interval': interval, 'ease_factor': ease_factor, 'repetitions': repetitions}
+
+        return {
+            'interval': state['interval_days'],
+            'ease_factor': state['ease_factor'],
+            'repetitions': state['repetitions'],
+        }
     
-    except Exception as e:
-        print(f"Error in rate_card_srs: {e}")
+    except Exception:
+        logger.exception("Error in rate_card_srs")
         raise
 
-def update_user_streak(cursor):
-    """Update user streak after study session"""
+MAX_BATCH_REVIEWS = 500
+_SQL_CHUNK = 500
+
+
+def _parse_reviewed_at(value, now):
+    """Normalize a client timestamp (ISO string or epoch ms) to a UTC datetime"""
+    if value is None:
+        return now
+    try:
+        if isinstance(value, (int, float)):
+            reviewed_at = datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+        else:
+            reviewed_at = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+            if reviewed_at.tzinfo is None:
+                reviewed_at = reviewed_at.replace(tzinfo=timezone.utc)
+        reviewed_at = reviewed_at.astimezone(timezone.utc).replace(tzinfo=None, microsecond=0)
+    except (ValueError, OverflowError, OSError):
+        return now
+    # Never trust a clock that is ahead of the server
+    return min(reviewed_at, now)
+
+
+def rate_cards_srs_bulk(cursor, deck_id, reviews):
+    """
+    Apply an ordered batch of reviews for one deck (or, with deck_id None,
+    cards of any deck) in a single pass.
+
+    Each review is a dict with card_id, rating (1-4), and optionally
+    review_id, reviewed_at and duration_ms. Reviews whose review_id was
+    already applied are skipped, so a client may safely resubmit a batch.
+    The caller owns the transaction.
+
+    Returns a dict with the applied review ids, the skipped duplicates, the
+    rejected reviews and the resulting interval per card.
+    """
+    now = datetime.utcnow().replace(microsecond=0)
+    applied, duplicates, rejected = [], [], []
+
+    # Drop reviews that were already applied by an earlier submission
+    review_ids = [r['review_id'] for r in reviews if r.get('review_id')]
+    seen = set()
+    for i in range(0, len(review_ids), _SQL_CHUNK):
+        chunk = review_ids[i:i + _SQL_CHUNK]
+        placeholders = ','.join('?' * len(chunk))
+        seen.update(row[0] for row in cursor.execute(
+            f'SELECT review_id FROM review_submissions WHERE review_id IN ({placeholders})', chunk
+        ))
+
+    card_ids = list({r['card_id'] for r in reviews})
+    states, deck_ids = {}, {}
+    deck_filter = 'deck_id = ? AND ' if deck_id is not None else ''
+    for i in range(0, len(card_ids), _SQL_CHUNK):
+        chunk = card_ids[i:i + _SQL_CHUNK]
+        placeholders = ','.join('?' * len(chunk))
+        for row in cursor.execute(f'''
+            SELECT card_id, deck_id, {', '.join(STATE_FIELDS)}
+            FROM card_progress
+            WHERE {deck_filter}card_id IN ({placeholders})
+        ''', [deck_id, *chunk] if deck_id is not None else chunk):
+            states[row['card_id']] = dict(row)
+            deck_ids[row['card_id']] = row['deck_id']
+
+    touched = {}
+    log_rows = []
+    submissions = []
+    duration_ms = 0
+    for review in reviews:
+        review_id = review.get('review_id')
+        if review_id and review_id in seen:
+            duplicates.append(review_id)
+            continue
+        state = states.get(review['card_id'])
+        if state is None:
+            rejected.append({'card_id': review['card_id'], 'review_id': review_id,
+                             'error': 'Card progress not found'})
+            continue
+
+        reviewed_at = _parse_reviewed_at(review.get('reviewed_at'), now)
+        prev_interval = state['interval_days']
+        state = schedule_review(state, review['rating'], reviewed_at)
+        states[review['card_id']] = state
+        touched[review['card_id']] = state
+        log_rows.append(_review_log_params(
+            review['card_id'], deck_ids[review['card_id']], review['rating'], prev_interval, state,
+            review.get('duration_ms')
+        ))
+
+        if review_id:
+            seen.add(review_id)
+            submissions.append((review_id, review['card_id']))
+        duration_ms += review.get('duration_ms') or 0
+        applied.append(review_id or review['card_id'])
+
+    cursor.executemany(_PROGRESS_UPDATE_SQL, [
+        _progress_params(card_id, state) for card_id, state in touched.items()
+    ])
+    cursor.executemany(_REVIEW_LOG_INSERT_SQL, log_rows)
+    cursor.executemany(
+        'INSERT OR IGNORE INTO review_submissions (review_id, card_id) VALUES (?, ?)',
+        submissions
+    )
+
+    return {
+        'applied': applied,
+        'duplicates': duplicates,
+        'rejected': rejected,
+        'duration_ms': duration_ms,
+        'intervals': {card_id: st['interval_days'] for card_id, st in touched.items()},
+    }
+
+def rebuild_card_progress(cursor, card_ids, ratings, reviewed_at):
+    """
+    Recompute card_progress for every card appearing in a review history.
+
+    reviewed_at holds epoch seconds. Progress of cards not present in the
+    history is left untouched. The caller owns the transaction.
+    Returns the number of cards rewritten.
+    """
+    replayed = replay_reviews(card_ids, ratings, reviewed_at)
+    columns = [replayed[field].tolist() for field in STATE_FIELDS]
+    last_reviewed = replayed['last_reviewed'].tolist()
+    next_review = replayed['next_review'].tolist()
+
+    rows = []
+    for i, card_id in enumerate(replayed['card_id'].tolist()):
+        state = {field: column[i] for field, column in zip(STATE_FIELDS, columns)}
+        state['last_reviewed'] = datetime.utcfromtimestamp(last_reviewed[i])
+        state['next_review'] = datetime.utcfromtimestamp(next_review[i])
+        rows.append(_progress_params(card_id, state))
+
+    cursor.executemany(_PROGRESS_UPDATE_SQL, rows)
+    return len(rows)
+
+def rebuild_progress_from_log(cursor, deck_id=None):
+    """Replay review_log (optionally for one deck) into card_progress"""
+    query = '''
+        SELECT card_id, rating, CAST(strftime('%s', reviewed_at) AS INTEGER) AS ts
+        FROM review_log
+    '''
+    params = ()
+    if deck_id is not None:
+        query += ' WHERE deck_id = ?'
+        params = (deck_id,)
+    # Same-second reviews keep their insertion order through the stable replay sort
+    query += ' ORDER BY id'
+
+    card_ids, ratings, reviewed_at = [], [], []
+    for card_id, rating, ts in cursor.execute(query, params):
+        card_ids.append(card_id)
+        ratings.append(rating)
+        reviewed_at.append(ts)
+    return rebuild_card_progress(cursor, card_ids, ratings, reviewed_at)
+
+def update_user_streak(cursor, cards_studied=1, minutes_studied=1):
+    """Update user streak and today's study log after one or more reviews"""
     try:
         today = date.today().isoformat()
         
+        already_counted = False
+
         # Check if already studied today
         last_study = cursor.execute('SELECT last_study_date FROM user_streaks WHERE id = 1').fetchone()
         
@@ -78,41 +237,42 @@ def update_user_streak(cursor):
                     last_date = None
                 
                 if last_date and last_date == date.today():
-                    return  # Already updated today
+                    already_counted = True
             except (ValueError, AttributeError) as e:
-                print(f"Error parsing date: {e}")
+                logger.warning("Error parsing date", extra={'error': str(e)})
                 # Continue to update streak
         
-        # Update streak
-        cursor.execute('''
-            UPDATE user_streaks 
-            SET current_streak = CASE 
-                WHEN last_study_date IS NULL THEN 1
-                WHEN date(last_study_date) = date('now', '-1 day') THEN current_streak + 1
-                ELSE 1
-            END,
-            longest_streak = MAX(longest_streak, 
-                CASE 
+        # Update streak (once per day)
+        if not already_counted:
+            cursor.execute('''
+                UPDATE user_streaks 
+                SET current_streak = CASE 
                     WHEN last_study_date IS NULL THEN 1
                     WHEN date(last_study_date) = date('now', '-1 day') THEN current_streak + 1
                     ELSE 1
-                END),
-            total_streak_days = total_streak_days + 1,
-            last_study_date = date('now')
-            WHERE id = 1
-        ''')
+                END,
+                longest_streak = MAX(longest_streak, 
+                    CASE 
+                        WHEN last_study_date IS NULL THEN 1
+                        WHEN date(last_study_date) = date('now', '-1 day') THEN current_streak + 1
+                        ELSE 1
+                    END),
+                total_streak_days = total_streak_days + 1,
+                last_study_date = date('now')
+                WHERE id = 1
+            ''')
         
-        # Log daily study - fixed to properly increment cards_studied
+        # Log daily study - incremented by the number of reviews applied
         cursor.execute('''
             INSERT INTO daily_study_logs 
             (study_date, cards_studied, minutes_studied, streak_maintained, daily_goal_met)
-            VALUES (date('now'), 1, 1, TRUE, TRUE)
+            VALUES (date('now'), ?, ?, TRUE, TRUE)
             ON CONFLICT(study_date) 
             DO UPDATE SET 
-                cards_studied = cards_studied + 1,
-                minutes_studied = minutes_studied + 1
-        ''')
+                cards_studied = cards_studied + excluded.cards_studied,
+                minutes_studied = minutes_studied + excluded.minutes_studied
+        ''', (cards_studied, minutes_studied))
         
-    except Exception as e:
-        print(f"Error in update_user_streak: {e}")
+    except Exception:
+        logger.exception("Error in update_user_streak")
         raise
\ No newline at end of file
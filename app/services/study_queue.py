@@ -0,0 +1,242 @@
+"""
+Study queue selection.
+
+A session is built from three buckets, each read with its own LIMIT from
+a partial index on card_progress (migration 8):
+
+- due:      reviewed before and next_review has passed, oldest first
+- learning: reviewed, srs_level < 3 and not yet due, soonest first
+- new:      never reviewed, in the order the cards were added
+
+build_session_queue() applies the same buckets to every non-archived deck
+at once for the cross-deck session, capped by daily review/new limits.
+
+card_progress.is_archived mirrors cards.is_archived (kept in sync by
+triggers) so no bucket has to join cards to skip archived cards. The
+bucket predicates below must stay textually in line with the partial
+index WHERE clauses, or SQLite will not use them.
+"""
+import click
+
+from app.routes.cards import CARD_COLUMNS
+
+DEFAULT_DUE_LIMIT = 20
+DEFAULT_LEARNING_LIMIT = 10
+DEFAULT_NEW_LIMIT = 10
+MAX_BUCKET_LIMIT = 200
+# Daily limits for the cross-deck session (app.config STUDY_*_PER_DAY)
+DEFAULT_NEW_PER_DAY = 20
+DEFAULT_REVIEWS_PER_DAY = 200
+MAX_PER_DAY = 1000
+
+# Bucket name -> (predicate, sort column, index serving it)
+BUCKETS = {
+    'due': ("total_reviews > 0 AND next_review <= :now",
+            'next_review', 'idx_card_progress_queue_due'),
+    'learning': ("total_reviews > 0 AND srs_level < 3 AND next_review > :now",
+                 'next_review', 'idx_card_progress_queue_learning'),
+    'new': ("total_reviews = 0",
+            'card_id', 'idx_card_progress_queue_new'),
+}
+
+
+def _bucket_sql(bucket):
+    predicate, order, _ = BUCKETS[bucket]
+    return f'''
+        SELECT card_id, '{bucket}' AS bucket, {list(BUCKETS).index(bucket)} AS bucket_order, {order} AS sort_key
+        FROM card_progress
+        WHERE deck_id = :deck_id AND is_archived = FALSE AND {predicate}
+        ORDER BY {order}
+        LIMIT :{bucket}_limit
+    '''
+
+
+QUEUE_SQL = '''
+    WITH {ctes}
+    SELECT card_id, bucket FROM ({union})
+    ORDER BY bucket_order, sort_key
+'''.format(
+    ctes=', '.join(f'{bucket}_q AS ({_bucket_sql(bucket)})' for bucket in BUCKETS),
+    union=' UNION ALL '.join(f'SELECT * FROM {bucket}_q' for bucket in BUCKETS),
+)
+
+
+def _limit(value, default):
+    try:
+        return max(0, min(int(value), MAX_BUCKET_LIMIT))
+    except (TypeError, ValueError):
+        return default
+
+
+def queue_params(deck_id, due=None, learning=None, new=None):
+    return {
+        'deck_id': deck_id,
+        'due_limit': _limit(due, DEFAULT_DUE_LIMIT),
+        'learning_limit': _limit(learning, DEFAULT_LEARNING_LIMIT),
+        'new_limit': _limit(new, DEFAULT_NEW_LIMIT),
+    }
+
+
+def get_study_queue(conn, deck_id, due=None, learning=None, new=None):
+    """
+    (card_id, bucket) rows to study in a deck: due reviews, then learning
+    cards, then new cards, each bucket capped at its own limit. Card data
+    comes from get_cards_by_ids(), a page at a time.
+    """
+    params = queue_params(deck_id, due, learning, new)
+    params['now'] = conn.execute("SELECT datetime('now')").fetchone()[0]
+    return conn.execute(QUEUE_SQL, params).fetchall()
+
+
+# Cross-deck session: each deck contributes up to the remaining daily limit
+# per bucket (a correlated LIMIT per deck, so every deck is one index range
+# scan), then decks are interleaved round-robin within each bucket and the
+# buckets are capped at the daily limits. Due and learning share the review
+# limit.
+def _session_bucket_sql(bucket):
+    predicate, order, _ = BUCKETS[bucket]
+    limit = 'new_limit' if bucket == 'new' else 'review_limit'
+    return f'''
+        SELECT cp.card_id, cp.deck_id, {list(BUCKETS).index(bucket)} AS bucket_order, cp.{order} AS sort_key
+        FROM decks d
+        JOIN card_progress cp ON cp.card_id IN (
+            SELECT card_id FROM card_progress
+            WHERE deck_id = d.id AND is_archived = FALSE AND {predicate}
+            ORDER BY {order}
+            LIMIT :{limit}
+        )
+        WHERE d.is_archived = FALSE
+    '''
+
+
+SESSION_QUEUE_SQL = '''
+    WITH picked AS ({union}),
+    ranked AS (
+        SELECT *, ROW_NUMBER() OVER (PARTITION BY bucket_order, deck_id ORDER BY sort_key) AS deck_rank
+        FROM picked
+    ),
+    ordered AS (
+        SELECT *, ROW_NUMBER() OVER (
+            PARTITION BY bucket_order = 2 ORDER BY bucket_order, deck_rank, deck_id
+        ) AS position
+        FROM ranked
+    )
+    SELECT card_id, deck_id, bucket_order FROM ordered
+    WHERE position <= CASE WHEN bucket_order = 2 THEN :new_limit ELSE :review_limit END
+    ORDER BY bucket_order = 2, position
+'''.format(union=' UNION ALL '.join(_session_bucket_sql(bucket) for bucket in BUCKETS))
+
+
+def studied_today(conn):
+    """
+    Cards reviewed since midnight (UTC, like review_log.reviewed_at), split
+    into reviews and new cards. Every review sets an interval of at least
+    a day, so prev_interval = 0 marks a card's first review.
+    """
+    row = conn.execute('''
+        SELECT COUNT(DISTINCT card_id) AS cards,
+               COUNT(DISTINCT CASE WHEN prev_interval = 0 THEN card_id END) AS new_cards
+        FROM review_log
+        WHERE reviewed_at >= date('now')
+    ''').fetchone()
+    return {'reviews': row['cards'] - row['new_cards'], 'new': row['new_cards']}
+
+
+def _daily_limit(value, default):
+    try:
+        return max(0, min(int(value), MAX_PER_DAY))
+    except (TypeError, ValueError):
+        return default
+
+
+def build_session_queue(conn, new_per_day=None, reviews_per_day=None):
+    """
+    Ordered card ids for a study session across every non-archived deck,
+    with what is left of today's limits. Returns (card ids, info) where
+    info has the limits, today's counts and the per-bucket sizes.
+    """
+    limits = {
+        'new': _daily_limit(new_per_day, DEFAULT_NEW_PER_DAY),
+        'reviews': _daily_limit(reviews_per_day, DEFAULT_REVIEWS_PER_DAY),
+    }
+    done = studied_today(conn)
+    params = {
+        'now': conn.execute("SELECT datetime('now')").fetchone()[0],
+        'new_limit': max(0, limits['new'] - done['new']),
+        'review_limit': max(0, limits['reviews'] - done['reviews']),
+    }
+
+    card_ids, counts = [], dict.fromkeys(BUCKETS, 0)
+    names = list(BUCKETS)
+    for row in conn.execute(SESSION_QUEUE_SQL, params):
+        card_ids.append(row['card_id'])
+        counts[names[row['bucket_order']]] += 1
+    return card_ids, {'limits': limits, 'studied_today': done, 'counts': counts}
+
+
+def get_cards_by_ids(conn, card_ids):
+    """Study card data for card_ids, in the given order (archived cards are skipped)"""
+    if not card_ids:
+        return []
+    placeholders = ','.join('?' * len(card_ids))
+    rows = conn.execute(f'''
+        SELECT {CARD_COLUMNS}, cp.srs_level, cp.next_review, d.name AS deck_name, d.color AS deck_color
+        FROM cards c
+        JOIN card_progress cp ON cp.card_id = c.id
+        JOIN decks d ON d.id = c.deck_id
+        WHERE c.id IN ({placeholders}) AND c.is_archived = FALSE
+    ''', card_ids).fetchall()
+    by_id = {row['id']: dict(row) for row in rows}
+    return [by_id[card_id] for card_id in card_ids if card_id in by_id]
+
+
+def explain_study_queue(conn):
+    """
+    EXPLAIN QUERY PLAN for each bucket and for the cross-deck session.
+    Returns {name: (plan lines, problems)}; a bucket has a problem if it
+    scans a table, sorts with a temp B-tree, or does not search its own
+    index. The session query may scan decks and sort what it picked, but
+    must reach card_progress through the bucket indexes only.
+    """
+    params = queue_params(0)
+    params['now'] = '1970-01-01 00:00:00'
+    report = {}
+    for bucket, (_, _, index) in BUCKETS.items():
+        rows = conn.execute(f'EXPLAIN QUERY PLAN {_bucket_sql(bucket)}', params).fetchall()
+        plan = [row['detail'] for row in rows]
+        problems = [line for line in plan if line.startswith('SCAN') or 'TEMP B-TREE' in line]
+        if not any(line.startswith('SEARCH') and index in line for line in plan):
+            problems.append(f'{index} not used')
+        report[bucket] = (plan, problems)
+
+    rows = conn.execute(f'EXPLAIN QUERY PLAN {SESSION_QUEUE_SQL}',
+                        {'now': params['now'], 'new_limit': 1, 'review_limit': 1}).fetchall()
+    plan = [row['detail'] for row in rows]
+    problems = [line for line in plan if line.startswith('SCAN card_progress')]
+    problems += [f'{index} not used' for _, _, index in BUCKETS.values()
+                 if not any(index in line for line in plan)]
+    report['session'] = (plan, problems)
+    return report
+
+
+def init_app(app):
+    @app.cli.command('check-queue-plan')
+    def check_queue_plan_command():
+        """Fail if a study queue query is not served by index range scans."""
+        from app.models.database import get_db_connection
+        conn = get_db_connection()
+        try:
+            report = explain_study_queue(conn)
+        finally:
+            conn.close()
+
+        failed = False
+        for bucket, (plan, problems) in report.items():
+            click.echo(f"{bucket}:")
+            for line in plan:
+                click.echo(f"  {line}")
+            for problem in problems:
+                click.echo(f"  PROBLEM: {problem}")
+            failed = failed or bool(problems)
+        if failed:
+            raise click.ClickException('study queue query plan regressed')
@@ -0,0 +1,48 @@
+import hashlib
+import threading
+import time
+from typing import Iterator
+
+
+class _StubTextToSpeech:
+    def __init__(self, client):
+        self._client = client
+
+    def convert(self, text: str, **kwargs) -> Iterator[bytes]:
+        return self._client._synthesize(text)
+
+    def stream(self, text: str, **kwargs) -> Iterator[bytes]:
+        return self._client._synthesize(text)
+
+
+class StubElevenLabsClient:
+    """
+    Offline stand-in for elevenlabs.client.ElevenLabs.
+
+    text_to_speech.convert()/stream() yield deterministic fake MP3 bytes
+    derived from the text, in chunks, so caching and streaming behave as
+    with the real API. Counts calls so tests can check whether a request
+    reached the "network".
+    """
+
+    def __init__(self, latency: float = 0.0, chunk_size: int = 1024, size: int = 4096):
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.size = size
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.text_to_speech = _StubTextToSpeech(self)
+
+    def audio_for(self, text: str) -> bytes:
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        body = digest * (self.size // len(digest) + 1)
+        return b"ID3" + body[:self.size - 3]
+
+    def _synthesize(self, text: str) -> Iterator[bytes]:
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        audio = self.audio_for(text)
+        for start in range(0, len(audio), self.chunk_size):
+            yield audio[start:start + self.chunk_size]
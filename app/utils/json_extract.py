@@ -0,0 +1,151 @@
+"""
+JSON extraction from model responses.
+
+Models wrap their JSON in code fences or prose, leave trailing commas, or
+(when streamed) stop mid-value. extract_json() finds the first complete
+object/array with json.JSONDecoder.raw_decode, decoding straight out of
+the response text without copying it first. parse_partial_json() closes
+whatever is still open so a streamed prefix can be read early.
+"""
+import json
+from typing import Any, List, Optional, Tuple
+
+# strict=False accepts raw newlines inside strings, which models often emit
+_decoder = json.JSONDecoder(strict=False)
+_CLOSERS = {'{': '}', '[': ']'}
+
+
+def _next_start(text: str, pos: int, kind: Optional[type]) -> int:
+    """Index of the next '{' and/or '[' at or after pos, or -1"""
+    if kind is dict:
+        return text.find('{', pos)
+    if kind is list:
+        return text.find('[', pos)
+    brace, bracket = text.find('{', pos), text.find('[', pos)
+    if brace == -1 or bracket == -1:
+        return max(brace, bracket)
+    return min(brace, bracket)
+
+
+def _scan(text: str, start: int):
+    """
+    Walk one JSON value from text[start] in a single pass, dropping commas
+    that directly precede a closing bracket.
+
+    Returns (chars, end, stack, in_string, cuts): end is the index after
+    the value, or None if the text ran out first; stack holds the still
+    open brackets; cuts[i] is the output length at which stack[i] can be
+    truncated back to its last complete member.
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    cuts: List[int] = []
+    in_string = escaped = False
+    comma_at = None  # Output index of a comma followed only by whitespace so far
+
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            out.append(ch)
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+
+        if ch in ' \t\r\n':
+            out.append(ch)
+            continue
+
+        if ch in '}]':
+            if not stack or _CLOSERS[stack[-1]] != ch:
+                return out, None, stack, False, cuts
+            if comma_at is not None:
+                del out[comma_at]
+                comma_at = None
+            stack.pop()
+            cuts.pop()
+            out.append(ch)
+            if not stack:
+                return out, i + 1, stack, False, cuts
+            continue
+
+        if comma_at is not None:
+            # A new member starts: the container is complete up to the comma
+            cuts[-1] = comma_at
+            comma_at = None
+        if ch == ',' and stack:
+            comma_at = len(out)
+        elif ch == '"':
+            in_string = True
+        elif ch in '{[':
+            stack.append(ch)
+            cuts.append(len(out) + 1)
+        out.append(ch)
+    return out, None, stack, in_string, cuts
+
+
+def extract_json(text: str, kind: Optional[type] = None) -> Any:
+    """
+    First complete JSON object or array in text (of type `kind` if given,
+    dict or list). Code fences and surrounding prose are skipped and
+    trailing commas are tolerated.
+
+    Raises json.JSONDecodeError if there is none.
+    """
+    pos = _next_start(text, 0, kind)
+    while pos != -1:
+        try:
+            value, end = _decoder.raw_decode(text, pos)
+        except json.JSONDecodeError:
+            chars, end, _, _, _ = _scan(text, pos)
+            if end is not None:
+                try:
+                    value = _decoder.decode(''.join(chars))
+                except json.JSONDecodeError:
+                    end = None
+            if end is None:
+                pos = _next_start(text, pos + 1, kind)
+                continue
+        if kind is None or isinstance(value, kind):
+            return value
+        pos = _next_start(text, end, kind)
+    raise json.JSONDecodeError('No JSON value found', text, 0)
+
+
+def parse_partial_json(text: str, kind: Optional[type] = None) -> Tuple[Any, bool]:
+    """
+    Best-effort parse of a JSON value that may still be streaming in.
+
+    Returns (value, complete). An unfinished string is closed where it
+    stops, and an unfinished member is dropped back to the last complete
+    one, so {"hanzi": "你好", "pin  gives ({"hanzi": "你好"}, False).
+    value is None when nothing usable has arrived yet.
+    """
+    pos = _next_start(text, 0, kind)
+    if pos == -1:
+        return None, False
+
+    chars, end, stack, in_string, cuts = _scan(text, pos)
+    if end is not None:
+        try:
+            return _decoder.decode(''.join(chars)), True
+        except json.JSONDecodeError:
+            return None, False
+
+    body = ''.join(chars)
+    closers = ''.join(_CLOSERS[opener] for opener in reversed(stack))
+    candidates = [body + ('"' if in_string else '') + closers]
+    # Cut back one nesting level at a time, closing everything outside it
+    for level in range(len(stack) - 1, -1, -1):
+        outer = ''.join(_CLOSERS[opener] for opener in reversed(stack[:level + 1]))
+        candidates.append(body[:cuts[level]] + outer)
+
+    for candidate in candidates:
+        try:
+            return _decoder.decode(candidate), False
+        except json.JSONDecodeError:
+            continue
+    return None, False
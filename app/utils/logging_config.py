@@ -0,0 +1,66 @@
+"""
+Leveled, structured logging for the app.
+
+Modules log through `logging.getLogger(__name__)` and pass structured
+fields as `extra={...}` rather than formatting them into the message.
+configure_logging() (called by create_app) writes one JSON object per
+line to stderr, which gunicorn and docker collect as is; LOG_FORMAT=text
+gives plain lines for local development. LOG_LEVEL sets the level
+(default INFO).
+"""
+import json
+import logging
+import os
+import sys
+import time
+
+from flask import has_request_context, request
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+
+# Attributes every LogRecord has; anything else came in through `extra`
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, request and extra fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "message": record.getMessage(),
+            "pid": record.process,
+        }
+        if has_request_context():
+            entry["method"] = request.method
+            entry["path"] = request.path
+            entry["endpoint"] = request.endpoint
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRS)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _TextFormatter(logging.Formatter):
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        line = super().formatMessage(record)
+        extra = {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+        return f"{line} {json.dumps(extra, ensure_ascii=False, default=str)}" if extra else line
+
+
+def configure_logging() -> None:
+    """Install the handler on the root logger once per process"""
+    root = logging.getLogger()
+    if any(getattr(handler, "_flashcards", False) for handler in root.handlers):
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    handler._flashcards = True
+    if LOG_FORMAT == "text":
+        handler.setFormatter(_TextFormatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    else:
+        handler.setFormatter(JsonFormatter())
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
@@ -0,0 +1,181 @@
+"""
+Pinyin and hanzi normalization for the search index.
+
+The search index is filled through SQL functions registered on every
+pooled connection (register_sql_functions), so each card is
+indexed with its pinyin as written, tone-stripped ("ni hao nihao", ü as
+v) and with tone numbers ("ni3 hao3 ni3hao3"). Hanzi are indexed one
+character per token so words can be found inside longer text. The same
+syllable parsing gives each card its duplicate-detection key (card_key).
+"""
+import functools
+import re
+import unicodedata
+
+# Combining marks left by NFD: tone marks and the diaeresis of ü
+_TONE_MARKS = {'̄': 1, '́': 2, '̌': 3, '̀': 4}
+_DIAERESIS = '̈'
+
+_INITIALS = 'zh|ch|sh|[bpmfdtnlgkhjqxrzcsyw]'
+# Longest first: the regex takes the first alternative that matches
+_FINALS = ('iang|iong|uang|ueng|ang|eng|ing|ong|ian|iao|uai|uan|üan|'
+           'ai|ei|ao|ou|an|en|in|un|ün|ia|ie|iu|ua|uo|ui|üe|er|a|e|i|o|u|ü')
+_SYLLABLE_RE = re.compile(rf'(?:{_INITIALS})?(?:{_FINALS})(?:r(?![aeiouü]))?')
+
+_RUN_RE = re.compile('[a-zü0-9]+')
+
+CJK_RE = re.compile('[㐀-䶿一-鿿豈-﫿\U00020000-\U0003134f]')
+
+
+def _strip_marks(text):
+    """Lowercase text without tone marks (ü kept), and the tone of each character"""
+    text = text.lower()
+    if text.isascii():
+        return text.replace('v', 'ü'), [0] * len(text)
+    chars, tones = [], []
+    for char in unicodedata.normalize('NFD', text):
+        if char in _TONE_MARKS:
+            if tones:
+                tones[-1] = _TONE_MARKS[char]
+        elif char == _DIAERESIS:
+            if chars and chars[-1] == 'u':
+                chars[-1] = 'ü'
+        elif not unicodedata.combining(char):
+            # v is the keyboard spelling of ü ("lv4")
+            chars.append('ü' if char == 'v' else char)
+            tones.append(0)
+    return ''.join(chars), tones
+
+
+def _split_run(run, tones):
+    syllables = []
+    pos = 0
+    while pos < len(run):
+        match = _SYLLABLE_RE.match(run, pos)
+        if not match:
+            return None
+        end = match.end()
+        tone = max(tones[pos:end])
+        if end < len(run) and run[end] in '12345':
+            tone = int(run[end])
+            end += 1
+        syllables.append((match.group(), tone))
+        pos = end
+    return syllables
+
+
+# pinyin_plain() and pinyin_numbered() parse the same text for every indexed card
+@functools.lru_cache(maxsize=4096)
+def parse_pinyin(text):
+    """
+    Syllables of pinyin as a tuple of (syllable, tone), tone 0 when not marked.
+    Accepts tone marks ("nǐhǎo") or numbers ("ni3hao3"); a word that does
+    not split into syllables is kept whole.
+    """
+    plain, tones = _strip_marks(text or '')
+    syllables = []
+    for match in _RUN_RE.finditer(plain):
+        run = match.group()
+        split = _split_run(run, tones[match.start():match.end()])
+        syllables.extend(split if split is not None else [(run, 0)])
+    return tuple(syllables)
+
+
+def _with_joined(tokens):
+    # The joined form lets "nihao" match without the user typing spaces
+    if len(tokens) > 1:
+        tokens = tokens + [''.join(tokens)]
+    return ' '.join(tokens)
+
+
+def pinyin_plain(text):
+    """Tone-stripped syllables plus the joined word, ü written as v"""
+    if not text:
+        return ''
+    return _with_joined([syllable.replace('ü', 'v') for syllable, _ in parse_pinyin(text)])
+
+
+def pinyin_numbered(text, neutral=5):
+    """
+    Syllables with tone numbers plus the joined word. Unmarked syllables
+    get `neutral` (None leaves them bare); pinyin with no tones at all
+    gives ''.
+    """
+    syllables = parse_pinyin(text) if text else []
+    if not any(tone for _, tone in syllables):
+        return ''
+    return _with_joined([
+        syllable.replace('ü', 'v') + (str(tone or neutral) if tone or neutral else '')
+        for syllable, tone in syllables
+    ])
+
+
+def search_text(text):
+    """Text with every CJK character as a separate token"""
+    if not text:
+        return text
+    return CJK_RE.sub(r' \g<0> ', text)
+
+
+_MARKS_BY_TONE = {tone: mark for mark, tone in _TONE_MARKS.items()}
+_NUMBERED_SYLLABLE_RE = re.compile(r'^([A-Za-zÜü:]+)([1-5])$')
+
+
+def _mark_syllable(syllable, tone):
+    syllable = syllable.replace('u:', 'ü').replace('U:', 'Ü')
+    if tone == 5:
+        return syllable
+    lower = syllable.lower()
+    # a and e always take the mark, o takes it in "ou", else the last vowel does
+    if 'a' in lower:
+        index = lower.index('a')
+    elif 'e' in lower:
+        index = lower.index('e')
+    elif 'ou' in lower:
+        index = lower.index('o')
+    else:
+        index = max((i for i, char in enumerate(lower) if char in 'aeiouü'), default=None)
+        if index is None:
+            return syllable
+    marked = syllable[:index + 1] + _MARKS_BY_TONE[tone] + syllable[index + 1:]
+    return unicodedata.normalize('NFC', marked)
+
+
+def numbered_to_marks(text):
+    """CC-CEDICT style "ni3 hao3" / "lu:4" to "nǐ hǎo" / "lǜ"; other tokens are kept"""
+    syllables = []
+    for token in (text or '').split():
+        match = _NUMBERED_SYLLABLE_RE.match(token)
+        syllables.append(_mark_syllable(match.group(1), int(match.group(2))) if match else token)
+    return ' '.join(syllables)
+
+
+def card_key(hanzi, pinyin):
+    """
+    Duplicate-detection key: NFKC hanzi without whitespace, plus the pinyin
+    syllables with tone numbers ("你好|ni3hao3"), so "nǐ hǎo", "Nǐhǎo" and
+    "ni3 hao3" agree while heteronyms such as 行 xíng / háng stay apart.
+    """
+    if not hanzi:
+        return None
+    hanzi = ''.join(unicodedata.normalize('NFKC', hanzi).split())
+    syllables = parse_pinyin(pinyin) if pinyin else ()
+    # An explicit 5 and an unmarked syllable are both the neutral tone
+    pinyin = ''.join(syllable.replace('ü', 'v') + (str(tone) if tone not in (0, 5) else '')
+                     for syllable, tone in syllables)
+    return f'{hanzi}|{pinyin}'
+
+
+# SQL name -> (number of arguments, function)
+SQL_FUNCTIONS = {
+    'search_text': (1, search_text),
+    'pinyin_plain': (1, pinyin_plain),
+    'pinyin_numbered': (1, pinyin_numbered),
+    'card_key': (2, card_key),
+}
+
+
+def register_sql_functions(conn):
+    """Make the functions used to index cards available on conn"""
+    for name, (nargs, func) in SQL_FUNCTIONS.items():
+        conn.create_function(name, nargs, func, deterministic=True)
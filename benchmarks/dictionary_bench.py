@@ -0,0 +1,63 @@
+"""
+Micro-benchmark: local CC-CEDICT dictionary.
+
+Compiles a CC-CEDICT file with app.services.dictionary.build_dictionary,
+then times opening it, single-word lookups, longest-match segmentation
+and a full card fill, and prints the resulting hit-rate counters. Get the
+file from https://www.mdbg.net/chinese/dictionary?page=cedict.
+
+    python -m benchmarks.dictionary_bench CEDICT_FILE [--number N]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.dictionary import Dictionary, build_dictionary, parse_cedict  # noqa: E402
+
+SENTENCE = '我们明天去图书馆看书，然后一起吃晚饭。'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('cedict', type=Path)
+    parser.add_argument('--number', type=int, default=20000, help='calls per measurement')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'cedict.db')
+        start = time.perf_counter()
+        count = build_dictionary(str(args.cedict), path)
+        print(f'compile            {count} entries in {time.perf_counter() - start:.2f}s, '
+              f'{os.path.getsize(path) / 1e6:.1f} MB')
+
+        start = time.perf_counter()
+        dictionary = Dictionary(path)
+        print(f'open               {(time.perf_counter() - start) * 1e3:.2f} ms')
+
+        with args.cedict.open(encoding='utf-8') as f:
+            words = [entry.simplified for _, entry in zip(range(1000), parse_cedict(f))]
+        timings = {
+            'lookup (hit)': lambda: dictionary.lookup(words[len(words) // 2]),
+            'lookup (miss)': lambda: dictionary.lookup('不是一个词'),
+            'best_entry': lambda: dictionary.best_entry('行'),
+            'segment sentence': lambda: dictionary.segment(SENTENCE),
+            'fill card': lambda: dictionary.fill({'hanzi': '图书馆', 'pinyin': '', 'traditional': '',
+                                                  'english': '', 'measure_word': ''},
+                                                 ('pinyin', 'traditional', 'english', 'measure_word')),
+        }
+        for label, fn in timings.items():
+            seconds = timeit.timeit(fn, number=args.number)
+            print(f'{label:<18} {seconds / args.number * 1e6:8.1f} us')
+
+        print(f'\nsegmented: {" / ".join(dictionary.segment(SENTENCE))}')
+        print(f'stats: {dictionary.stats()}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Micro-benchmark: JSON extraction from model replies.
+
+Compares app.utils.json_extract.extract_json against the regex-based
+clean_json_response + parse_json_safely it replaced, over a JSONL corpus
+of replies ({"text": ...} per line). The bundled corpus holds samples in
+the shapes Gemini returns; run the app with AI_RECORD_RESPONSES=path to
+record real replies and pass that file with --corpus.
+
+    python -m benchmarks.json_extract_bench [--corpus FILE] [--number N]
+"""
+import argparse
+import json
+import re
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.utils.json_extract import extract_json, parse_partial_json  # noqa: E402
+
+DEFAULT_CORPUS = Path(__file__).with_name('ai_responses.jsonl')
+
+
+def legacy_clean_json_response(text):
+    cleaned = re.sub(r'```json\n?', '', text)
+    cleaned = re.sub(r'```\n?', '', cleaned)
+    cleaned = cleaned.strip()
+    json_match = re.search(r'\{[^{}]*\{.*\}[^{}]*\}|\{.*\}', cleaned, re.DOTALL)
+    if json_match:
+        cleaned = json_match.group()
+    lines = cleaned.split('\n')
+    json_lines = []
+    in_json = False
+    for line in lines:
+        line = line.strip()
+        if line.startswith('{') or in_json:
+            in_json = True
+            json_lines.append(line)
+        if line.endswith('}'):
+            break
+    if json_lines:
+        cleaned = '\n'.join(json_lines)
+    return cleaned
+
+
+def legacy_parse_json_safely(text, max_attempts=3):
+    for attempt in range(max_attempts):
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError as e:
+            if attempt < max_attempts - 1:
+                text = re.sub(r',\s*}', '}', text)
+                text = re.sub(r',\s*]', ']', text)
+                text = re.sub(r'(\w+):', r'"\1":', text)
+            else:
+                raise e
+    return None
+
+
+def legacy(text):
+    return legacy_parse_json_safely(legacy_clean_json_response(text))
+
+
+def current(text):
+    return extract_json(text)
+
+
+def _outcome(fn, text):
+    try:
+        return fn(text)
+    except (ValueError, TypeError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--corpus', type=Path, default=DEFAULT_CORPUS)
+    parser.add_argument('--number', type=int, default=2000, help='calls per reply')
+    args = parser.parse_args()
+
+    corpus = [json.loads(line) for line in args.corpus.read_text(encoding='utf-8').splitlines() if line.strip()]
+    print(f'{len(corpus)} replies from {args.corpus}, {args.number} calls each\n')
+    print(f'{"reply":<18} {"bytes":>6} {"legacy us":>10} {"new us":>8} {"speedup":>8}  legacy / new result')
+
+    totals = {'legacy': 0.0, 'new': 0.0}
+    for index, entry in enumerate(corpus):
+        text = entry['text']
+        timings = {}
+        for label, fn in (('legacy', legacy), ('new', current)):
+            seconds = timeit.timeit(lambda: _outcome(fn, text), number=args.number)
+            timings[label] = seconds / args.number * 1e6
+            totals[label] += timings[label]
+
+        old, new = _outcome(legacy, text), _outcome(current, text)
+        if new is None:
+            partial, _ = parse_partial_json(text)
+            new_label = 'partial' if partial else 'none'
+        else:
+            new_label = type(new).__name__
+        old_label = type(old).__name__ if old is not None else 'none'
+        if old is not None and new is not None and old != new:
+            old_label += '(differs)'
+        name = entry.get('name', f'#{index}')
+        print(f'{name:<18} {len(text.encode("utf-8")):>6} {timings["legacy"]:>10.1f} {timings["new"]:>8.1f} '
+              f'{timings["legacy"] / timings["new"]:>7.1f}x  {old_label} / {new_label}')
+
+    print(f'\n{"total":<25} {totals["legacy"]:>10.1f} {totals["new"]:>8.1f} '
+          f'{totals["legacy"] / totals["new"]:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -54,7 +54,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // Initialize study session if on study page
     if (window.studyCards) {
-        studySession.initialize(window.studyCards);
+        studySession.initialize(window.studyCards, window.studyQueue || []);
     }
 
     // Load decks if on dashboard
@@ -107,7 +107,7 @@ window.addCard = async (event, deckId) => {
         pinyin: document.getElementById('cardPinyin').value,
         english: document.getElementById('cardEnglish').value,
         part_of_speech: document.getElementById('cardPartOfSpeech').value,
-        base64_audio: document.getElementById('audioBase64').value,
+        audio_hash: document.getElementById('audioHash').value,
         example_sentence: document.getElementById('cardExample').value,
         notes: document.getElementById('cardNotes').value
     };
@@ -147,6 +147,11 @@ window.enhanceAllFields = () => {
     aiIntegration.enhanceAllFields(button);
 };
 
+window.enhanceDeck = (deckId) => {
+    const button = event.target.closest('button');
+    aiIntegration.enhanceDeck(deckId, button);
+};
+
 // ElevenLabs voice generation - ADD THIS FUNCTION
 window.generateVoice = () => {
     elevenLabs.generateAudio();
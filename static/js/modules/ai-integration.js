@@ -21,13 +21,12 @@ export class AIIntegration {
         this.setButtonLoading(button, true);
 
         try {
-            const result = await api.post('/enhance_flashcard', {
+            const result = await this.streamEnhancement({
                 english: english,
                 [field]: ""
-            });
+            }, (event) => this.applySuggestion(event.field, event.value));
 
             if (result.status === 'success' && result.suggestions) {
-                this.applySuggestion(field, result.suggestions[field]);
                 notifications.success('AI suggestion applied');
             } else if (result.status === 'no_suggestions') {
                 notifications.info('No AI suggestion available');
@@ -120,7 +119,10 @@ export class AIIntegration {
         };
 
         try {
-            const result = await api.post('/enhance_flashcard', context);
+            // Each field is filled in as soon as it arrives
+            const result = await this.streamEnhancement(context, (event) => {
+                this.applySuggestion(event.field, event.value);
+            });
 
             if (result.status === 'success' && result.suggestions) {
                 this.applyAllSuggestions(result.suggestions);
@@ -140,6 +142,88 @@ export class AIIntegration {
         }
     }
 
+    async streamEnhancement(data, onField) {
+        // Server-sent events: a `field` event per finished suggestion, then the `result`
+        const response = await fetch('/enhance_flashcard/stream', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(data)
+        });
+        if (!response.ok || !response.body) {
+            const error = await response.json().catch(() => ({}));
+            throw new Error(error.message || `HTTP error! status: ${response.status}`);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let result = null;
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const block = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                let event = 'message';
+                let payload = '';
+                block.split('\n').forEach(line => {
+                    if (line.startsWith('event: ')) event = line.slice(7);
+                    else if (line.startsWith('data: ')) payload += line.slice(6);
+                });
+                if (!payload) continue;
+                if (event === 'field') {
+                    onField(JSON.parse(payload));
+                } else if (event === 'result') {
+                    result = JSON.parse(payload);
+                }
+            }
+        }
+
+        if (!result) {
+            throw new Error('AI response ended early');
+        }
+        return result;
+    }
+
+    async runJob(endpoint, data, interval = 500, onProgress = null) {
+        // AI calls run as server-side jobs so they don't hold a request worker
+        const { status_url } = await api.post(endpoint, data);
+        let job;
+        do {
+            await new Promise(resolve => setTimeout(resolve, interval));
+            job = await api.get(status_url);
+            if (onProgress) onProgress(job);
+        } while (job.status === 'queued' || job.status === 'running');
+
+        if (job.status === 'failed') {
+            throw new Error(job.error || 'AI request failed');
+        }
+        return job.result;
+    }
+
+    async enhanceDeck(deckId, button) {
+        const label = button.querySelector('.terminal-text');
+        const originalText = label?.textContent;
+        button.disabled = true;
+
+        try {
+            // One job fills the whole deck in batched prompts
+            const result = await this.runJob(`/api/decks/${deckId}/enhance`, {}, 1500, (job) => {
+                if (label) label.textContent = `enhancing ${job.progress}/${job.total}`;
+            });
+            notifications.success(`AI filled ${result.enhanced} of ${result.cards} cards`);
+            setTimeout(() => window.location.reload(), 1000);
+        } catch (error) {
+            notifications.error(error.message);
+        } finally {
+            button.disabled = false;
+            if (label && originalText) label.textContent = originalText;
+        }
+    }
+
     applyAllSuggestions(suggestions) {
         Object.entries(suggestions).forEach(([field, value]) => {
             if (value) {
@@ -31,6 +31,10 @@ export class CardManager {
             
             if (result.success) {
                 notifications.success('Card added successfully!');
+                if (result.duplicates && result.duplicates.length) {
+                    const decks = [...new Set(result.duplicates.map(card => card.deck_name))];
+                    notifications.warning(`"${formData.hanzi}" is also in: ${decks.join(', ')}`);
+                }
                 return result.card_id;
             } else {
                 throw new Error(result.error || 'Failed to add card');
@@ -1,5 +1,6 @@
 import { api } from '../utils/api.js';
 import { notifications } from '../utils/notifications.js';
+import { aiIntegration } from './ai-integration.js';
 
 export class ElevenLabs {
     constructor() {
@@ -25,22 +26,12 @@ export class ElevenLabs {
         this.setButtonLoading(originalButton, true);
 
         try {
-            const result = await api.post('/generate_voice', {
-                text: english
-            });
-
-            if (result.status === 'success' && result.audio_base64) {
-                this.createAudioPlayer(result.audio_base64);
-                this.playAudio(result.audio_base64);
-                notifications.success('Audio generated and playing');
-                document.getElementById('audioBase64').value = result.audio_base64;
-                const voiceSection = document.getElementById("voice_section");
-                if (voiceSection) {
-                    voiceSection.style.display = 'none';
-                }
-
-            } else {
-                throw new Error(result.message || 'Error generating audio');
+            const audio = await this.loadVoice(english);
+            this.createAudioPlayer(audio);
+            notifications.success('Audio generated and playing');
+            const voiceSection = document.getElementById("voice_section");
+            if (voiceSection) {
+                voiceSection.style.display = 'none';
             }
         } catch (error) {
             notifications.error(error.message);
@@ -49,7 +40,85 @@ export class ElevenLabs {
         }
     }
 
-    createAudioPlayer(base64) {
+    async loadVoice(english) {
+        // Streaming only pays off when playback can start on the first chunk;
+        // otherwise run it as a job so no server thread waits on ElevenLabs
+        return this.canStream() ? this.streamVoice(english) : this.voiceJob(english);
+    }
+
+    canStream() {
+        return Boolean(window.MediaSource && MediaSource.isTypeSupported('audio/mpeg') && window.ReadableStream);
+    }
+
+    async voiceJob(english) {
+        const { audio_hash } = await aiIntegration.runJob('/api/jobs/generate_voice', this.voiceRequest(english));
+        document.getElementById('audioHash').value = audio_hash;
+        if (this.currentAudio) {
+            this.currentAudio.pause();
+        }
+        this.currentAudio = new Audio(`/audio/${audio_hash}`);
+        this.currentAudio.play().catch(() => {});
+        return this.currentAudio;
+    }
+
+    async streamVoice(english) {
+        // Playback starts on the first chunk instead of after the whole MP3
+        const params = new URLSearchParams(this.voiceRequest(english));
+        const response = await fetch(`/generate_voice/stream?${params}`);
+        if (!response.ok) {
+            const data = await response.json().catch(() => ({}));
+            throw new Error(data.message || 'Error generating audio');
+        }
+        const hanzi = decodeURIComponent(response.headers.get('X-Voice-Hanzi') || '');
+        const audio = await this.playStream(response);
+
+        // The stream filled the TTS cache, so this is a lookup, not a second synthesis
+        const result = await api.post('/generate_voice', hanzi ? { text: english, hanzi } : this.voiceRequest(english));
+        if (result.status !== 'success' || !result.audio_hash) {
+            throw new Error(result.message || 'Error saving audio');
+        }
+        document.getElementById('audioHash').value = result.audio_hash;
+        return audio;
+    }
+
+    async playStream(response) {
+        if (this.currentAudio) {
+            this.currentAudio.pause();
+        }
+
+        if (!window.MediaSource || !MediaSource.isTypeSupported('audio/mpeg') || !response.body) {
+            const blob = await response.blob();
+            this.currentAudio = new Audio(URL.createObjectURL(blob));
+            this.currentAudio.play();
+            return this.currentAudio;
+        }
+
+        const mediaSource = new MediaSource();
+        this.currentAudio = new Audio(URL.createObjectURL(mediaSource));
+        await new Promise(resolve => mediaSource.addEventListener('sourceopen', resolve, { once: true }));
+        const sourceBuffer = mediaSource.addSourceBuffer('audio/mpeg');
+        const updated = () => new Promise(resolve => sourceBuffer.addEventListener('updateend', resolve, { once: true }));
+        this.currentAudio.play().catch(() => {});
+
+        const reader = response.body.getReader();
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            if (sourceBuffer.updating) await updated();
+            sourceBuffer.appendBuffer(value);
+        }
+        if (sourceBuffer.updating) await updated();
+        mediaSource.endOfStream();
+        return this.currentAudio;
+    }
+
+    voiceRequest(english) {
+        // Sending the hanzi lets the server skip the translation round trip
+        const hanzi = document.getElementById('cardHanzi')?.value?.trim();
+        return hanzi ? { text: english, hanzi } : { text: english };
+    }
+
+    createAudioPlayer(audio) {
         // Remove existing player if it exists
         if (this.audioPlayer) {
             this.audioPlayer.remove();
@@ -88,7 +157,7 @@ export class ElevenLabs {
         voiceSection.parentNode.insertBefore(this.audioPlayer, voiceSection.nextSibling);
 
         // Setup event listeners
-        this.setupAudioPlayerEvents(base64);
+        this.setupAudioPlayerEvents(audio);
     }
 
     addAudioPlayerStyles() {
@@ -222,13 +291,13 @@ export class ElevenLabs {
         document.head.appendChild(styleSheet);
     }
 
-    setupAudioPlayerEvents(base64) {
+    setupAudioPlayerEvents(audio) {
         const playPauseBtn = this.audioPlayer.querySelector('.play-pause-btn');
         const progressBar = this.audioPlayer.querySelector('.progress');
         const timeDisplay = this.audioPlayer.querySelector('.time-display');
         const regenerateBtn = this.audioPlayer.querySelector('.regenerate-btn');
 
-        this.currentAudio = new Audio(`data:audio/wav;base64,${base64}`);
+        this.currentAudio = audio;
         let isPlaying = false;
         let progressInterval;
 
@@ -262,6 +331,13 @@ export class ElevenLabs {
             isPlaying = !isPlaying;
         });
 
+        // Streamed audio is already playing when the player is created
+        if (!this.currentAudio.paused) {
+            isPlaying = true;
+            playPauseBtn.classList.add('playing');
+            progressInterval = setInterval(updateProgress, 100);
+        }
+
         // Audio ended event
         this.currentAudio.addEventListener('ended', () => {
             isPlaying = false;
@@ -283,27 +359,15 @@ export class ElevenLabs {
             regenerateBtn.disabled = true;
 
             try {
-                const result = await api.post('/generate_voice', {
-                    text: english
-                });
-
-                if (result.status === 'success' && result.audio_base64) {
-                    // Stop current audio
-                    this.currentAudio.pause();
-                    isPlaying = false;
-                    playPauseBtn.classList.remove('playing');
-                    clearInterval(progressInterval);
-                    document.getElementById('audioBase64').value = result.audio_base64;
-
-                    // Update audio source
-                    this.currentAudio.src = `data:audio/wav;base64,${result.audio_base64}`;
-                    progressBar.style.width = '0%';
-                    timeDisplay.textContent = '0:00';
-                    
-                    notifications.success('Audio regenerated successfully');
-                } else {
-                    throw new Error(result.message || 'Error regenerating audio');
-                }
+                // Stop current audio
+                this.currentAudio.pause();
+                clearInterval(progressInterval);
+                progressBar.style.width = '0%';
+                timeDisplay.textContent = '0:00';
+
+                const audio = await this.loadVoice(english);
+                this.createAudioPlayer(audio);
+                notifications.success('Audio regenerated successfully');
             } catch (error) {
                 notifications.error(error.message);
             } finally {
@@ -313,14 +377,6 @@ export class ElevenLabs {
         });
     }
 
-    playAudio(base64) {
-        if (this.currentAudio) {
-            this.currentAudio.pause();
-        }
-        this.currentAudio = new Audio(`data:audio/wav;base64,${base64}`);
-        this.currentAudio.play();
-    }
-
     setButtonLoading(button, isLoading) {
         if (isLoading) {
             button.disabled = true;
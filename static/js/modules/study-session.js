@@ -1,13 +1,98 @@
 import { api } from '../utils/api.js';
 import { notifications } from '../utils/notifications.js';
 
+// Ratings are buffered and sent to the server in batches
+const FLUSH_INTERVAL_MS = 10000;
+const FLUSH_BATCH_SIZE = 10;
+const MAX_BATCH_SIZE = 500;
+const MAX_RETRY_DELAY_MS = 60000;
+// Accepts reviews of any deck, so buffered reviews can sync from any session
+const REVIEWS_URL = '/study/reviews';
+
+// Cards are loaded by id, a page at a time, ahead of the user
+const PAGE_SIZE = 20;
+const PREFETCH_AHEAD = 5;
+// Upcoming cards whose audio is downloaded in the background
+const AUDIO_PREFETCH_AHEAD = 3;
+
+function generateReviewId() {
+    if (window.crypto && typeof window.crypto.randomUUID === 'function') {
+        return window.crypto.randomUUID();
+    }
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
+}
+
+/**
+ * Reviews not yet confirmed by the server, kept in localStorage so they
+ * survive reloads, closed tabs and offline periods. Other tabs share the
+ * buffer; review ids make resubmission harmless.
+ */
+class ReviewBuffer {
+    constructor(key = 'studyReviewBuffer') {
+        this.key = key;
+    }
+
+    read() {
+        try {
+            return JSON.parse(localStorage.getItem(this.key)) || {};
+        } catch (error) {
+            return {};
+        }
+    }
+
+    write(reviews) {
+        try {
+            if (Object.keys(reviews).length > 0) {
+                localStorage.setItem(this.key, JSON.stringify(reviews));
+            } else {
+                localStorage.removeItem(this.key);
+            }
+        } catch (error) {
+            // Storage full or disabled: reviews still live in memory
+        }
+    }
+
+    add(review) {
+        const reviews = this.read();
+        reviews[review.review_id] = review;
+        this.write(reviews);
+    }
+
+    remove(reviewIds) {
+        const reviews = this.read();
+        reviewIds.forEach((reviewId) => delete reviews[reviewId]);
+        this.write(reviews);
+    }
+
+    all() {
+        return Object.values(this.read()).sort((a, b) => a.reviewed_at.localeCompare(b.reviewed_at));
+    }
+}
+
 export class StudySession {
     constructor() {
         this.currentCardIndex = 0;
         this.cards = [];
+        this.queue = [];
+        this.total = 0;
+        this.pageFetch = null;
+        this.audioUrls = new Map();
         this.studiedCards = 0;
         this.startTime = null;
+        this.cardShownAt = null;
+        this.buffer = new ReviewBuffer();
+        this.pendingReviews = this.buffer.all();
+        this.flushPromise = null;
+        this.flushTimer = null;
+        this.retryDelay = 1000;
         this.setupKeyboardShortcuts();
+        this.setupUnloadFlush();
+        this.setupOnlineFlush();
+
+        // Reviews left over from an earlier session that never reached the server
+        if (this.pendingReviews.length > 0) {
+            this.scheduleFlush(0);
+        }
     }
 
     setupKeyboardShortcuts() {
@@ -23,8 +108,31 @@ export class StudySession {
         });
     }
 
-    initialize(cards) {
+    setupUnloadFlush() {
+        // pagehide/visibilitychange are the last reliable points to send data
+        window.addEventListener('pagehide', () => this.flushOnUnload());
+        document.addEventListener('visibilitychange', () => {
+            if (document.visibilityState === 'hidden') {
+                this.flushOnUnload();
+            }
+        });
+    }
+
+    setupOnlineFlush() {
+        window.addEventListener('online', () => {
+            this.retryDelay = 1000;
+            if (this.flushTimer) {
+                clearTimeout(this.flushTimer);
+                this.flushTimer = null;
+            }
+            this.flush();
+        });
+    }
+
+    initialize(cards, queue = []) {
         this.cards = cards;
+        this.queue = [...queue];
+        this.total = cards.length + queue.length;
         this.currentCardIndex = 0;
         this.studiedCards = 0;
         this.startTime = new Date();
@@ -32,6 +140,7 @@ export class StudySession {
         if (this.cards.length > 0) {
             this.loadCard(0);
             this.updateProgress();
+            this.prefetch();
         }
 
         this.updateFinishButton();
@@ -44,66 +153,217 @@ export class StudySession {
         }
     }
 
-    async rateCard(rating) {
+    prefetch() {
+        this.prefetchAudio();
+        if (this.pageFetch || this.queue.length === 0) return this.pageFetch;
+        if (this.cards.length - this.currentCardIndex > PREFETCH_AHEAD) return null;
+
+        const ids = this.queue.slice(0, PAGE_SIZE);
+        this.pageFetch = (async () => {
+            try {
+                const result = await api.get(`/api/study/cards?ids=${ids.join(',')}`);
+                if (!result.success) {
+                    throw new Error(result.error || 'Failed to load cards');
+                }
+                this.queue = this.queue.slice(ids.length);
+                // Cards archived since the session started are simply dropped
+                this.total -= ids.length - result.cards.length;
+                this.cards.push(...result.cards);
+                this.prefetchAudio();
+            } catch (error) {
+                notifications.error(`Could not load more cards: ${error.message}`);
+            } finally {
+                this.pageFetch = null;
+            }
+        })();
+        return this.pageFetch;
+    }
+
+    prefetchAudio() {
+        // Audio is content-addressed, so a blob fetched once stays valid
+        const upcoming = this.cards.slice(this.currentCardIndex, this.currentCardIndex + AUDIO_PREFETCH_AHEAD + 1);
+        upcoming.forEach((card) => {
+            const hash = card.audio_hash;
+            if (!hash || this.audioUrls.has(hash)) return;
+            this.audioUrls.set(hash, null);
+            fetch(`/audio/${hash}`, { priority: 'low' })
+                .then((response) => (response.ok ? response.blob() : Promise.reject(response.status)))
+                .then((blob) => this.audioUrls.set(hash, URL.createObjectURL(blob)))
+                .catch(() => this.audioUrls.delete(hash));
+        });
+
+        // Release audio of cards already behind us
+        const keep = new Set(upcoming.map((card) => card.audio_hash));
+        this.cards.slice(0, this.currentCardIndex).forEach((card) => {
+            const url = this.audioUrls.get(card.audio_hash);
+            if (url && !keep.has(card.audio_hash)) {
+                URL.revokeObjectURL(url);
+                this.audioUrls.delete(card.audio_hash);
+            }
+        });
+    }
+
+    playAudio() {
+        const card = this.cards[this.currentCardIndex];
+        if (!card || !card.audio_hash) return;
+        const audio = new Audio(this.audioUrls.get(card.audio_hash) || `/audio/${card.audio_hash}`);
+        audio.play();
+    }
+
+    async showNextCard() {
+        if (this.currentCardIndex >= this.cards.length && (this.pageFetch || this.queue.length > 0)) {
+            await this.prefetch();
+        }
+        this.updateProgress();
+        if (this.currentCardIndex < this.cards.length) {
+            this.loadCard(this.currentCardIndex);
+            this.prefetch();
+        } else {
+            this.showCompletion();
+        }
+    }
+
+    rateCard(rating) {
         if (this.currentCardIndex >= this.cards.length) return;
 
         const currentCard = this.cards[this.currentCardIndex];
-        
-        try {
-            const result = await api.post(`/card/${currentCard.id}/rate`, { rating });
-            
-            if (result.success) {
-                this.studiedCards++;
-                this.currentCardIndex++;
-                this.updateProgress();
-                
-                if (this.currentCardIndex < this.cards.length) {
-                    this.loadCard(this.currentCardIndex);
-                } else {
-                    this.showCompletion();
+        const now = Date.now();
+
+        // Applied optimistically: the next card shows before the server hears about it
+        const review = {
+            review_id: generateReviewId(),
+            card_id: currentCard.id,
+            rating,
+            reviewed_at: new Date(now).toISOString(),
+            duration_ms: this.cardShownAt ? now - this.cardShownAt : 0
+        };
+        this.pendingReviews.push(review);
+        this.buffer.add(review);
+
+        this.studiedCards++;
+        this.currentCardIndex++;
+        this.showNextCard();
+
+        if (this.pendingReviews.length >= FLUSH_BATCH_SIZE) {
+            this.flush();
+        } else {
+            this.scheduleFlush(FLUSH_INTERVAL_MS);
+        }
+    }
+
+    scheduleFlush(delay) {
+        if (this.flushTimer) return;
+        this.flushTimer = setTimeout(() => {
+            this.flushTimer = null;
+            this.flush();
+        }, delay);
+    }
+
+    async flush() {
+        if (this.flushPromise || this.pendingReviews.length === 0) {
+            return this.flushPromise;
+        }
+        if (this.flushTimer) {
+            clearTimeout(this.flushTimer);
+            this.flushTimer = null;
+        }
+        if (navigator.onLine === false) {
+            // Kept in the buffer; the 'online' event flushes again
+            return null;
+        }
+
+        const batch = this.pendingReviews.slice(0, MAX_BATCH_SIZE);
+        this.flushPromise = (async () => {
+            try {
+                const result = await api.post(REVIEWS_URL, { reviews: batch });
+                if (!result.success) {
+                    throw new Error(result.error || 'Failed to save progress');
                 }
-                
-                notifications.success('Progress saved!');
-            } else {
-                throw new Error(result.error || 'Failed to rate card');
+                // Reviews keep their ids across retries, so the server applies each once
+                const sent = new Set(batch.map((review) => review.review_id));
+                this.pendingReviews = this.pendingReviews.filter((review) => !sent.has(review.review_id));
+                this.buffer.remove(sent);
+                this.retryDelay = 1000;
+                if (this.pendingReviews.length > 0) {
+                    this.scheduleFlush(0);
+                }
+            } catch (error) {
+                notifications.error(`Progress not saved yet, retrying: ${error.message}`);
+                this.scheduleFlush(this.retryDelay);
+                this.retryDelay = Math.min(this.retryDelay * 2, MAX_RETRY_DELAY_MS);
+            } finally {
+                this.flushPromise = null;
             }
-        } catch (error) {
-            notifications.error(error.message);
+        })();
+        return this.flushPromise;
+    }
+
+    flushOnUnload() {
+        if (this.pendingReviews.length === 0 || !navigator.sendBeacon) {
+            return;
+        }
+        // Includes any in-flight batch; the server skips already-applied review ids.
+        // The buffer keeps them until a later session sees them confirmed.
+        const payload = new Blob(
+            [JSON.stringify({ reviews: this.pendingReviews.slice(0, MAX_BATCH_SIZE) })],
+            { type: 'application/json' }
+        );
+        navigator.sendBeacon(REVIEWS_URL, payload);
+    }
+
+    setField(id, value, containerId = id) {
+        const element = document.getElementById(id);
+        const container = document.getElementById(containerId);
+        if (element) {
+            element.textContent = value || '';
+        }
+        if (container) {
+            container.style.display = value ? '' : 'none';
         }
     }
 
     loadCard(index) {
         if (index >= this.cards.length) return;
-        
+
         const card = this.cards[index];
         const studyCard = document.getElementById('studyCard');
-        
+
         if (!studyCard) return;
-        
+
         studyCard.classList.remove('flipped');
-        
+        this.cardShownAt = Date.now();
+
         // Update front side
         document.getElementById('cardFrontHanzi').textContent = card.hanzi;
-        const pinyinElement = document.getElementById('cardFrontPinyin');
-        if (pinyinElement) {
-            pinyinElement.textContent = card.pinyin || '';
+        this.setField('cardFrontPinyin', card.pinyin);
+        this.setField('cardFrontDeck', card.deck_name);
+
+        // Update back side
+        this.setField('cardBackHanzi', card.hanzi);
+        this.setField('cardBackPinyin', card.pinyin);
+        this.setField('cardBackEnglish', card.english);
+        this.setField('cardBackExampleText', card.example_sentence, 'cardBackExample');
+        this.setField('cardBackNotesText', card.notes, 'cardBackNotes');
+        const audioButton = document.getElementById('cardBackAudio');
+        if (audioButton) {
+            audioButton.style.display = card.audio_hash ? '' : 'none';
         }
     }
 
     updateProgress() {
-        const progress = (this.studiedCards / this.cards.length) * 100;
+        const progress = this.total > 0 ? (this.studiedCards / this.total) * 100 : 0;
         const progressBar = document.getElementById('studyProgress');
         const progressText = document.getElementById('progressText');
         const remainingCount = document.getElementById('remainingCount');
-        
+
         if (progressBar) {
             progressBar.style.width = `${progress}%`;
         }
         if (progressText) {
-            progressText.textContent = `${this.studiedCards}/${this.cards.length}`;
+            progressText.textContent = `${this.studiedCards}/${this.total}`;
         }
         if (remainingCount) {
-            remainingCount.textContent = this.cards.length - this.studiedCards;
+            remainingCount.textContent = this.total - this.studiedCards;
         }
     }
 
@@ -116,16 +376,18 @@ export class StudySession {
     }
 
     showCompletion() {
+        this.flush();
+
         const endTime = new Date();
         const duration = Math.round((endTime - this.startTime) / 60000);
-        
+
         const studyView = document.getElementById('studyView');
         const completionScreen = document.getElementById('completionScreen');
-        
+
         if (studyView && completionScreen) {
             studyView.style.display = 'none';
             completionScreen.style.display = 'block';
-            
+
             document.getElementById('completedCount').textContent = this.studiedCards;
             document.getElementById('sessionTime').textContent = duration || 1;
         }
@@ -144,4 +406,4 @@ export class StudySession {
 }
 
 // Global study session instance
-export const studySession = new StudySession();
\ No newline at end of file
+export const studySession = new StudySession();
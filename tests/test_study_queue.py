@@ -0,0 +1,44 @@
+import os
+
+import pytest
+
+from app import create_app
+from app.models.database import SCHEMA_VERSION, get_db_connection, init_db
+from app.services.study_queue import BUCKETS, explain_study_queue
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # init_db() reads config/init.schema relative to the working directory
+    monkeypatch.chdir(REPO_ROOT)
+    app = create_app()
+    app.config['DATABASE'] = str(tmp_path / 'flashcards.db')
+    app.config['TESTING'] = True
+    with app.app_context():
+        init_db()
+    return app
+
+
+def test_database_is_migrated(app):
+    with app.app_context():
+        conn = get_db_connection()
+        try:
+            assert conn.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION
+        finally:
+            conn.close()
+
+
+def test_study_queue_plan_uses_bucket_indexes(app):
+    with app.app_context():
+        conn = get_db_connection()
+        try:
+            report = explain_study_queue(conn)
+        finally:
+            conn.close()
+
+    assert set(report) == set(BUCKETS) | {'session'}
+    for name, (plan, problems) in report.items():
+        assert plan, name
+        assert problems == [], f'{name}: {problems}\n' + '\n'.join(plan)